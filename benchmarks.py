@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the benchmarks of com3001.benchmarks (python benchmarks.py --help, or python -m com3001 bench).
+"""
+
+import sys
+
+from com3001.benchmarks import *
+
+if __name__ == '__main__':
+    sys.exit(main())
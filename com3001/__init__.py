@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Population models: the ecolab agent simulation of rabbits, foxes and grass (com3001.ecolab),
+integrators for ODEs and the SIR model (com3001.sir), a disk cache for results
+(com3001.simcache), headless plotting and animation (com3001.render), the studies
+(com3001.studies) and benchmarks (com3001.benchmarks).
+
+Importing the package does no work: the submodules are only imported when one of their names is
+first used, e.g. com3001.Environment or com3001.Numerical_methods, and matplotlib only when a
+study runs. The studies can be run from the command line, see python -m com3001 --help.
+"""
+
+import importlib
+
+#the names available from the package itself, and the submodule each comes from
+_exports = {
+    'ecolab': ['Environment', 'Agent', 'Rabbit', 'Fox', 'AgentArrays', 'RandomTufts', 'LogisticGrowth',
+               'DiffusionGrowth', 'Recorder', 'Observer', 'Counts', 'Reduction', 'StopCondition',
+               'SpeciesExtinct', 'PopulationBounds', 'Stationary', 'Profiler', 'run_ecolab',
+               'run_ecolab_vectorized', 'run_ecolab_parallel', 'get_agent_counts', 'run_replicates',
+               'extinction_probability', 'save_checkpoint', 'load_checkpoint', 'fork', 'Checkpointer'],
+    'sir': ['Numerical_methods', 'Event', 'EXPLICIT_RK', 'f', 'sweep', 'Mobility', 'MetapopulationSIR',
+            'stochastic_SIR', 'outbreak_statistics'],
+    'simcache': ['Cache', 'fingerprint'],
+    'render': ['decimate', 'plot_lod', 'plot3d_lod', 'plot_many', 'animate_record', 'FrameWriter'],
+    'studies': ['ecolab_study', 'sir_study'],
+}
+_origin = {name: module for module, names in _exports.items() for name in names}
+_submodules = ['ecolab', 'sir', 'simcache', 'render', 'studies', 'benchmarks']
+
+__all__ = list(_origin)
+
+
+def __getattr__(name):
+    if name in _origin:
+        value = getattr(importlib.import_module('.' + _origin[name], __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value #later uses don't come back here
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_origin) | set(_submodules))
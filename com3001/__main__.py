@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Command line of the package:
+
+    python -m com3001 ecolab [--no-show] [--output DIR] [--no-cache] [--simulations N] ...
+    python -m com3001 sir [--no-show] [--output DIR] [--no-cache] [--dt DT] ...
+    python -m com3001 animate RECORDING OUTPUT [--fps FPS] [--every N] ...
+    python -m com3001 bench [arguments of benchmarks.py]
+
+Once the package is installed (pip install .), the same commands are also available as com3001
+ecolab, com3001 sir... from any directory.
+"""
+
+import argparse
+import os
+import sys
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(prog='python -m com3001',description='Runs the studies and benchmarks of com3001.')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    def study(name,help):
+        command = commands.add_parser(name,help=help)
+        command.add_argument('--no-show',dest='show',action='store_false',help="don't show the figures (runs without a display)")
+        command.add_argument('--output',metavar='DIR',help='save the figures as PNG files in this directory')
+        command.add_argument('--no-cache',dest='cache',action='store_false',help='recompute everything, without reading or writing the result cache')
+        return command
+
+    ecolab = study('ecolab','the rabbit speed study of the agent simulation')
+    ecolab.add_argument('--simulations',type=int,default=30,help='runs per rabbit speed for the extinction probability')
+    ecolab.add_argument('--iterations',type=int,default=1000,help='iterations of each run')
+    ecolab.add_argument('--processes',type=int,help='worker processes (default = one per CPU)')
+    ecolab.add_argument('--animation',metavar='FILE',help='also render the baseline run to this video, GIF or PNG pattern (e.g. frames/%%05d.png)')
+
+    sir = study('sir','the three SIR scenarios, deterministic and stochastic')
+    sir.add_argument('--dt',type=float,default=0.2,help='step of RungeKutta2')
+    sir.add_argument('--steps',type=int,default=1000,help='number of steps of RungeKutta2')
+    sir.add_argument('--replicates',type=int,default=1000,help='number of stochastic runs')
+
+    animate = commands.add_parser('animate',help='render a recording of run_ecolab to a video, GIF or numbered PNG files')
+    animate.add_argument('recording',help='a Recorder streamed to a directory, or saved to a .npz file')
+    animate.add_argument('output',help="e.g. run.mp4, run.gif (these need ffmpeg) or frames/%%05d.png")
+    animate.add_argument('--fps',type=int,default=20,help='frames per second')
+    animate.add_argument('--every',type=int,default=1,help='render every n-th record')
+    animate.add_argument('--start',type=int,default=0,help='first record')
+    animate.add_argument('--stop',type=int,help='last record (excluded)')
+    animate.add_argument('--size',type=float,default=6,help='size of the frames in inches (at 100 dpi)')
+
+    commands.add_parser('bench',help='the benchmarks (python -m com3001 bench --help for their arguments)',add_help=False)
+
+    if argv[:1]==['bench']: #everything else goes to the benchmarks' own parser
+        from .benchmarks import main as bench
+        return bench(argv[1:])
+
+    args = parser.parse_args(argv)
+    if args.command=='animate':
+        from .ecolab import Recorder
+        from .render import animate_record
+        record = Recorder.open(args.recording) if os.path.isdir(args.recording) else Recorder.load(args.recording)
+        n = animate_record(record,args.output,args.fps,args.every,args.start,args.stop,args.size)
+        print('%d frames written to %s' % (n,args.output))
+        return 0
+
+    from . import studies
+    if args.command=='ecolab':
+        studies.ecolab_study(args.show,args.output,args.cache,args.simulations,args.iterations,args.processes,args.animation)
+    else:
+        studies.sir_study(args.show,args.output,args.cache,args.dt,args.steps,args.replicates)
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the integrators of com3001.sir and the agent simulation of com3001.ecolab.
+
+Each case reports a rate (integration steps or simulation ticks per second, best of a few
+repeats) and the peak memory allocated while it runs (measured with tracemalloc, in a separate
+run so that tracing doesn't slow down the timing). The results are written as JSON and can be
+compared with a stored baseline, e.g.
+
+    python benchmarks.py --quick --output baseline.json
+    ... change something ...
+    python benchmarks.py --quick --baseline baseline.json
+
+which lists the cases that got slower (or use more memory) than the baseline by more than
+--tolerance and exits with status 1 if there are any. (python -m com3001 bench takes the same
+arguments.)
+
+With --work-precision the fixed-step methods are compared instead: each is run with a range of
+step sizes, and its cost (evaluations of the right hand side and seconds) is listed against the
+error at the end time. --error-budget then picks the cheapest method and dt within the budget, e.g.
+
+    python benchmarks.py --work-precision SIR --error-budget 1e-6
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import ecolab, sir
+
+
+def lotka_volterra(x,t,a=1.1,b=0.4,c=0.4,d=0.1,out=None):
+    """
+    Lotka-Volterra right hand side (x = prey, predators), written like sir.f: x can be a
+    single state (2,) or an ensemble (2, N_members), and out is filled in place if given.
+    """
+    z = np.zeros(np.shape(x)) if out is None else out
+    if np.ndim(x)==1:
+        z[0] = a*x[0]-b*x[0]*x[1]
+        z[1] = d*x[0]*x[1]-c*x[1]
+        return z
+    np.multiply(x[0],x[1],out=z[1])
+    np.multiply(z[1],-b,out=z[0])
+    z[0] += a*x[0]
+    z[1] *= d
+    z[1] -= c*x[1]
+    return z
+
+
+#the right hand sides benchmarked, with a typical initial state and the time to integrate to
+RHS = {'SIR':(sir.f,np.array([1,1.27e-6,0]),100),
+       'LV':(lotka_volterra,np.array([10.,5.]),50)}
+
+
+def best_time(run,repeat):
+    """
+    Returns the shortest time (seconds) of 'repeat' calls of run(), each after a fresh run.setup()
+    """
+    times = []
+    for r in range(repeat):
+        run.setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+def peak_memory(run):
+    """
+    Returns the peak memory (bytes) allocated by run.setup() and run() together
+    """
+    tracemalloc.start()
+    try:
+        run.setup()
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def integrate(nm,method,dt,N_iter,decimate=1):
+    """
+    Runs N_iter fixed steps of dt with a Numerical_methods method, given by the name of the
+    method (e.g. 'RungeKutta2') or of one of sir.EXPLICIT_RK (e.g. 'RK4'), keeping every
+    decimate-th step of the trajectory
+    """
+    if method in sir.EXPLICIT_RK:
+        return nm.ExplicitRK(dt,N_iter,tableau=method,decimate=decimate)
+    return getattr(nm,method)(dt,N_iter,decimate=decimate)
+
+
+class IntegratorCase:
+    """
+    Integrates an ensemble of N_members copies of one of RHS (initial states spread by +-10%)
+    with a Numerical_methods method ('RungeKutta2', 'RK4'... for N_iter fixed steps of dt, or
+    'DormandPrince' to the end time of the RHS). The rate is in steps per second, where a
+    DormandPrince step is counted as 6 evaluations of the right hand side. Only the initial and
+    final states are kept (decimate, or t_eval at the end time), so that the rate and peak
+    memory measure the stepping rather than the allocation of the trajectory.
+    """
+    def __init__(self,rhs,method,N_members,N_iter=1000,dt=0.1):
+        self.rhs, self.method, self.N_members = rhs, method, N_members
+        self.N_iter, self.dt = N_iter, dt
+        self.name = 'integrator/%s/%s/members=%d' % (method,rhs,N_members)
+
+    def setup(self):
+        f, x, self.t_end = RHS[self.rhs]
+        if self.N_members>1:
+            x = x[:,None]*(1+0.1*np.random.default_rng(0).uniform(-1,1,self.N_members))
+        self.nm = sir.Numerical_methods(f)
+        self.nm.Initialise(x,0.)
+
+    def __call__(self):
+        if self.method=='DormandPrince':
+            self.nm.DormandPrince(self.t_end,t_eval=[self.t_end])
+        else:
+            integrate(self.nm,self.method,self.dt,self.N_iter,decimate=max(1,self.N_iter-1))
+
+    def steps(self):
+        return self.nm.nfev/6 if self.method=='DormandPrince' else self.N_iter
+
+
+class EcolabCase:
+    """
+    Runs 'ticks' iterations of ecolab (run_ecolab, run_ecolab_vectorized or run_ecolab_parallel
+    with 'workers' processes, without recording) on a size x size grid with N_agents agents
+    (3/4 rabbits and 1/4 foxes placed at random and grass growing at size*size/60 tiles per
+    iteration, as in the rabbit speed study). The rate is in ticks per second.
+    """
+    def __init__(self,engine,size,N_agents,ticks=10,workers=None):
+        self.engine, self.size, self.N_agents, self.ticks, self.workers = engine, size, N_agents, ticks, workers
+        self.name = 'ecolab/%s/grid=%d/agents=%d' % (engine,size,N_agents)
+        if workers is not None:
+            self.name += '/workers=%d' % workers
+
+    def setup(self):
+        rng = np.random.default_rng(0)
+        self.env = ecolab.Environment(shape=[self.size,self.size],growrate=self.size**2//60,maxgrass=5,startgrass=1,rng=rng)
+        Nrabbits = self.N_agents*3//4
+        self.agents = [ecolab.Rabbit(self.env.get_random_location(),speed=1,rng=rng) for i in range(Nrabbits)]
+        self.agents += [ecolab.Fox(self.env.get_random_location(),speed=3,rng=rng) for i in range(self.N_agents-Nrabbits)]
+        if self.engine!='run_ecolab':
+            self.agents = ecolab.AgentArrays.from_agents(self.agents)
+
+    def __call__(self):
+        with contextlib.redirect_stdout(io.StringIO()): #the progress messages
+            kwargs = {} if self.workers is None else {'workers':self.workers}
+            getattr(ecolab,self.engine)(self.env,self.agents,Niterations=self.ticks,earlystop=False,recorder=False,**kwargs)
+
+    def steps(self):
+        return self.ticks
+
+
+def cases(quick=False):
+    """
+    Returns the list of benchmark cases (a smaller, faster set if quick)
+    """
+    members = [1,100,10000] if quick else [1,100,10000,100000]
+    N_iter = 200 if quick else 1000
+    sizes = [60,500] if quick else [60,500,2000]
+    N_agents = [200,2000] if quick else [200,2000,20000,100000]
+    ticks = 5 if quick else 10
+
+    result = []
+    for rhs in RHS:
+        for method in ['RungeKutta2','RK4','DormandPrince']:
+            for n in members:
+                result.append(IntegratorCase(rhs,method,n,N_iter=N_iter))
+    for size in sizes:
+        for n in N_agents:
+            if n<=2000: #the object engine is far too slow beyond this
+                result.append(EcolabCase('run_ecolab',size,n,ticks=ticks))
+            result.append(EcolabCase('run_ecolab_vectorized',size,n,ticks=ticks))
+    #scaling of the parallel engine with the number of cores, on the largest case
+    cores = sorted({1,2,os.cpu_count() or 1})
+    for workers in cores:
+        result.append(EcolabCase('run_ecolab_parallel',sizes[-1],N_agents[-1],ticks=ticks,workers=workers))
+    return result
+
+
+def run(selected,repeat=3):
+    """
+    Runs the cases and returns a dictionary of their results, keyed by name
+    """
+    results = {}
+    for case in selected:
+        seconds = best_time(case,repeat)
+        rate = case.steps()/seconds
+        peak = peak_memory(case)
+        results[case.name] = {'rate':rate,'seconds':seconds,'peak_bytes':peak}
+        print('%-55s %12.1f /s %10.1f MB' % (case.name,rate,peak/1e6))
+        sys.stdout.flush()
+    return results
+
+
+#the methods compared by work_precision
+WORK_PRECISION_METHODS = ['Euler','RungeKutta2','RK3','RK4','RK38','RK5','DP5']
+
+
+def work_precision(rhs='SIR',methods=WORK_PRECISION_METHODS,steps=(25,50,100,200,400,800,1600,3200),repeat=3):
+    """
+    Integrates one of RHS from its initial state to its end time with each of the fixed-step
+    methods, with each number of steps, and returns a list of dictionaries with the 'method',
+    'dt', 'nfev' (evaluations of the right hand side), 'seconds' (best of repeat) and 'error'
+    (largest error at the end time relative to the largest component, against DormandPrince with
+    tight tolerances) of every run.
+    """
+    f, x, t_end = RHS[rhs]
+    reference = sir.Numerical_methods(f)
+    reference.Initialise(x,0.)
+    reference.DormandPrince(t_end,rtol=1e-13,atol=1e-15)
+    x_ref = reference.x
+
+    rows = []
+    for method in methods:
+        for n in steps:
+            dt = t_end/n
+            nm = sir.Numerical_methods(f)
+            run = lambda: integrate(nm,method,dt,n+1,decimate=n)
+            run.setup = lambda: nm.Initialise(x,0.)
+            with np.errstate(all='ignore'): #the largest steps can blow up
+                seconds = best_time(run,repeat)
+                error = float(np.max(np.abs(nm.x-x_ref))/np.max(np.abs(x_ref)))
+            rows.append({'method':method,'dt':dt,'nfev':nm.nfev,'seconds':seconds,
+                         'error':error if np.isfinite(error) else float('inf')})
+            print('%-12s dt=%-9.4g %8d evaluations %10.2e s   error %.2e' % (method,dt,nm.nfev,seconds,error))
+            sys.stdout.flush()
+    return rows
+
+
+def cheapest(rows,error_budget,cost='nfev'):
+    """
+    Returns the row of work_precision with the smallest cost ('nfev' or 'seconds') among
+    those whose error is within error_budget, or None if none is
+    """
+    within = [row for row in rows if row['error']<=error_budget]
+    return min(within,key=lambda row: row[cost]) if within else None
+
+
+def compare(results,baseline,tolerance=0.2):
+    """
+    Returns a list of messages about the cases that are slower than in baseline by more than
+    tolerance (a fraction), or use more memory by more than tolerance.
+    """
+    regressions = []
+    for name,result in results.items():
+        if name not in baseline: continue
+        old = baseline[name]
+        if result['rate']<old['rate']*(1-tolerance):
+            regressions.append('%s: %.1f /s, was %.1f /s (%+.0f%%)' % (name,result['rate'],old['rate'],100*(result['rate']/old['rate']-1)))
+        if result['peak_bytes']>old['peak_bytes']*(1+tolerance):
+            regressions.append('%s: peak %.1f MB, was %.1f MB' % (name,result['peak_bytes']/1e6,old['peak_bytes']/1e6))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--quick',action='store_true',help='smaller cases, for a quick check')
+    parser.add_argument('--filter',default='',help='only run the cases whose name contains this')
+    parser.add_argument('--repeat',type=int,default=3,help='the time of a case is the best of this many runs')
+    parser.add_argument('--output',help='write the results to this JSON file')
+    parser.add_argument('--baseline',help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance',type=float,default=0.2,help='relative slow down (or memory increase) counted as a regression')
+    parser.add_argument('--work-precision',metavar='RHS',choices=list(RHS),help='compare the cost and error of the fixed-step methods on this right hand side instead')
+    parser.add_argument('--error-budget',type=float,help='with --work-precision, the error to pick the cheapest method for')
+    args = parser.parse_args(argv)
+
+    if args.work_precision:
+        rows = work_precision(args.work_precision,repeat=args.repeat)
+        if args.error_budget is not None:
+            for cost in ['nfev','seconds']:
+                best = cheapest(rows,args.error_budget,cost)
+                if best is None:
+                    print('no method reaches an error of %g' % args.error_budget)
+                    break
+                print('cheapest in %s for an error of %g: %s with dt=%g (%d evaluations, %.2e s, error %.2e)'
+                      % (cost,args.error_budget,best['method'],best['dt'],best['nfev'],best['seconds'],best['error']))
+        if args.output:
+            with open(args.output,'w') as file:
+                json.dump({'work_precision':rows},file,indent=1)
+        return 0
+
+    selected = [case for case in cases(args.quick) if args.filter in case.name]
+    results = run(selected,args.repeat)
+
+    if args.output:
+        info = {'python':platform.python_version(),'numpy':np.__version__,'machine':platform.machine(),
+                'platform':platform.platform(),'time':time.strftime('%Y-%m-%dT%H:%M:%S'),'quick':args.quick}
+        with open(args.output,'w') as file:
+            json.dump({'info':info,'results':results},file,indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results,baseline,args.tolerance)
+        for message in regressions:
+            print('REGRESSION', message)
+        if regressions:
+            return 1
+        print('no regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
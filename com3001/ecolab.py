@@ -0,0 +1,2106 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Apr 10 09:47:10 2023
+
+@author: rsunn
+"""
+
+import numpy as np
+import concurrent.futures
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import pickle
+import statistics
+import time
+from multiprocessing import shared_memory
+
+#helper function
+def argmax_2darray(a):
+    """
+    Returns the maximum location in a n-d array
+    """
+    return np.unravel_index(a.argmax(), a.shape)
+
+@functools.lru_cache(maxsize=None)
+def disk(vision):
+    """
+    Returns the (vision*2+1) x (vision*2+1) boolean mask of the tiles within a circle of
+    'vision' tiles of the centre, and the (N,2) offsets of those tiles from the centre.
+    The result is cached, so don't modify it.
+    """
+    d = np.arange(-vision,vision+1)
+    mask = (d[:,None]**2 + d[None,:]**2)<=vision**2
+    return mask, np.argwhere(mask)-vision
+
+class GlobalRandom:
+    """
+    The global np.random state behind the (few) methods of np.random.Generator used here,
+    so that everything can take an 'rng' and still use the global state when it's None.
+    """
+    def integers(self,low,high=None,size=None):
+        return np.random.randint(low,high,size)
+    
+    def random(self,size=None):
+        return np.random.random_sample(size)
+    
+    def binomial(self,n,p,size=None):
+        return np.random.binomial(n,p,size)
+    
+    def multinomial(self,n,pvals,size=None):
+        return np.random.multinomial(n,pvals,size)
+    
+    def __fingerprint__(self):
+        #what a run drawing from it depends on (see simcache)
+        return np.random.get_state()
+    
+def get_rng(rng=None):
+    """
+    Returns rng (a np.random.Generator), or a GlobalRandom if it's None
+    """
+    return GlobalRandom() if rng is None else rng
+
+class RandomTufts:
+    """
+    The standard way grass grows: each iteration env.growrate tufts land on random tiles and
+    each adds 1 to its tile, unless the tile already has env.maxgrass. All the tufts are drawn
+    at once; tufts landing on the same tile are added together (up to maxgrass).
+    """
+    def __call__(self,env):
+        locs = env.rng.integers([0,0],env.shape,size=(env.growrate,2))
+        cells, tufts = np.unique(np.ravel_multi_index(locs.T,env.grass.shape),return_counts=True)
+        r, c = np.unravel_index(cells,env.grass.shape)
+        grass = env.grass[r,c]
+        env.grass[r,c] = np.where(grass<env.maxgrass,np.minimum(grass+tufts,env.maxgrass),grass)
+
+class LogisticGrowth:
+    """
+    Grass regrows where there is grass already: a tile with g grass gains on average
+    rate*g*(1-g/maxgrass) per iteration, plus seed*(maxgrass-g) so that bare tiles can recover.
+    (The gain is a binomial number of the missing units, so the grass stays a whole number.)
+    """
+    def __init__(self,rate=0.2,seed=0.001):
+        self.rate = rate
+        self.seed = seed
+        
+    def __call__(self,env):
+        room = np.maximum(env.maxgrass-env.grass,0).astype(int)
+        p = np.clip(self.rate*env.grass/env.maxgrass+self.seed,0,1)
+        env.grass += env.rng.binomial(room,p)
+
+class DiffusionGrowth:
+    """
+    Grass spreads from the neighbouring tiles: a tile gains on average
+    rate*(mean grass of its 4 neighbours)*(1-g/maxgrass) per iteration, plus seed*(maxgrass-g).
+    """
+    def __init__(self,rate=0.2,seed=0.001):
+        self.rate = rate
+        self.seed = seed
+        
+    def __call__(self,env):
+        b = env.boundary
+        h, w = env.grass.shape
+        padded = env.grasswithboundary
+        neighbours = (padded[b-1:b-1+h,b:b+w] + padded[b+1:b+1+h,b:b+w] +
+                      padded[b:b+h,b-1:b-1+w] + padded[b:b+h,b+1:b+1+w]) / 4
+        room = np.maximum(env.maxgrass-env.grass,0).astype(int)
+        p = np.clip(self.rate*neighbours/env.maxgrass+self.seed,0,1)
+        env.grass += env.rng.binomial(room,p)
+
+class Environment:
+    def __init__(self,shape=[40,40],startgrass=1,maxgrass=3,growrate=10,growth=None,rng=None):
+        """
+        Create the environment
+        Parameters:
+         - shape = shape of the environment
+         - startgrass = initial amount of grass
+         - maxgrass = maximum amount of grass allowed in each tile
+         - growrate = number of tiles which get extra grass each iteration
+         - growth = how grass grows, a function called as growth(env) once per iteration
+           (default RandomTufts(), see also LogisticGrowth and DiffusionGrowth)
+         - rng = the np.random.Generator used for everything random that happens in this
+           environment, agents included (default None = the global np.random)
+        """
+        self.maxgrass = maxgrass #maximum it can grow to
+        self.growrate = growrate #how many new items of food added per step
+        self.growth = RandomTufts() if growth is None else growth
+        self.rng = get_rng(rng)
+        self.shape = shape #shape of the environment
+        self.boundary = 10 #width of the zero border around the grass (the largest vision that can be searched)
+        self.grass = np.full(self.shape,startgrass) #2*np.trunc(np.random.rand(*self.shape)*2)+2 #initial grass
+        self.rabbit_index = None #RabbitGrid of the rabbits, kept up to date by run_ecolab
+        self.profiler = None #the Profiler of the run, if it's being profiled (set by run_ecolab)
+        
+        
+    @property
+    def grass(self):
+        """
+        The amount of grass on each tile. This is a view of the inside of a larger grid that has
+        a border of 'boundary' empty tiles all around (used by get_loc_of_grass), so changing the
+        grass in place (as reduce_food and grow do) also keeps the bordered grid up to date.
+        """
+        return self._grass
+    
+    @grass.setter
+    def grass(self,grass):
+        grass = np.asarray(grass)
+        b = self.boundary
+        self.grasswithboundary = np.zeros(np.array(grass.shape)+b*2,dtype=grass.dtype)
+        self._grass = self.grasswithboundary[b:-b,b:-b]
+        self._grass[...] = grass
+        
+    def __getstate__(self):
+        """
+        Copies and pickles keep the grass only; __setstate__ rebuilds the bordered grid around it,
+        so that the grass is a view of the bordered grid again (a plain copy would separate them)
+        """
+        state = self.__dict__.copy()
+        del state['grasswithboundary']
+        state['grass'] = state.pop('_grass')
+        return state
+    
+    def __setstate__(self,state):
+        state = dict(state)
+        grass = state.pop('grass')
+        self.__dict__.update(state)
+        self.grass = grass
+        
+    def get_food(self,position):
+        """
+        Returns the amount of food at position
+        """
+        return self.grass[int(position[0]),int(position[1])]
+    
+    def reduce_food(self,position,amount=1):
+        """
+        Reduce the amount of food at position by amount
+        (note, doesn't check this doesn't go negative)
+        """
+        self.grass[int(position[0]),int(position[1])]-=amount
+    
+    def get_loc_of_grass(self,position,vision):
+        """
+        This finds the location of the cell with the maximum amount of food near 'pos',
+        within a circle of 'vision' size.
+        For example env.get_dir_of_food(np.array([3,3]),2)
+        if two or more cells have the same food then it will select between them randomly.
+        """
+        
+        ## The search uses the grid grasswithboundary, which has the same shape as the environment + 
+        ## some 'borders' of lenght boundary that are all around the grid
+        ## In this way, we can avoid problems that would arise on the boundary of the environment.
+        ## The grid is kept by the environment (see grass), so it doesn't need to be rebuilt here.
+        
+        if self.profiler is not None: self.profiler.count('grass lookups')
+        if vision>self.boundary:
+            self.boundary = vision
+            self.grass = self.grass.copy() #rebuilds the bordered grid with a wider border
+        pos = position + self.boundary
+        
+        #we search just a circle within 'vision' tiles of 'pos' (a square, with the tiles outside the circle set to -1)
+        searchsquare = self.grasswithboundary[int(pos[0]-vision):int(pos[0]+vision+1),int(pos[1]-vision):int(pos[1]+vision+1)]
+        searchsquare = np.where(disk(vision)[0],searchsquare,-1)
+        
+        #the code below returns the location of that maximum food (picking at random between cells with the same food)
+        best = searchsquare.max()
+        if best<=0: return None #no food found
+        ties = np.flatnonzero(searchsquare==best)
+        choice = ties[self.rng.integers(len(ties))] if len(ties)>1 else ties[0]
+        return np.array(np.unravel_index(choice,searchsquare.shape))+position-vision
+    
+    def get_loc_of_grass_batch(self,positions,vision):
+        """
+        Same as get_loc_of_grass for many positions at once (a N x 2 array of whole tiles).
+        Returns a N x 2 array of locations and a boolean array telling whether any food was
+        found (where it's False the location is meaningless).
+        """
+        if self.profiler is not None: self.profiler.count('grass lookups',len(positions))
+        if vision>self.boundary:
+            self.boundary = vision
+            self.grass = self.grass.copy()
+        offsets = disk(vision)[1]
+        cells = positions.astype(int)[:,None,:] + offsets[None,:,:] + self.boundary
+        food = self.grasswithboundary[cells[:,:,0],cells[:,:,1]]
+        found = np.any(food>0,axis=1)
+        best = np.argmax(food+0.01*self.rng.random(food.shape),axis=1)
+        return positions.astype(int)+offsets[best], found
+        
+
+    def check_position(self,position):
+        """
+        Returns whether the position is within the environment
+        """
+        position[:] = np.round(position)
+        if position[0]<0: return False
+        if position[1]<0: return False
+        if position[0]>self.shape[0]-1: return False
+        if position[1]>self.shape[1]-1: return False
+        
+        #this adds a 'wall' across the environment...
+
+        return True
+            
+    def get_random_location(self):
+        """
+        Returns a random location in the environment.
+        """
+        return self.rng.integers([0,0],self.shape)
+        
+        #if we have a more complicated environment shape, use this instead to place new grass in valid location...
+        #p = np.array([-10,-10])
+        #while not self.check_position(p):
+        #    p = np.random.randint([0,0],self.shape)
+        #return p
+    
+    def grow(self):
+        """
+        Adds more grass, using self.growth (by default at random locations,
+        amount added controlled by self.growrate)
+        """
+        self.growth(self)
+                
+def calcdistsqr(v):
+    """Get euclidean distance^2 of v"""
+    return np.sum(v**2)
+
+def calcdist(v):
+    """Get euclidean distance of v"""
+    return np.sqrt(np.sum(v**2))
+
+
+class Agent:
+    """
+    Base class for all types of agent
+    """
+    def __init__(self,position,age,food,speed,lastbreed):
+        """
+        age = age of agent in iterations
+        food = how much food the agent has 'inside' (0=empty, 1=full)
+        position = x,y position of the agent
+        speed = how fast it can move (tiles/iteration)
+        lastbreed = how long ago it last reproduced (iterations)
+        """
+        self.food = food
+        self.age = age
+        self.position = position
+        self.speed = speed
+        self.lastbreed = lastbreed
+      
+    
+    def breed(self, reproduction_probability=None, rng=None):
+        if reproduction_probability is None:
+            reproduction_probability = 0.1
+            """
+            This will either return None, or a new agent object
+            """
+        new_agent = None
+        if (self.lastbreed > self.breedfreq) and (self.food > self.breedfood) and (get_rng(rng).random() < reproduction_probability):
+            self.lastbreed = -1
+            new_agent = type(self)(self.position, 0, self.food / 2, self.speed, 10)
+            self.food = self.food / 2
+        self.age += 1
+        self.lastbreed += 1
+        return new_agent
+       
+    def move(self,env):
+        pass #to implement by child class
+    
+    def trymove(self,newposition,env):
+        if env.check_position(newposition):
+            self.position = newposition
+        #ensures it's in the environment and rounds to nearest cell
+        #env.fix_position(self.position)
+
+    
+    def eat(self,env,agents):
+        pass #to implement by child class
+    
+    def summary_vector(self):
+        """
+        Returns a list of the location (x,y) and a 0=fox, 1=rabbit, e.g.
+        [3,4,1] means a rabbit at (3,4).
+        """
+        return [self.position[0],self.position[1],type(self)==Rabbit]
+    
+class Rabbit(Agent):
+    
+    #These are the same for all rabbits.
+    vision = 5 #how far it can see around current tile
+    breedfreq = 10 #how many iterations have to elapse between reproduction events
+    breedfood = 10 #how much food has to be eaten to allow reproduction
+    maxage = 40 #how long do they live
+    
+    def __init__(self,position,age=None,food=10,speed=1,lastbreed=0,rng=None):
+        """
+        A Rabbit agent. Arguments:
+        age = age of agent in iterations (default is a random value between 0 and maxage)
+        food = how much food the agent has 'inside' (0=empty, 1=full), default = 10
+        position = x,y position of the agent (required)
+        speed = how fast it can move (tiles/iteration) (default=1)
+        lastbreed = how long ago it last reproduced (iterations) (default=0)
+        rng = the np.random.Generator for the random age (default None = the global np.random)
+        """
+        if age is None: age = get_rng(rng).integers(self.maxage)
+        super().__init__(position,age,food,speed,lastbreed)
+        self.eaten = False
+        
+    def move(self,env):
+        """
+        rabbit movement:
+         - if current cell has no food...
+            - will move towards cells with more food
+         - DOESN'T move away from nearby foxes
+        """
+        if env.get_food(self.position)==0:
+            food_position = env.get_loc_of_grass(self.position,self.vision) #get the x,y location of nearby food (if any)
+            if food_position is not None:
+                relative_food_position = food_position - self.position
+                if calcdistsqr(relative_food_position)<self.speed**2: #if distance to the food < how far we can go, then
+                    self.trymove(food_position,env)
+
+                else:
+                    vect = relative_food_position / calcdist(relative_food_position)
+                    self.trymove(self.position + vect * self.speed,env)
+            else:
+                #no food in range, pick a random direction...
+                d = env.rng.random()*2*np.pi #pick a random direction
+                delta = np.round(np.array([np.cos(d),np.sin(d)])* self.speed)
+
+                self.trymove(self.position + delta,env)
+                        
+    def trymove(self,newposition,env):
+        oldposition = self.position
+        super().trymove(newposition,env)
+        if env.rabbit_index is not None and self.position is not oldposition:
+            env.rabbit_index.move(self,oldposition)
+                        
+    def eat(self,env,agents):
+        """
+         - will eat if there's food at location
+         - otherwise food goes down by 1.
+        """
+        if env.get_food(self.position)>0:
+            env.reduce_food(self.position)
+            self.food += 1
+        else:
+            self.food -= 1
+            
+    def breed(self, rng=None):
+        reproduction_probability = self.reproduction_probability_based_on_speed()
+        return super().breed(reproduction_probability, rng)
+
+    def reproduction_probability_based_on_speed(self):
+        base_probability = 0.05
+        speed_factor = 0.05
+        return base_probability + (self.speed * speed_factor)
+            
+#    def draw(self):
+#        plt.plot(self.position[0],self.position[1],'yx',mew=3)
+        
+    def die(self):
+        """
+        Returns true if it needs to expire, either due to:
+         - no food left
+         - old age
+         - being eaten
+        """
+        if self.food<=0: return True
+        if self.age>self.maxage: return True
+        if self.eaten: return True
+        return False
+        
+class Fox(Agent):
+
+    #These are the same for all foxes.
+    vision = 7 #how far it can see around current tile
+    breedfreq = 30 #how many iterations have to elapse between reproduction events
+    breedfood = 20 #how much food has to be eaten to allow reproduction
+    maxage = 80 #how long do they live
+    
+    def __init__(self,position,age=None,food=10,speed=5,lastbreed=0,rng=None):
+        """
+        A Fox agent. Arguments:
+        age = age of agent in iterations (default is random age between 0 and maxage)
+        food = how much food the agent has 'inside' (0=empty, 1=full) (default=10)
+        position = x,y position of the agent (required)
+        speed = how fast it can move (tiles/iteration) (default=5)
+        lastbreed = how long ago it last reproduced (iterations) (default=0)
+        rng = the np.random.Generator for the random age (default None = the global np.random)
+        """
+        if age is None: age = get_rng(rng).integers(self.maxage)
+        super().__init__(position,age,food,speed,lastbreed)    
+    
+    def get_nearby_rabbit(self,position,vision,agents,index=None):
+        """
+        helper function, given the list of agents, find the nearest rabbit, if within 'vision', else None.
+        If index (a RabbitGrid of the agents) is given, only the rabbits in the nearby cells are checked.
+        """
+        if index is not None: return index.nearest(position,vision)
+        
+        #distances to dead rabbits and foxes set to infinity.
+        sqrdistances = np.sum((np.array([a.position if (type(a)==Rabbit) and (not a.die()) else np.array([-np.inf,-np.inf]) for a in agents])-position)**2,1)
+        idx = np.argmin(sqrdistances)
+        if sqrdistances[idx]<vision**2:
+            return agents[idx]
+        else:
+            return None
+    
+    def eat(self, env, agents):
+        near_rabbit = self.get_nearby_rabbit(self.position, self.vision, agents, env.rabbit_index)  # get the x, y location of nearby rabbit (if any)
+        if near_rabbit is not None:
+            relative_food_position = near_rabbit.position - self.position
+            dist = calcdist(relative_food_position)
+            if dist < self.speed:  # if distance to the food < how far we can go, then
+                # probability that fox will kill rabbit is ratio of speed to distance
+                kill_prob = 1 - (dist / self.speed)
+            
+                # Calculate evasion factor based on rabbit's speed
+                evasion_factor = max(0.1, 0.1 + 0.01 * near_rabbit.speed)  # Linear function with a minimum value of 0.1
+
+                # Adjust kill probability based on rabbit's evasion factor
+                kill_prob *= (1 - evasion_factor)
+
+                if kill_prob > env.rng.random():
+                    self.trymove(near_rabbit.position, env)
+                    near_rabbit.eaten = True
+                    self.food += 2  # near_rabbit.food/2
+
+
+    def move(self,env):
+        """
+        Foxes just move randomly (but also move during call to self.eat eating to catch rabbit).
+        """
+        d = env.rng.random()*2*np.pi #pick a random direction
+        delta = np.round(np.array([np.cos(d),np.sin(d)])* self.speed)
+        self.trymove(self.position + delta,env)
+       
+    def die(self):
+        """
+        Returns true if it needs to expire, due to either:
+         - no food
+         - old age
+        """
+        
+        if self.food<=0: return True
+        if self.age>self.maxage: return True
+        return False
+    
+class RabbitGrid:
+    """
+    Uniform grid over the environment where each cell (of cellsize x cellsize tiles) holds the
+    rabbits inside it. Looking for the nearest rabbit then only needs the cells around a position
+    instead of every agent. Rabbit.trymove keeps it up to date (when it's env.rabbit_index)
+    and rabbits which are dead (see Rabbit.die) are skipped when searching.
+    """
+    def __init__(self,agents,cellsize):
+        self.cellsize = cellsize
+        self.cells = {}
+        self.order = {} #position of each rabbit in the list of agents, ties go to the first one
+        for a in agents: self.add(a)
+        
+    def cell(self,position):
+        return (int(position[0])//self.cellsize, int(position[1])//self.cellsize)
+    
+    def add(self,agent):
+        """
+        Adds agent to the grid (if it's a rabbit)
+        """
+        if type(agent)!=Rabbit: return
+        self.order[id(agent)] = len(self.order)
+        self.cells.setdefault(self.cell(agent.position),[]).append(agent)
+    
+    def move(self,rabbit,oldposition):
+        """
+        Updates the grid after rabbit moved from oldposition
+        """
+        old, new = self.cell(oldposition), self.cell(rabbit.position)
+        if old!=new:
+            self.cells[old].remove(rabbit)
+            self.cells.setdefault(new,[]).append(rabbit)
+    
+    def nearest(self,position,vision):
+        """
+        Returns the nearest live rabbit within 'vision' of position, or None
+        """
+        cx, cy = self.cell(position)
+        r = int(np.ceil(vision/self.cellsize))
+        best, bestdist, bestorder = None, vision**2, None
+        for i in range(cx-r,cx+r+1):
+            for j in range(cy-r,cy+r+1):
+                for a in self.cells.get((i,j),()):
+                    sqrdist = (a.position[0]-position[0])**2 + (a.position[1]-position[1])**2
+                    if sqrdist>bestdist or (sqrdist==bestdist and best is None): continue
+                    if sqrdist==bestdist and self.order[id(a)]>bestorder: continue
+                    if a.die(): continue
+                    best, bestdist, bestorder = a, sqrdist, self.order[id(a)]
+        return best
+
+
+class _Column:
+    """
+    A growable array of rows of a fixed dtype and shape, kept in memory (doubling a preallocated
+    buffer when it fills up) or, if a filename is given, appended to a raw binary file.
+    By default the buffer starts with up to 1024 rows but no more than 64 MB, so that columns
+    of large rows (whole grass grids) don't reserve gigabytes for a short run.
+    """
+    def __init__(self,dtype,shape=(),filename=None,capacity=None):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.filename = filename
+        self.n = 0
+        self.file = None
+        if filename is None:
+            if capacity is None:
+                rowbytes = self.dtype.itemsize*int(np.prod(self.shape))
+                capacity = max(1,min(1024,64*2**20//max(1,rowbytes)))
+            self.buffer = np.empty((capacity,)+self.shape,dtype=self.dtype)
+        else:
+            self.file = open(filename,'wb')
+            
+    def append(self,rows):
+        """
+        Appends rows, an array of shape (N,)+shape
+        """
+        rows = np.asarray(rows,dtype=self.dtype).reshape((-1,)+self.shape)
+        if self.filename is None:
+            if self.n+len(rows)>len(self.buffer):
+                buffer = np.empty((max(2*len(self.buffer),self.n+len(rows)),)+self.shape,dtype=self.dtype)
+                buffer[:self.n] = self.buffer[:self.n]
+                self.buffer = buffer
+            self.buffer[self.n:self.n+len(rows)] = rows
+        else:
+            rows.tofile(self.file)
+        self.n += len(rows)
+        
+    def data(self):
+        """
+        Returns the rows stored so far (a read-only memory map if the column is on disk)
+        """
+        if self.filename is None:
+            return self.buffer[:self.n]
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+        if self.n==0:
+            return np.empty((0,)+self.shape,dtype=self.dtype)
+        return np.memmap(self.filename,dtype=self.dtype,mode='r',shape=(self.n,)+self.shape)
+    
+    def promote(self,dtype):
+        """
+        Converts the rows stored so far, and the ones appended from now on, to dtype (on disk the
+        file is rewritten a block of rows at a time)
+        """
+        dtype = np.dtype(dtype)
+        if self.filename is None:
+            self.buffer = self.buffer.astype(dtype)
+        else:
+            self.file.close()
+            temporary = self.filename+'.tmp'
+            with open(temporary,'wb') as file:
+                if self.n:
+                    old = np.memmap(self.filename,dtype=self.dtype,mode='r',shape=(self.n,)+self.shape)
+                    step = max(1,2**24//max(1,old[:1].nbytes))
+                    for start in range(0,self.n,step):
+                        old[start:start+step].astype(dtype).tofile(file)
+                    del old
+            os.replace(temporary,self.filename)
+            self.file = open(self.filename,'ab')
+        self.dtype = dtype
+        
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class Recorder:
+    """
+    Records a simulation as it runs, for later plotting & analysis. Everything is stored in
+    columns with compact dtypes rather than as a list of per-iteration copies:
+     - ticks = the iteration each record was taken at
+     - counts = (Foxes, Rabbits, Grass) at each record, as returned by get_agent_counts
+     - the agents' x, y (float32) and species (int8, 0=fox, 1=rabbit), one after the other
+       for all the records, with 'offsets' saying where each record starts
+     - the grass, either every grid ('full'), only the tiles that changed since the previous
+       record plus a full grid every 'keyframe' records ('delta'), or not at all (None).
+    
+    Indexing a Recorder gives the same dictionary as the list run_ecolab used to return,
+    record[i] = {'grass':..., 'agents': N x 3 array of summary_vector}, a slice (record[::10])
+    gives a list of them, and len, iteration and get_agent_counts work as before.
+    
+    Arguments:
+    - interval = record every 'interval' iterations (the last iteration is always recorded)
+    - grass = 'full', 'delta' or None, how the grass grids are stored (see above)
+    - keyframe = with grass='delta', how many records between full grids
+    - path = if given, a directory to stream the columns to (as raw binary files, plus a
+      meta.json written by close()), so that the run doesn't have to fit in memory.
+      Recorder.open(path) reads it back (memory mapped).
+    """
+    def __init__(self,interval=1,grass='full',keyframe=100,path=None):
+        if grass not in ('full','delta',None):
+            raise ValueError("grass must be 'full', 'delta' or None, not %r" % (grass,))
+        self.interval = interval
+        self.grass_mode = grass
+        self.keyframe = keyframe
+        self.path = path
+        self.shape = None
+        self.grass_dtype = None
+        self.last_tick = None
+        self.stop_reason = None #why the run stopped early (see StopCondition), if it did
+        self.closed = False
+        if path is not None:
+            os.makedirs(path,exist_ok=True)
+        self.columns = {}
+        self._add_column('ticks',np.int64)
+        self._add_column('counts',np.int64,(3,))
+        self._add_column('offsets',np.int64)
+        self._add_column('x',np.float32)
+        self._add_column('y',np.float32)
+        self._add_column('species',np.int8)
+        self._previous = None #last grass grid recorded (for the delta encoding)
+        self._cache = None #(index, grid) last grass grid decoded (for the delta encoding)
+        
+    def _add_column(self,name,dtype,shape=()):
+        filename = None if self.path is None else os.path.join(self.path,name+'.bin')
+        self.columns[name] = _Column(dtype,shape,filename)
+        
+    def _setup_grass(self,grass,maxgrass):
+        """
+        Picks the smallest dtype which holds the grass and makes its columns (first record only)
+        """
+        self.shape = grass.shape
+        if np.issubdtype(grass.dtype,np.integer):
+            self.grass_dtype = np.promote_types(np.min_scalar_type(max(grass.max(),maxgrass)),np.min_scalar_type(grass.min()))
+        else:
+            self.grass_dtype = np.dtype(np.float32)
+        if self.grass_mode=='full':
+            self._add_column('grass',self.grass_dtype,self.shape)
+        elif self.grass_mode=='delta':
+            self._add_column('keyframes',self.grass_dtype,self.shape)
+            self._add_column('delta_offsets',np.int64)
+            self._add_column('delta_index',np.int32)
+            self._add_column('delta_value',self.grass_dtype)
+    
+    def _fit_grass(self,grass):
+        """
+        Promotes the grass columns to a larger dtype if grass has values their dtype can't hold
+        (e.g. grass grown past the maxgrass of the first record), so nothing wraps around
+        """
+        info = np.iinfo(self.grass_dtype)
+        low, high = grass.min(), grass.max()
+        if info.min<=low and high<=info.max:
+            return
+        self.grass_dtype = np.promote_types(self.grass_dtype,np.promote_types(np.min_scalar_type(high),np.min_scalar_type(low)))
+        for name in ('grass','keyframes','delta_value'):
+            if name in self.columns:
+                self.columns[name].promote(self.grass_dtype)
+        self._cache = None #a grid decoded in the old dtype
+    
+    def record(self,it,env,agents,last=False):
+        """
+        Records the state after iteration 'it' if it's due (every 'interval' iterations, or if last is true)
+         - env = the Environment
+         - agents = a list of agents or an AgentArrays
+        """
+        if not (last or (it+1)%self.interval==0) or it==self.last_tick:
+            return
+        if isinstance(agents,AgentArrays):
+            position, species = agents.position, agents.species
+        else:
+            position = np.array([a.position for a in agents],dtype=float).reshape(-1,2)
+            species = np.array([type(a)==Rabbit for a in agents],dtype=np.int8)
+        grass = env.grass
+        if self.shape is None:
+            self._setup_grass(grass,env.maxgrass)
+        elif self.grass_mode is not None and np.issubdtype(self.grass_dtype,np.integer):
+            self._fit_grass(grass)
+        nR = np.count_nonzero(species)
+        c = self.columns
+        c['ticks'].append(it)
+        c['counts'].append([len(species)-nR,nR,grass.sum()])
+        c['offsets'].append(c['x'].n)
+        c['x'].append(position[:,0])
+        c['y'].append(position[:,1])
+        c['species'].append(species)
+        if self.grass_mode=='full':
+            c['grass'].append(grass[None])
+        elif self.grass_mode=='delta':
+            n = c['ticks'].n-1
+            if n%self.keyframe==0:
+                c['keyframes'].append(grass[None])
+                c['delta_offsets'].append(c['delta_index'].n)
+            else:
+                changed = np.flatnonzero(grass!=self._previous)
+                c['delta_offsets'].append(c['delta_index'].n)
+                c['delta_index'].append(changed)
+                c['delta_value'].append(grass[np.unravel_index(changed,self.shape)])
+            self._previous = grass.copy()
+        self.last_tick = it
+        
+    def close(self):
+        """
+        Finishes recording: closes the files and writes meta.json if streaming to a directory
+        """
+        if self.closed:
+            return
+        for column in self.columns.values():
+            column.close()
+        if self.path is not None:
+            meta = {'interval':self.interval,'grass':self.grass_mode,'keyframe':self.keyframe,
+                    'stop_reason':self.stop_reason,'shape':None if self.shape is None else list(self.shape),
+                    'grass_dtype':None if self.grass_dtype is None else self.grass_dtype.str,
+                    'columns':{name:[column.dtype.str,list(column.shape),column.n] for name,column in self.columns.items()}}
+            with open(os.path.join(self.path,'meta.json'),'w') as file:
+                json.dump(meta,file)
+        self._previous = None
+        self.closed = True
+        
+    @classmethod
+    def _from_meta(cls,meta,path=None):
+        self = cls.__new__(cls)
+        self.interval = meta['interval']
+        self.grass_mode = meta['grass']
+        self.keyframe = meta['keyframe']
+        self.path = path
+        self.shape = None if meta['shape'] is None else tuple(meta['shape'])
+        self.grass_dtype = None if meta['grass_dtype'] is None else np.dtype(meta['grass_dtype'])
+        self.last_tick = None
+        self.stop_reason = meta.get('stop_reason')
+        self.closed = True
+        self._previous = None
+        self._cache = None
+        self.columns = {}
+        return self
+        
+    @classmethod
+    def open(cls,path):
+        """
+        Opens a recording streamed to the directory 'path' (the columns are memory mapped, not loaded)
+        """
+        with open(os.path.join(path,'meta.json')) as file:
+            meta = json.load(file)
+        self = cls._from_meta(meta,path)
+        for name,(dtype,shape,n) in meta['columns'].items():
+            column = _Column.__new__(_Column)
+            column.dtype, column.shape, column.n = np.dtype(dtype), tuple(shape), n
+            column.filename, column.file = os.path.join(path,name+'.bin'), None
+            self.columns[name] = column
+        if len(self):
+            self.last_tick = int(self.ticks[-1])
+        return self
+        
+    def save(self,filename):
+        """
+        Saves the recording to a compressed .npz file, read back with Recorder.load
+        """
+        meta = {'interval':self.interval,'grass':self.grass_mode,'keyframe':self.keyframe,
+                'stop_reason':self.stop_reason,'shape':None if self.shape is None else list(self.shape),
+                'grass_dtype':None if self.grass_dtype is None else self.grass_dtype.str}
+        np.savez_compressed(filename,meta=json.dumps(meta),**{name:column.data() for name,column in self.columns.items()})
+        
+    @classmethod
+    def load(cls,filename):
+        """
+        Loads a recording saved with Recorder.save
+        """
+        data = np.load(filename)
+        self = cls._from_meta(json.loads(str(data['meta'])))
+        for name in data.files:
+            if name!='meta':
+                values = data[name]
+                column = _Column(values.dtype,values.shape[1:],capacity=0)
+                column.buffer, column.n = values, len(values)
+                self.columns[name] = column
+        if len(self):
+            self.last_tick = int(self.ticks[-1])
+        return self
+            
+    @property
+    def ticks(self):
+        return self.columns['ticks'].data()
+    
+    @property
+    def counts(self):
+        return self.columns['counts'].data()
+    
+    def __len__(self):
+        return self.columns['ticks'].n
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __getitem__(self,i):
+        if isinstance(i,slice): #a list of records, like slicing the list run_ecolab used to return
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i<0:
+            i += len(self)
+        if not 0<=i<len(self):
+            raise IndexError('record index out of range')
+        return {'grass':self.grass(i),'agents':self.agents(i)}
+    
+    def agents(self,i):
+        """
+        Returns the agents of record i as a N x 3 array of (x, y, 0=fox/1=rabbit)
+        """
+        offsets = self.columns['offsets'].data()
+        start = offsets[i]
+        stop = offsets[i+1] if i+1<len(self) else self.columns['x'].n
+        return np.column_stack([self.columns[name].data()[start:stop] for name in ('x','y','species')]).astype(float)
+        
+    def grass(self,i):
+        """
+        Returns the grass grid of record i (None if the grass wasn't recorded)
+        """
+        if self.grass_mode=='full':
+            return np.array(self.columns['grass'].data()[i])
+        if self.grass_mode is None:
+            return None
+        k = i//self.keyframe
+        if self._cache is not None and k*self.keyframe<=self._cache[0]<=i:
+            start, grid = self._cache
+            grid = grid.copy()
+        else:
+            start, grid = k*self.keyframe, np.array(self.columns['keyframes'].data()[k])
+        offsets = self.columns['delta_offsets'].data()
+        index, value = self.columns['delta_index'].data(), self.columns['delta_value'].data()
+        flat = grid.reshape(-1)
+        for j in range(start+1,i+1):
+            stop = offsets[j+1] if j+1<len(self) else len(index)
+            flat[index[offsets[j]:stop]] = value[offsets[j]:stop]
+        self._cache = (i,grid.copy())
+        return grid
+    
+    
+class Observer:
+    """
+    Base class for things that watch a run of run_ecolab (or run_ecolab_vectorized) as it goes,
+    passed in its 'observers' argument. Override the ones needed:
+     - start(env,agents) = before the first iteration
+     - born(agents) = agents have just been born (a list of agents or an AgentArrays)
+     - died(agents) = agents have just been removed (starved, too old or eaten)
+     - tick(it,env,agents) = at the end of iteration 'it' (after the grass has grown)
+    List the attributes a run sets (rather than the constructor) in _runtime, so that they
+    are left out of the fingerprint (see simcache): an observer which has already been used
+    keys the same runs as a fresh one.
+    """
+    _runtime = ()
+    
+    def __fingerprint__(self):
+        return {k:v for k,v in vars(self).items() if k not in self._runtime}
+    
+    def start(self,env,agents):
+        pass
+    
+    def born(self,agents):
+        pass
+    
+    def died(self,agents):
+        pass
+    
+    def tick(self,it,env,agents):
+        pass
+
+
+def count_species(agents):
+    """
+    Returns the number of foxes and rabbits in a list of agents or an AgentArrays
+    """
+    if isinstance(agents,AgentArrays):
+        nR = int(np.count_nonzero(agents.species))
+    else:
+        nR = sum(type(a)==Rabbit for a in agents)
+    return len(agents)-nR, nR
+
+
+class Counts(Observer):
+    """
+    Keeps the number of foxes and rabbits up to date as they are born and die, and the total
+    amount of grass at the end of each iteration, without recording the run:
+     - foxes, rabbits, grass = the counts at the end of the last iteration
+     - iterations = how many iterations have run
+     - history = if true, also keeps the counts of every iteration, get_agent_counts style
+       (the array method returns them as a N x 3 array (Foxes, Rabbits, Grass))
+    """
+    _runtime = ('foxes','rabbits','grass','iterations','history')
+    
+    def __init__(self,history=False):
+        self.history = [] if history else None
+        
+    def __fingerprint__(self):
+        return {'history':self.history is not None}
+        
+    def start(self,env,agents):
+        self.foxes, self.rabbits = count_species(agents)
+        self.grass = env.grass.sum()
+        self.iterations = 0
+        
+    def born(self,agents):
+        nF, nR = count_species(agents)
+        self.foxes += nF
+        self.rabbits += nR
+        
+    def died(self,agents):
+        nF, nR = count_species(agents)
+        self.foxes -= nF
+        self.rabbits -= nR
+        
+    def tick(self,it,env,agents):
+        self.grass = env.grass.sum()
+        self.iterations = it+1
+        if self.history is not None:
+            self.history.append((self.foxes,self.rabbits,self.grass))
+            
+    def array(self):
+        return np.array(self.history).reshape(-1,3)
+
+
+class Reduction(Observer):
+    """
+    A user defined summary of a run, updated at the end of each iteration as
+    value = func(value,it,env,agents), starting from 'initial'. For example the largest
+    number of agents at any time is Reduction(lambda v,it,env,agents: max(v,len(agents)),0)
+    """
+    _runtime = ('value',)
+    
+    def __init__(self,func,initial=None):
+        self.func = func
+        self.initial = initial
+        
+    def start(self,env,agents):
+        self.value = self.initial
+        
+    def tick(self,it,env,agents):
+        self.value = self.func(self.value,it,env,agents)
+
+
+class StopCondition(Observer):
+    """
+    Base class for the stop conditions of run_ecolab (its 'stop' argument). Each iteration,
+    after the observers, check(it,counts) is called with the running Counts of the run and
+    returns true to stop. When it does, 'reason' says why (it's None until then).
+    """
+    _runtime = ('reason',)
+    
+    def start(self,env,agents):
+        self.reason = None
+        
+    def check(self,it,counts):
+        return False
+
+
+class SpeciesExtinct(StopCondition):
+    """
+    Stops when there are no 'species' ('rabbits' or 'foxes') left
+    """
+    def __init__(self,species='rabbits'):
+        self.species = species
+        
+    def check(self,it,counts):
+        if getattr(counts,self.species)==0:
+            self.reason = '%s extinct' % self.species
+            return True
+        return False
+
+
+class PopulationBounds(StopCondition):
+    """
+    Stops when the number of 'species' ('rabbits' or 'foxes') goes below low or above high
+    (None = no bound)
+    """
+    def __init__(self,species='rabbits',low=None,high=None):
+        self.species = species
+        self.low = low
+        self.high = high
+        
+    def check(self,it,counts):
+        n = getattr(counts,self.species)
+        if self.low is not None and n<self.low:
+            self.reason = '%s below %g' % (self.species,self.low)
+        elif self.high is not None and n>self.high:
+            self.reason = '%s above %g' % (self.species,self.high)
+        return self.reason is not None
+
+
+class Stationary(StopCondition):
+    """
+    Stops when the counts have settled: over the last 'window' iterations, none of the
+    'species' (any of 'foxes', 'rabbits', 'grass') has moved by more than tolerance times
+    its mean (or by more than 'minimum', whichever is larger).
+    """
+    _runtime = ('reason','history','n')
+    
+    def __init__(self,window=100,tolerance=0.1,species=('foxes','rabbits'),minimum=1):
+        self.window = window
+        self.tolerance = tolerance
+        self.species = species
+        self.minimum = minimum
+        
+    def start(self,env,agents):
+        super().start(env,agents)
+        self.history = np.zeros((self.window,len(self.species)))
+        self.n = 0
+        
+    def check(self,it,counts):
+        self.history[self.n%self.window] = [getattr(counts,s) for s in self.species]
+        self.n += 1
+        if self.n<self.window:
+            return False
+        spread = self.history.max(axis=0)-self.history.min(axis=0)
+        if np.all(spread<=np.maximum(self.tolerance*self.history.mean(axis=0),self.minimum)):
+            self.reason = 'stationary'
+            return True
+        return False
+
+
+def _stopped(stop,it,counts):
+    """
+    Returns the first of the stop conditions that says to stop (None if none does)
+    """
+    for condition in stop:
+        if condition.check(it,counts):
+            return condition
+    return None
+
+
+class Profiler:
+    """
+    Measures where the time of run_ecolab (or run_ecolab_vectorized) goes, pass it as its
+    'profiler' argument. (Without one, the runs don't measure anything.) For each iteration
+    it keeps the wall time of each phase and some counters:
+     - run_ecolab phases: index (building the RabbitGrid), move, eat, breed (summed over the
+       agents), die (removing the dead), grow, observers (observers and stop conditions), record
+     - run_ecolab_vectorized phases: feed rabbits, move foxes, eat, breed, die, grow, observers, record
+     - counters: agents (agents processed), grass lookups, rabbit searches, kills, births
+    summary() returns a table of the totals and write_trace(filename) writes a trace file which
+    can be opened with chrome://tracing or https://ui.perfetto.dev
+    """
+    def __init__(self):
+        self.ticks = [] #per iteration: {'iteration':it, 'times':{phase:seconds}, 'counts':{counter:n}}
+        self.events = [] #(phase, start, seconds, iteration) for the trace
+        self.origin = time.perf_counter()
+        
+    def start_tick(self,it):
+        self.tick = {'iteration':it,'times':{},'counts':{}}
+        self.ticks.append(self.tick)
+        
+    def add_time(self,phase,seconds,start):
+        self.tick['times'][phase] = self.tick['times'].get(phase,0)+seconds
+        self.events.append((phase,start,seconds,self.tick['iteration']))
+        
+    def count(self,counter,n=1):
+        self.tick['counts'][counter] = self.tick['counts'].get(counter,0)+n
+        
+    @contextlib.contextmanager
+    def phase(self,phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase,time.perf_counter()-start,start)
+            
+    def totals(self):
+        """
+        Returns the total time of each phase and the total of each counter (two dictionaries)
+        """
+        times, counts = {}, {}
+        for tick in self.ticks:
+            for phase,seconds in tick['times'].items():
+                times[phase] = times.get(phase,0)+seconds
+            for counter,n in tick['counts'].items():
+                counts[counter] = counts.get(counter,0)+n
+        return times, counts
+    
+    def summary(self):
+        """
+        Returns a table of the time spent in each phase (slowest first) and of the counters
+        """
+        times, counts = self.totals()
+        total = sum(times.values())
+        N = max(len(self.ticks),1)
+        lines = ['%-16s %10s %7s %12s' % ('phase','total (s)','%','per tick (ms)')]
+        for phase,seconds in sorted(times.items(),key=lambda item:-item[1]):
+            lines.append('%-16s %10.3f %7.1f %12.3f' % (phase,seconds,100*seconds/total if total else 0,1000*seconds/N))
+        lines.append('%-16s %10.3f %7.1f %12.3f' % ('total',total,100,1000*total/N))
+        lines.append('')
+        lines.append('%-16s %10s %12s' % ('counter','total','per tick'))
+        for counter,n in counts.items():
+            lines.append('%-16s %10d %12.1f' % (counter,n,n/N))
+        lines.append('(%d iterations)' % len(self.ticks))
+        return '\n'.join(lines)
+    
+    def write_trace(self,filename):
+        """
+        Writes the phases and counters as a trace file (Chrome's trace event JSON format).
+        The per-agent phases of run_ecolab (move, eat, breed) are summed over the agents, so
+        they're shown one after the other from the start of the loop over the agents.
+        """
+        trace = []
+        first = {} #start of each iteration
+        for phase,start,seconds,it in self.events:
+            trace.append({'name':phase,'ph':'X','pid':0,'tid':0,'ts':1e6*(start-self.origin),
+                          'dur':1e6*seconds,'args':{'iteration':it}})
+            first[it] = min(first.get(it,start),start)
+        for tick in self.ticks:
+            if tick['counts'] and tick['iteration'] in first:
+                trace.append({'name':'counters','ph':'C','pid':0,'ts':1e6*(first[tick['iteration']]-self.origin),'args':tick['counts']})
+        with open(filename,'w') as file:
+            json.dump({'traceEvents':trace,'displayTimeUnit':'ms'},file)
+
+
+def _phase(profiler,phase):
+    """
+    profiler.phase(phase), or a context that does nothing if there is no profiler
+    """
+    return contextlib.nullcontext() if profiler is None else profiler.phase(phase)
+
+
+def _act_profiled(agents,env,observers,profiler):
+    """
+    The loop over the agents of run_ecolab (move, eat, breed), timing each rule
+    """
+    profiler.count('agents',len(agents))
+    times = {'move':0,'eat':0,'breed':0}
+    loop_start = time.perf_counter()
+    for agent in agents:
+        t0 = time.perf_counter()
+        agent.move(env)
+        t1 = time.perf_counter()
+        agent.eat(env,agents)
+        t2 = time.perf_counter()
+        a = agent.breed(rng=env.rng)
+        t3 = time.perf_counter()
+        times['move'] += t1-t0
+        times['eat'] += t2-t1
+        times['breed'] += t3-t2
+        if type(agent)==Fox:
+            profiler.count('rabbit searches')
+        if a is not None:
+            profiler.count('births')
+            agents.append(a)
+            env.rabbit_index.add(a)
+            for observer in observers:
+                observer.born([a])
+    for phase,seconds in times.items():
+        profiler.add_time(phase,seconds,loop_start)
+        loop_start += seconds
+
+
+def run_ecolab(env,agents,Niterations=1000,earlystop=True,recorder=None,observers=(),stop=(),start_iteration=0,profiler=None):
+    """
+    Run ecolab, this applies the rules to the agents and the environment. It records
+    the grass array and the locations (and type) of agents in a Recorder it returns.
+    
+    Arguments:
+    - env = an Environment object
+    - agents = a list of agents (all inherited from Agent), or an AgentArrays (e.g. from a checkpoint)
+    - Niterations = number of iterations to run (default = 1000)
+    - earlystop = if true (default), will stop the simulation early if no agents left.
+    - recorder = the Recorder to record to (default = a new Recorder(), every iteration in memory),
+      or False to not record anything (then None is returned, use observers to follow the run)
+    - observers = a list of Observer (e.g. Counts) to call as the run goes
+    - stop = a list of StopCondition (e.g. SpeciesExtinct()), the run stops as soon as one of
+      them is met. The one that was met says why in its 'reason', which is also kept in the
+      recorder's stop_reason.
+    - start_iteration = the iteration to start from, e.g. when resuming from a checkpoint
+      (see load_checkpoint); the run goes on up to iteration Niterations-1.
+    - profiler = a Profiler to measure the time of each phase of the iterations (default None)
+    """
+    if isinstance(agents,AgentArrays):
+        agents = agents.to_agents()
+
+    record = Recorder() if recorder is None else (None if recorder is False else recorder)
+    counts = Counts()
+    observers = list(observers)+([counts]+list(stop) if stop else [])
+    for observer in observers:
+        observer.start(env,agents)
+    stopped = None
+    env.profiler = profiler
+    for it in range(start_iteration,Niterations):
+        if (it+1)%100==0: print("%5d" % (it+1), end="\r") #progress message
+        if profiler is not None: profiler.start_tick(it)
+            
+        #index the rabbits by grid cell so that foxes only look at the ones nearby
+        with _phase(profiler,'index'):
+            env.rabbit_index = RabbitGrid(agents,cellsize=Fox.vision)
+        
+        #for each agent, apply rules (move, eat, breed)
+        if profiler is not None:
+            _act_profiled(agents,env,observers,profiler)
+        else:
+            for agent in agents:
+                agent.move(env)
+                agent.eat(env,agents)
+                a = agent.breed(rng=env.rng)
+                if a is not None:
+                    agents.append(a)
+                    env.rabbit_index.add(a)
+                    for observer in observers:
+                        observer.born([a])
+
+        #removed dead agents
+        with _phase(profiler,'die'):
+            if observers or profiler is not None:
+                dead = [a.die() for a in agents]
+                for observer in observers:
+                    observer.died([a for a,d in zip(agents,dead) if d])
+                if profiler is not None:
+                    profiler.count('kills',sum(getattr(a,'eaten',False) for a in agents))
+                agents = [a for a,d in zip(agents,dead) if not d]
+            else:
+                agents = [a for a in agents if not a.die()]
+
+        #grow more grass
+        with _phase(profiler,'grow'):
+            env.grow()
+
+        with _phase(profiler,'observers'):
+            for observer in observers:
+                observer.tick(it,env,agents)
+
+            #stop early if we run out of rabbits and foxes (or a stop condition is met)
+            stopped = _stopped(stop,it,counts)
+            end = (earlystop and len(agents)==0) or stopped is not None
+
+        #record the grass and agent locations (and types) for later plotting & analysis
+        with _phase(profiler,'record'):
+            if record is not None:
+                record.record(it,env,agents,last=end or it==Niterations-1)
+        if end: break
+    env.rabbit_index = None
+    env.profiler = None
+    if record is not None:
+        record.stop_reason = None if stopped is None else stopped.reason
+        record.close()
+    return record
+
+
+def get_agent_counts(record):
+    """
+    Returns the number of foxes, rabbits and amount of grass in a N x 3 numpy array
+    the three columns are (Foxes, Rabbits, Grass). The record is a Recorder (whose counts are
+    kept as it records, so this doesn't need to read the grass or agents) or a list of
+    {'grass':..., 'agents':...} dictionaries.
+    """
+    if isinstance(record,Recorder):
+        return np.array(record.counts)
+    counts = []
+    for r in record:
+        ags = r['agents']
+        if len(ags)==0:
+            nF = 0
+            nR = 0
+        else:
+            nF = np.sum(ags[:,-1]==0)
+            nR = np.sum(ags[:,-1]==1)
+        nG = np.sum(r['grass'])
+        counts.append([nF,nR,nG])
+    counts = np.array(counts)
+    return counts
+
+class AgentArrays:
+    """
+    All the agents of a simulation stored as columns (structure of arrays) instead of a list of
+    Rabbit/Fox objects, so that the rules can be applied to every agent of a species at once:
+     - position = (N,2) array of x,y positions
+     - food, age, lastbreed, speed = (N,) arrays, same meaning as in Agent
+     - species = (N,) array, 0=fox, 1=rabbit (as in summary_vector)
+     - alive = (N,) boolean array, False once a rabbit has been eaten
+    The species parameters (vision, breedfreq, breedfood, maxage) are those of the Rabbit and Fox classes.
+    """
+    columns = ['position','food','age','lastbreed','speed','species','alive']
+
+    def __init__(self,position,food,age,lastbreed,speed,species,alive=None):
+        self.position = np.array(position,dtype=float).reshape(-1,2)
+        self.food = np.array(food,dtype=float)
+        self.age = np.array(age,dtype=int)
+        self.lastbreed = np.array(lastbreed,dtype=int)
+        self.speed = np.array(speed,dtype=float)
+        self.species = np.array(species,dtype=np.int8)
+        self.alive = np.ones(len(self.food),dtype=bool) if alive is None else np.array(alive,dtype=bool)
+
+    @classmethod
+    def from_agents(cls,agents):
+        """
+        Builds the columns from a list of Rabbit/Fox objects.
+        """
+        return cls(position=[a.position for a in agents],food=[a.food for a in agents],
+                   age=[a.age for a in agents],lastbreed=[a.lastbreed for a in agents],
+                   speed=[a.speed for a in agents],species=[type(a)==Rabbit for a in agents],
+                   alive=[not getattr(a,'eaten',False) for a in agents])
+
+    def to_agents(self):
+        """
+        Returns the agents as a list of Rabbit/Fox objects.
+        """
+        agents = []
+        for i in range(len(self)):
+            cls = Rabbit if self.species[i]==1 else Fox
+            a = cls(self.position[i].copy(),int(self.age[i]),self.food[i],self.speed[i],int(self.lastbreed[i]))
+            if cls==Rabbit: a.eaten = not self.alive[i]
+            agents.append(a)
+        return agents
+
+    def __len__(self):
+        return len(self.food)
+
+    def select(self,idx):
+        """
+        Returns a new AgentArrays with the agents in idx (indices or boolean mask).
+        """
+        return AgentArrays(*[getattr(self,c)[idx] for c in self.columns])
+
+    def extend(self,other):
+        """
+        Appends the agents of other (another AgentArrays) at the end.
+        """
+        for c in self.columns:
+            setattr(self,c,np.concatenate([getattr(self,c),getattr(other,c)]))
+
+    def species_param(self,idx,name):
+        """
+        Returns the class parameter 'name' (e.g. 'vision') of the agents in idx.
+        """
+        return np.where(self.species[idx]==1,getattr(Rabbit,name),getattr(Fox,name))
+
+    def summary(self):
+        """
+        Returns a N x 3 array of (x, y, 0=fox/1=rabbit), the same as the summary_vector of each agent.
+        """
+        return np.column_stack([self.position,self.species]).astype(float)
+
+    def trymove(self,idx,newposition,env):
+        """
+        Moves the agents in idx to newposition (rounded to the nearest cell), except those for
+        which it's outside the environment (see Environment.check_position).
+        """
+        newposition = np.round(newposition)
+        inside = np.all((newposition>=0)&(newposition<=np.array(env.shape)-1),axis=1)
+        self.position[idx[inside]] = newposition[inside]
+
+    def move_randomly(self,idx,env):
+        """
+        Moves the agents in idx one step of length speed in a random direction.
+        """
+        d = env.rng.random(len(idx))*2*np.pi
+        delta = np.round(np.column_stack([np.cos(d),np.sin(d)])*self.speed[idx,None])
+        self.trymove(idx,self.position[idx]+delta,env)
+
+    def move_rabbits(self,idx,env):
+        """
+        Rabbit.move for the rabbits in idx: the ones on a cell without food move towards the
+        best grass they can see (or in a random direction if there is none).
+        """
+        cells = self.position[idx].astype(int)
+        idx = idx[env.grass[cells[:,0],cells[:,1]]==0]
+        if len(idx)==0: return
+
+        food_position, found = env.get_loc_of_grass_batch(self.position[idx],Rabbit.vision)
+
+        self.move_randomly(idx[~found],env)
+
+        idx, food_position = idx[found], food_position[found]
+        relative = food_position-self.position[idx]
+        dist = np.sqrt(np.sum(relative**2,axis=1))
+        speed = self.speed[idx]
+        close = dist**2<speed**2
+        step = self.position[idx]+relative/np.where(dist>0,dist,1)[:,None]*speed[:,None]
+        self.trymove(idx,np.where(close[:,None],food_position,step),env)
+
+    def feed_rabbits(self,idx,env):
+        """
+        Rabbit.move followed by Rabbit.eat for the rabbits in idx. All rabbits move at once and
+        the ones landing on the same cell eat in turn (in agent order) while there is grass left.
+        A rabbit which found grass already eaten by an earlier rabbit goes back and moves again
+        (rounds), as it would have chosen differently in run_ecolab where rabbits act one by one.
+        """
+        origin = self.position[idx].copy()
+        pending = np.arange(len(idx))
+        for attempt in range(10):
+            self.position[idx[pending]] = origin[pending]
+            self.move_rabbits(idx[pending],env)
+
+            cells = self.position[idx[pending]].astype(int)
+            flat = np.ravel_multi_index((cells[:,0],cells[:,1]),env.grass.shape)
+            grass = env.grass[cells[:,0],cells[:,1]]
+            eats = _rank_in_group(flat)<grass
+            lost = ~eats&(grass>0)
+
+            np.subtract.at(env.grass,(cells[eats,0],cells[eats,1]),1)
+            self.food[idx[pending[eats]]] += 1
+            if attempt==9: lost[:] = False
+            self.food[idx[pending[~eats&~lost]]] -= 1
+
+            pending = pending[lost]
+            if len(pending)==0: break
+
+    def eat_foxes(self,idx,env):
+        """
+        Fox.eat for the foxes in idx: each fox goes after the nearest live rabbit within its
+        vision. If two foxes catch the same rabbit the first (in agent order) gets it and the
+        others try again with the nearest rabbit still alive, as they would in run_ecolab.
+        """
+        while len(idx)>0:
+            prey = np.flatnonzero((self.species==1)&~self._dying())
+            if len(prey)==0: return
+
+            target, sqrdist = _nearest(self.position[idx],self.position[prey],Fox.vision)
+            hunting = target>=0
+            idx, target, dist = idx[hunting], prey[target[hunting]], np.sqrt(sqrdist[hunting])
+
+            speed = self.speed[idx]
+            kill_prob = 1-dist/speed
+            evasion_factor = np.maximum(0.1,0.1+0.01*self.speed[target])
+            kill_prob *= 1-evasion_factor
+            kill = (dist<speed)&(kill_prob>env.rng.random(len(idx)))
+
+            idx, target = idx[kill], target[kill]
+            caught, first = np.unique(target,return_index=True)
+            winners = idx[first]
+            self.trymove(winners,self.position[caught],env)
+            self.alive[caught] = False
+            self.food[winners] += 2
+            if env.profiler is not None: env.profiler.count('kills',len(caught))
+
+            idx = np.setdiff1d(idx,winners)   #these foxes lost their rabbit to another fox
+
+    def breed(self,idx,rng=None):
+        """
+        Agent.breed (and Rabbit.breed) for the agents in idx, returns the newborns as an AgentArrays.
+        """
+        probability = np.where(self.species[idx]==1,0.05+0.05*self.speed[idx],0.1)
+        parents = idx[(self.lastbreed[idx]>self.species_param(idx,'breedfreq'))
+                      & (self.food[idx]>self.species_param(idx,'breedfood'))
+                      & (get_rng(rng).random(len(idx))<probability)]
+        self.lastbreed[parents] = -1
+        self.food[parents] /= 2
+        newborns = AgentArrays(self.position[parents],self.food[parents],np.zeros(len(parents)),
+                               np.full(len(parents),10),self.speed[parents],self.species[parents])
+        self.age[idx] += 1
+        self.lastbreed[idx] += 1
+        return newborns
+
+    def _dying(self):
+        return (self.food<=0)|(self.age>self.species_param(slice(None),'maxage'))|~self.alive
+
+    def step(self,env,observers=()):
+        """
+        One iteration of the rules (move, eat, breed for every agent) and removal of the dead.
+        Rabbits act first, then foxes, then the agents born in this iteration (which, as in
+        run_ecolab, also move and eat straight away). Returns the surviving agents.
+        The observers (see Observer) are told about the agents born and the agents removed,
+        and if the run is being profiled (env.profiler) each rule is timed.
+        """
+        profiler = env.profiler
+        n = len(self)
+        if profiler is not None: profiler.count('agents',n)
+        self._act(np.arange(n),env,profiler)
+        self._act(np.arange(n,len(self)),env,profiler)   #agents born during this iteration
+        with _phase(profiler,'die'):
+            dying = self._dying()
+            for observer in observers:
+                observer.born(self.select(np.arange(n,len(self))))
+                observer.died(self.select(dying))
+            if profiler is not None: profiler.count('births',len(self)-n)
+            return self.select(~dying)
+
+    def _act(self,idx,env,profiler=None):
+        rabbits = idx[self.species[idx]==1]
+        foxes = idx[self.species[idx]==0]
+        if len(rabbits)>0:
+            with _phase(profiler,'feed rabbits'):
+                self.feed_rabbits(rabbits,env)
+            with _phase(profiler,'breed'):
+                self.extend(self.breed(rabbits,env.rng))
+        if len(foxes)>0:
+            with _phase(profiler,'move foxes'):
+                self.move_randomly(foxes,env)
+            with _phase(profiler,'eat'):
+                if profiler is not None: profiler.count('rabbit searches',len(foxes))
+                self.eat_foxes(foxes,env)
+            with _phase(profiler,'breed'):
+                self.extend(self.breed(foxes,env.rng))
+
+
+def _rank_in_group(keys):
+    """
+    For each element, how many elements before it have the same key (0 for the first one).
+    """
+    order = np.argsort(keys,kind='stable')
+    sorted_keys = keys[order]
+    rank = np.empty(len(keys),dtype=int)
+    rank[order] = np.arange(len(keys))-np.searchsorted(sorted_keys,sorted_keys,side='left')
+    return rank
+
+
+def _nearest(points,targets,vision):
+    """
+    For each point, the index of the nearest target closer than vision (-1 if none; ties go to
+    the first target) and the squared distance. The targets are sorted into a uniform grid of
+    vision x vision cells so each point only looks at the targets in the 3 x 3 cells around it.
+    """
+    cells = np.floor(targets/vision).astype(np.int64)
+    lo = cells.min(axis=0)-1
+    ny = cells[:,1].max()-lo[1]+2
+    key = (cells[:,0]-lo[0])*ny+(cells[:,1]-lo[1])
+    order = np.argsort(key,kind='stable')
+    sorted_key = key[order]
+
+    pcells = np.floor(points/vision).astype(np.int64)-lo
+    pairs_point, pairs_target = [], []
+    for dx in (-1,0,1):
+        for dy in (-1,0,1):
+            c = pcells+[dx,dy]
+            valid = (c[:,1]>=0)&(c[:,1]<ny)
+            k = np.where(valid,c[:,0]*ny+c[:,1],-1)
+            start = np.searchsorted(sorted_key,k,side='left')
+            count = np.searchsorted(sorted_key,k,side='right')-start
+            point = np.repeat(np.arange(len(points)),count)
+            offset = np.arange(len(point))-np.repeat(np.cumsum(count)-count,count)
+            pairs_point.append(point)
+            pairs_target.append(order[np.repeat(start,count)+offset])
+    point = np.concatenate(pairs_point)
+    target = np.concatenate(pairs_target)
+
+    sqrdist = np.sum((points[point]-targets[target])**2,axis=1)
+    best = np.lexsort((target,sqrdist,point))
+    first = best[np.r_[True,point[best][1:]!=point[best][:-1]]] if len(best) else best
+
+    index = np.full(len(points),-1)
+    bestdist = np.full(len(points),np.inf)
+    near = sqrdist[first]<vision**2
+    index[point[first][near]] = target[first][near]
+    bestdist[point[first]] = sqrdist[first]
+    return index, bestdist
+
+
+def run_ecolab_vectorized(env,agents,Niterations=1000,earlystop=True,recorder=None,observers=(),stop=(),start_iteration=0,profiler=None):
+    """
+    Same as run_ecolab, but the agents are stored as columns (AgentArrays) and each rule is applied
+    to all the agents of a species with array operations, which is much faster for large populations.
+    The order in which agents act within an iteration differs (see AgentArrays.step), so runs
+    agree with run_ecolab statistically, not step by step.
+
+    Arguments:
+    - env = an Environment object
+    - agents = a list of agents (all inherited from Agent) or an AgentArrays
+    - Niterations = number of iterations to run (default = 1000)
+    - earlystop = if true (default), will stop the simulation early if no agents left.
+    - recorder = the Recorder to record to (default = a new Recorder(), every iteration in memory),
+      or False to not record anything (then None is returned, use observers to follow the run)
+    - observers = a list of Observer (e.g. Counts) to call as the run goes
+    - stop = a list of StopCondition, as run_ecolab
+    - start_iteration = the iteration to start from, as run_ecolab
+    - profiler = a Profiler to measure the time of each phase of the iterations (default None)
+    """
+    if not isinstance(agents,AgentArrays):
+        agents = AgentArrays.from_agents(agents)
+
+    record = Recorder() if recorder is None else (None if recorder is False else recorder)
+    counts = Counts()
+    observers = list(observers)+([counts]+list(stop) if stop else [])
+    for observer in observers:
+        observer.start(env,agents)
+    stopped = None
+    env.profiler = profiler
+    for it in range(start_iteration,Niterations):
+        if (it+1)%100==0: print("%5d" % (it+1),end="\r") #progress message
+        if profiler is not None: profiler.start_tick(it)
+
+        agents = agents.step(env,observers)
+
+        #grow more grass
+        with _phase(profiler,'grow'):
+            env.grow()
+
+        with _phase(profiler,'observers'):
+            for observer in observers:
+                observer.tick(it,env,agents)
+
+            #stop early if we run out of rabbits and foxes (or a stop condition is met)
+            stopped = _stopped(stop,it,counts)
+            end = (earlystop and len(agents)==0) or stopped is not None
+
+        #record the grass and agent locations (and types) for later plotting & analysis
+        with _phase(profiler,'record'):
+            if record is not None:
+                record.record(it,env,agents,last=end or it==Niterations-1)
+        if end: break
+    env.profiler = None
+    if record is not None:
+        record.stop_reason = None if stopped is None else stopped.reason
+        record.close()
+    return record
+
+
+def _shared_environment(grasswithboundary,settings,rng):
+    """
+    An Environment whose grass is (a view of) an existing bordered grid, e.g. in shared memory,
+    instead of a new array. settings = (maxgrass, growrate, growth, boundary).
+    """
+    env = Environment.__new__(Environment)
+    env.maxgrass, env.growrate, env.growth, env.boundary = settings
+    env.rng = rng
+    env.rabbit_index = None
+    env.profiler = None
+    b = env.boundary
+    env.grasswithboundary = grasswithboundary
+    env._grass = grasswithboundary[b:-b,b:-b]
+    env.shape = list(env._grass.shape)
+    return env
+
+
+def _bands(agents,rows,halo):
+    """
+    The live rabbits of a strip within halo rows of its top and bottom edges (the ghosts its
+    neighbours need), as two (indices, AgentArrays).
+    """
+    x = agents.position[:,0]
+    prey = (agents.species==1)&~agents._dying()
+    top = np.flatnonzero(prey&(x<rows[0]+halo))
+    bottom = np.flatnonzero(prey&(x>=rows[1]-halo))
+    return (top,agents.select(top)), (bottom,agents.select(bottom))
+
+
+class _Strip:
+    """
+    One strip of run_ecolab_parallel, kept by a worker process: its agents, and views of the
+    shared grass (the whole grid for the agents, its own rows for growing), with its own
+    random number generator, so that its run doesn't depend on which process keeps it.
+    """
+    def __init__(self,padded,settings,rows,halo,seed,agents):
+        rng = np.random.default_rng(seed)
+        b = settings[3]
+        self.env = _shared_environment(padded,settings,rng)
+        self.strip = _shared_environment(padded[rows[0]:rows[1]+2*b],settings,rng)
+        self.rows, self.halo, self.agents = rows, halo, agents
+
+    def bands(self):
+        return _bands(self.agents,self.rows,self.halo)
+
+    def _receive(self,kills,immigrants):
+        """
+        Removes the agents eaten in other strips and adds the immigrants; returns how many
+        agents were there before the immigrants (who have already acted in their old strip)
+        """
+        for idx in kills:
+            self.agents.alive[idx] = False
+        n_act = len(self.agents)
+        for other in immigrants:
+            self.agents.extend(other)
+        return n_act
+
+    def act(self,kills,immigrants,ghosts,growrate):
+        """
+        The strip's turn: returns (eaten ghosts per owner, emigrants, bands)
+        """
+        n_act = self._receive(kills,immigrants)
+        agents = self.agents
+        n_own = len(agents)
+        for owner, idx, other in ghosts:
+            agents.extend(other)
+        n_ghosts = len(agents)-n_own
+        agents._act(np.arange(n_act),self.env)
+        agents._act(np.arange(n_own+n_ghosts,len(agents)),self.env)   #agents born during this iteration
+
+        #tell the owners of the ghost rabbits which ones were eaten, then drop the ghosts
+        eaten, start = [], n_own
+        for owner, idx, other in ghosts:
+            eaten.append((owner,idx[~agents.alive[start:start+len(other)]]))
+            start += len(other)
+        agents = agents.select(np.r_[0:n_own,n_own+n_ghosts:len(agents)])
+
+        #the agents which have moved out of the strip go to their new owners
+        x = agents.position[:,0]
+        away = (x<self.rows[0])|(x>=self.rows[1])
+        emigrants = agents.select(away)
+        self.agents = agents.select(~away)
+
+        self.strip.growrate = growrate
+        self.strip.grow()
+        return eaten, emigrants, self.bands()
+
+    def end(self,kills,immigrants,want):
+        """
+        The end of the iteration: returns ((foxes, rabbits), bands, the agents if want)
+        """
+        self._receive(kills,immigrants)
+        agents = self.agents = self.agents.select(~self.agents._dying())
+        nR = int(np.count_nonzero(agents.species))
+        return (len(agents)-nR,nR), self.bands(), agents if want else None
+
+
+def _strip_worker(conn,name,padded_shape,dtype,settings,halo):
+    """
+    A worker process of run_ecolab_parallel (see there), keeping some of the strips. Each
+    message is (command, [(strip, arguments), ...]) with all of the worker's strips for that
+    phase, and gets one reply, the list of their results.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        padded = np.ndarray(padded_shape,dtype=dtype,buffer=shm.buf)
+        strips = {}
+        while True:
+            command, batch = conn.recv()
+            if command=='stop':
+                break
+            replies = []
+            for k, arguments in batch:
+                if command=='start':
+                    rows, seed, agents = arguments
+                    strips[k] = _Strip(padded,settings,rows,halo,seed,agents)
+                    replies.append(strips[k].bands())
+                elif command=='act':
+                    replies.append(strips[k].act(*arguments))
+                else:   #'end' of the iteration
+                    replies.append(strips[k].end(*arguments))
+            conn.send(replies)
+    finally:
+        conn.close()
+        shm.close()
+
+
+def run_ecolab_parallel(env,agents,Niterations=1000,earlystop=True,recorder=None,stop=(),workers=None,strips=None):
+    """
+    Same as run_ecolab_vectorized, but the grid is cut into strips of rows, simulated by a pool
+    of worker processes, so that very large grids with many agents can use all the cores.
+
+     - the grass is one bordered grid in shared memory, which every process can see
+     - each strip owns the agents standing on it. The strips take turns in two colours
+       (even strips, then odd strips), so that while a strip acts its neighbours are idle: its
+       rabbits can read and eat the grass in the rows next to it ('halo', the furthest an agent
+       can see and move in one iteration) and its foxes can hunt the neighbours' rabbits in
+       those rows, which are sent to it as 'ghosts'. Eaten ghosts are reported back to their owner.
+     - agents which end their turn outside the strip migrate to the strip they are on
+     - each strip grows its own grass at the end of its turn; with the default growth the
+       env.growrate tufts are shared out between the strips at random (multinomially).
+
+    Each strip has its own random number generator (seeded from env.rng), so a run only depends
+    on env.rng and the strips, not on the number of workers or which worker keeps which strip.
+    The order in which agents act differs from the other engines, so the runs agree with them
+    statistically.
+
+    Arguments:
+    - env = an Environment object (its grass is updated at the end of the run)
+    - agents = a list of agents (all inherited from Agent) or an AgentArrays
+    - Niterations = number of iterations to run (default = 1000)
+    - earlystop = if true (default), will stop the simulation early if no agents left.
+    - recorder = the Recorder to record to, as run_ecolab (recording the agents means gathering
+      them from every strip, so use an 'interval' or recorder=False for big runs)
+    - stop = a list of StopCondition, as run_ecolab (observers aren't supported: they would need
+      every birth and death sent back from the strips)
+    - workers = number of worker processes (default = one per core); strips k and k+1 go to
+      worker k//2 (modulo workers), so that each colour is spread over all of them
+    - strips = number of strips (default = as many as the grid allows, up to 32); no strip is
+      thinner than twice the halo, so there can be fewer
+    """
+    if not isinstance(agents,AgentArrays):
+        agents = AgentArrays.from_agents(agents)
+    workers = os.cpu_count() if workers is None else workers
+
+    #the halo is the furthest an agent reaches in one turn: a fox moves, then hunts within its vision
+    #(a rabbit moves towards grass within its vision)
+    speed = {s:agents.speed[agents.species==s].max(initial=0) for s in (0,1)}
+    halo = int(np.ceil(max(Fox.vision+2*speed[0],Rabbit.vision+speed[1])))+1
+    if max(Fox.vision,Rabbit.vision)>env.boundary:
+        env.boundary = max(Fox.vision,Rabbit.vision)
+        env.grass = env.grass.copy()
+    N_strips = max(1,min(32 if strips is None else strips,env.shape[0]//(2*halo)))
+    edges = np.linspace(0,env.shape[0],N_strips+1).astype(int)
+    workers = max(1,min(workers,(N_strips+1)//2))
+    host = [(k//2)%workers for k in range(N_strips)]   #the worker keeping strip k
+
+    record = Recorder() if recorder is None else (None if recorder is False else recorder)
+    counts = Counts()
+    for observer in [counts]+list(stop):
+        observer.start(env,agents)
+    stopped = None
+
+    padded = env.grasswithboundary
+    shm = shared_memory.SharedMemory(create=True,size=padded.nbytes)
+    processes, connections = [], []
+    try:
+        shared = np.ndarray(padded.shape,dtype=padded.dtype,buffer=shm.buf)
+        shared[...] = padded
+        view = _shared_environment(shared,(env.maxgrass,env.growrate,env.growth,env.boundary),env.rng)
+        settings = (env.maxgrass,env.growrate,env.growth,env.boundary)
+        seeds = env.rng.integers(2**62,size=N_strips)
+        owner = np.searchsorted(edges[1:-1],agents.position[:,0],side='right')
+        for w in range(workers):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_strip_worker,daemon=True,
+                                              args=(child,shm.name,padded.shape,padded.dtype,settings,halo))
+            process.start()
+            child.close()
+            processes.append(process)
+            connections.append(connection)
+
+        def exchange(command,messages):
+            #sends each worker one message with the arguments of all its strips, then gets its one
+            #reply: a worker never has a second message waiting while it sends a reply, so
+            #neither side can block the other however big the messages are.
+            #Returns {strip: result}.
+            batches = [[] for w in range(workers)]
+            for k, arguments in messages:
+                batches[host[k]].append((k,arguments))
+            for w, batch in enumerate(batches):
+                if batch: connections[w].send((command,batch))
+            replies = {}
+            for w, batch in enumerate(batches):
+                if batch: replies.update(zip([k for k,arguments in batch],connections[w].recv()))
+            return replies
+
+        started = exchange('start',[(k,((edges[k],edges[k+1]),seeds[k],agents.select(owner==k))) for k in range(N_strips)])
+        bands = [started[k] for k in range(N_strips)]
+
+        kills = [[] for k in range(N_strips)]
+        immigrants = [[] for k in range(N_strips)]
+
+        def deliver(emigrants):
+            #sends migrating agents to the strip they are now on
+            to = np.searchsorted(edges[1:-1],emigrants.position[:,0],side='right')
+            for k in np.unique(to):
+                immigrants[k].append(emigrants.select(to==k))
+
+        for it in range(Niterations):
+            if (it+1)%100==0: print("%5d" % (it+1),end="\r") #progress message
+            growrates = env.rng.multinomial(env.growrate,np.diff(edges)/env.shape[0])
+            for colour in (0,1):
+                active = range(colour,N_strips,2)
+                messages = []
+                for k in active:
+                    ghosts = []
+                    if k>0: ghosts.append((k-1,)+bands[k-1][1])   #bottom band of the strip above
+                    if k<N_strips-1: ghosts.append((k+1,)+bands[k+1][0])   #top band of the strip below
+                    messages.append((k,(kills[k],immigrants[k],ghosts,growrates[k])))
+                    kills[k], immigrants[k] = [], []
+                acted = exchange('act',messages)
+                for k in active:
+                    eaten, emigrants, bands[k] = acted[k]
+                    for other, idx in eaten:
+                        kills[other].append(idx)
+                    deliver(emigrants)
+
+            #the end of the iteration: remove the dead, gather the counts (and the agents, to record them)
+            last = it==Niterations-1
+            want = record is not None and ((it+1)%record.interval==0 or last)
+            ended = exchange('end',[(k,(kills[k],immigrants[k],want)) for k in range(N_strips)])
+            kills = [[] for k in range(N_strips)]
+            immigrants = [[] for k in range(N_strips)]
+            results = [ended[k] for k in range(N_strips)]
+            nF, nR = np.sum([result[0] for result in results],axis=0)
+            bands = [result[1] for result in results]
+            counts.foxes, counts.rabbits, counts.grass, counts.iterations = nF, nR, view.grass.sum(), it+1
+
+            stopped = _stopped(stop,it,counts)
+            end = (earlystop and nF+nR==0) or stopped is not None
+            if record is not None and (want or end):
+                everyone = AgentArrays(np.zeros((0,2)),[],[],[],[],[])
+                for result in results:
+                    if result[2] is not None: everyone.extend(result[2])
+                record.record(it,view,everyone,last=True)
+            if end: break
+        env.grass = view.grass.copy()
+    finally:
+        for connection in connections:
+            try:
+                connection.send(('stop',None))
+            except (BrokenPipeError,OSError):
+                pass
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive(): process.terminate()
+        shm.close()
+        shm.unlink()
+    if record is not None:
+        record.stop_reason = None if stopped is None else stopped.reason
+        record.close()
+    return record
+
+
+def speed_setup(speed,rng,Nrabbits=150,Nfoxes=50,fox_speed=3):
+    """
+    The set-up of the rabbit speed study: a 60 x 60 environment with Nrabbits rabbits of the
+    given speed and Nfoxes foxes, everything random drawn from rng. Returns (env, agents).
+    """
+    env = Environment(shape=[60,60],growrate=60,maxgrass=5,startgrass=1,rng=rng)
+    agents = [Rabbit(env.get_random_location(),speed=speed,rng=rng) for _ in range(Nrabbits)]
+    agents += [Fox(env.get_random_location(),speed=fox_speed,rng=rng) for _ in range(Nfoxes)]
+    return env, agents
+
+
+def _replicate(job):
+    """
+    One run of run_replicates, returns the final (Foxes, Rabbits, Grass, iterations, why it stopped).
+    """
+    setup, value, seed, key, Niterations, engine, stop = job
+    rng = np.random.default_rng(np.random.SeedSequence(seed,spawn_key=key))
+    env, agents, *start = setup(value,rng)
+    counts = Counts()
+    resume = {'start_iteration':start[0]} if start else {} #the setup started from a checkpoint
+    engine(env,agents,Niterations=Niterations,earlystop=True,recorder=False,observers=[counts],stop=stop,**resume)
+    reason = next((condition.reason for condition in stop if condition.reason is not None),'')
+    return counts.foxes, counts.rabbits, counts.grass, counts.iterations, reason
+
+
+def run_replicates(setup,values,n_replicates,seed=0,Niterations=1000,engine=run_ecolab,processes=None,stop=(),cache=None):
+    """
+    Runs n_replicates simulations for each of the values, spread over a pool of processes, and
+    returns the final counts of every run in a structured array with the fields
+    'value', 'replicate', 'foxes', 'rabbits', 'grass', 'iterations' and 'stopped' (the
+    reason of the stop condition which ended the run, '' if none did).
+
+    Arguments:
+    - setup = setup(value, rng) returns (env, agents) for one run, drawing everything random
+      from rng (e.g. speed_setup), or (env, agents, iteration) to continue a run from that
+      iteration (e.g. checkpoint_setup). It is sent to the worker processes, so it has to be a
+      module level function (or a functools.partial of one).
+    - values = the parameter values to try
+    - n_replicates = number of runs for each value
+    - seed = seed of the whole study. Run r of the i-th value gets its own stream,
+      SeedSequence(seed, spawn_key=(i, r)), so the results are the same whatever the number
+      of processes or the order the runs happen in.
+    - Niterations = the iteration each run ends at (they stop early if no agents are left); runs
+      continued from a checkpoint count from the start of the run that saved it, like start_iteration
+    - engine = run_ecolab (default) or run_ecolab_vectorized
+    - processes = number of worker processes (default = one per CPU, 1 = no pool)
+    - stop = a list of StopCondition to end each run as soon as the question is answered
+      (e.g. [SpeciesExtinct('rabbits')] when only the rabbits matter)
+    - cache = a simcache.Cache to keep the runs in: the runs done before (same set-up, value,
+      seed, replicate, settings and code) are loaded from it and only the new ones are run,
+      e.g. after adding a value at the end of values (run r of the i-th value keeps its stream)
+    """
+    jobs = [(setup,value,seed,(i,r),Niterations,engine,stop)
+            for i,value in enumerate(values) for r in range(n_replicates)]
+
+    def compute(func,jobs):
+        if processes==1 or len(jobs)<=1:
+            return list(map(func,jobs))
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            return list(pool.map(func,jobs))
+
+    results = compute(_replicate,jobs) if cache is None else cache.map(_replicate,jobs,compute)
+    dtype = [('value',float),('replicate',int),('foxes',int),('rabbits',int),('grass',float),('iterations',int),('stopped','U40')]
+    return np.array([(job[1],job[3][1])+tuple(result) for job,result in zip(jobs,results)],dtype=dtype)
+
+
+def extinction_probability(results,species='rabbits',confidence=0.95):
+    """
+    For each value in the results of run_replicates, the fraction of the runs which ended
+    with no 'species' left and its Wilson score confidence interval.
+    Returns the arrays (values, probability, lower, upper).
+    """
+    values, which = np.unique(results['value'],return_inverse=True)
+    n = np.bincount(which)
+    p = np.bincount(which,weights=results[species]==0)/n
+    z = statistics.NormalDist().inv_cdf((1+confidence)/2)
+    centre = (p+z**2/(2*n))/(1+z**2/n)
+    half = z*np.sqrt(p*(1-p)/n+z**2/(4*n**2))/(1+z**2/n)
+    return values, p, centre-half, centre+half
+
+
+def set_rabbit_speed(speed,env,agents):
+    """
+    Sets the speed of all the rabbits (a list of agents or an AgentArrays), e.g. for forking
+    the speed study from a checkpoint (see checkpoint_setup).
+    """
+    if isinstance(agents,AgentArrays):
+        agents.speed[agents.species==1] = speed
+    else:
+        for a in agents:
+            if type(a)==Rabbit: a.speed = speed
+
+
+def save_checkpoint(filename,env,agents,iteration):
+    """
+    Saves the state of a run after 'iteration' iterations (the grass, the environment's settings
+    and random number generator, and the agents) to a compressed .npz file. The file is written
+    to a temporary name and then renamed, so an interrupted save leaves the previous file intact.
+    """
+    kind = 'arrays' if isinstance(agents,AgentArrays) else 'objects'
+    if kind=='objects':
+        agents = AgentArrays.from_agents(agents)
+    meta = {'iteration':iteration,'kind':kind,'shape':list(env.shape),'maxgrass':env.maxgrass,
+            'growrate':env.growrate,'boundary':env.boundary,'growth':env.growth,
+            'rng':None if isinstance(env.rng,GlobalRandom) else env.rng,
+            'global_state':np.random.get_state() if isinstance(env.rng,GlobalRandom) else None}
+    temporary = filename+'.tmp.npz'
+    np.savez_compressed(temporary,meta=np.frombuffer(pickle.dumps(meta),dtype=np.uint8),grass=env.grass,
+                        **{c:getattr(agents,c) for c in AgentArrays.columns})
+    os.replace(temporary,filename)
+
+
+def load_checkpoint(filename,rng=None):
+    """
+    Loads a checkpoint saved by save_checkpoint (or a Checkpointer), returns (env, agents, iteration).
+    Continuing with run_ecolab(env, agents, ..., start_iteration=iteration) gives exactly the same
+    run as if it had never stopped. The agents come back as they were saved (a list of Rabbit/Fox
+    or an AgentArrays).
+    If rng (a np.random.Generator) is given it replaces the saved one, so that the run goes on
+    differently from there (see fork).
+    """
+    with np.load(filename) as data:
+        meta = pickle.loads(data['meta'].tobytes())
+        grass = data['grass']
+        agents = AgentArrays(*[data[c] for c in AgentArrays.columns])
+    if rng is None:
+        rng = meta['rng']
+        if rng is None:
+            np.random.set_state(meta['global_state'])
+    env = Environment(shape=meta['shape'],maxgrass=meta['maxgrass'],growrate=meta['growrate'],
+                      growth=meta['growth'],rng=rng)
+    env.boundary = meta['boundary']
+    env.grass = grass
+    if meta['kind']=='objects':
+        agents = agents.to_agents()
+    return env, agents, meta['iteration']
+
+
+def fork(filename,n,seed=0):
+    """
+    Starts n runs from the same checkpoint, each with its own random number generator
+    (SeedSequence(seed, spawn_key=(k,)) for the k-th), so that they share the state reached
+    so far but go on independently. Returns a list of n (env, agents, iteration).
+    """
+    return [load_checkpoint(filename,np.random.default_rng(np.random.SeedSequence(seed,spawn_key=(k,))))
+            for k in range(n)]
+
+
+def checkpoint_setup(value,rng,filename,apply=None):
+    """
+    A setup for run_replicates which starts every run from a checkpoint (e.g. after a shared
+    warm-up) instead of from scratch: loads it with rng, then calls apply(value, env, agents)
+    (e.g. set_rabbit_speed) to set the parameter. Use it as
+    functools.partial(checkpoint_setup, filename=..., apply=...).
+    Returns (env, agents, iteration): run_replicates continues each run from the checkpoint's
+    iteration, so Niterations is where the whole run ends, warm-up included, as when resuming
+    with load_checkpoint and start_iteration. With a simcache.Cache the runs are keyed by the
+    contents of the checkpoint, so overwriting it with another warm-up doesn't reuse old runs.
+    """
+    env, agents, iteration = load_checkpoint(filename,rng)
+    if apply is not None:
+        apply(value,env,agents)
+    return env, agents, iteration
+
+checkpoint_setup.__fingerprint_files__ = ('filename',)
+
+
+class Checkpointer(Observer):
+    """
+    Saves a checkpoint of the run (see save_checkpoint) every 'interval' iterations, pass it to
+    run_ecolab in its observers. The filename can contain a % format of an integer (e.g. %d or
+    %05d), replaced by the iteration, to keep every checkpoint; otherwise the same file is
+    overwritten with the latest one.
+    """
+    def __init__(self,filename,interval=100):
+        self.filename = filename
+        self.interval = interval
+        try:
+            self.series = filename % 0!=filename
+        except (TypeError,ValueError): #no format in it
+            self.series = False
+
+    def tick(self,it,env,agents):
+        if (it+1)%self.interval==0:
+            filename = self.filename % (it+1) if self.series else self.filename
+            save_checkpoint(filename,env,agents,it+1)
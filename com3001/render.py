@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Fast plotting of long trajectories and animations of ecolab recordings, without a display.
+
+A plot can't show more points than it has pixels, so long trajectories are decimated before
+plotting. decimate keeps, in each of a few hundred pieces of the trajectory, its first, last,
+smallest and largest samples. The lines look the same as with every sample (peaks included) but
+cost a bounded number of points, however long the run. plot_lod, plot3d_lod and plot_many (many
+curves, e.g. the members of an ensemble, as a single LineCollection) use it.
+
+animate_record streams the frames of a Recorder (grass grid and agents) to a video, an animated
+GIF or numbered PNG files. It draws the axes once and then, for each frame, only redraws the
+grass image, the agents and the label on top of the saved background (blitting). The Recorder
+decodes one grass grid at a time, so memory stays bounded whatever the length of the run.
+
+matplotlib is only imported by the functions that draw.
+"""
+
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+
+def _extrema(Y,buckets):
+    """
+    For each row of Y (rows, n), the sorted indices of the first, smallest, largest and last
+    sample of each of 'buckets' equal pieces of the row: an array (rows, 4*buckets)
+    """
+    rows, n = Y.shape
+    size = -(-n//buckets)
+    padded = np.pad(Y,((0,0),(0,size*buckets-n)),mode='edge').reshape(rows,buckets,size)
+    start = np.arange(buckets)*size
+    index = np.stack([np.broadcast_to(start,(rows,buckets)),
+                      start+padded.argmin(axis=-1),
+                      start+padded.argmax(axis=-1),
+                      np.broadcast_to(start+size-1,(rows,buckets))],axis=-1)
+    return np.sort(np.minimum(index,n-1).reshape(rows,-1),axis=1)
+
+
+def lod_indices(X,max_points=2000):
+    """
+    Returns the (sorted) indices of the samples to keep along the last axis of X so that the
+    lines of every component (every other axis) keep their shape with at most about max_points
+    samples. All the samples are kept if there are no more than max_points.
+    """
+    X = np.asarray(X)
+    n = X.shape[-1]
+    if n<=max_points:
+        return np.arange(n)
+    Y = X.reshape(-1,n)
+    buckets = max(1,max_points//(2*len(Y)+2)) #the first and last samples are shared by the rows
+    return np.unique(_extrema(Y,buckets))
+
+
+def decimate(t,X,max_points=2000):
+    """
+    Returns (t, X) decimated along the last axis with lod_indices, e.g. the (X, T) of a
+    Numerical_methods run (X can be (N_dim, N_iter) or an ensemble (N_dim, N_members, N_iter))
+    """
+    index = lod_indices(X,max_points)
+    return np.asarray(t)[index], np.asarray(X)[...,index]
+
+
+def plot_lod(ax,t,X,max_points=2000,**kwargs):
+    """
+    Plots X (one line per row, or a single line) against t on the axes ax after decimating them,
+    and returns the lines. kwargs go to ax.plot.
+    """
+    t, X = decimate(t,X,max_points)
+    return ax.plot(t,np.transpose(X),**kwargs)
+
+
+def plot3d_lod(ax,X,max_points=2000,**kwargs):
+    """
+    plot3D of the first three components of a trajectory X (3, N) on the 3D axes ax after
+    decimating it, returns the lines. kwargs go to ax.plot3D.
+    """
+    index = lod_indices(X[:3],max_points)
+    X = np.asarray(X)[:3,index]
+    return ax.plot3D(X[0],X[1],X[2],**kwargs)
+
+
+def plot_many(ax,x,y,max_points=1000,**kwargs):
+    """
+    Draws many curves at once as a single LineCollection: curve i goes through the points
+    (x[i], y[i]), with y of shape (N_curves, N) and x of the same shape or a shared (N,) (e.g.
+    the times). Each curve is decimated on its own to about max_points points. kwargs go to
+    the LineCollection (color, alpha, linewidth...). Returns the collection.
+    """
+    from matplotlib.collections import LineCollection
+
+    y = np.atleast_2d(y)
+    x = np.broadcast_to(x,y.shape)
+    n = y.shape[-1]
+    if n>max_points:
+        buckets = max(1,max_points//8)
+        index = np.concatenate([_extrema(x,buckets),_extrema(y,buckets)],axis=1)
+        index.sort(axis=1)
+        x, y = np.take_along_axis(x,index,axis=1), np.take_along_axis(y,index,axis=1)
+    collection = LineCollection(np.stack([x,y],axis=-1),**kwargs)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+
+class FrameWriter:
+    """
+    Writes frames (height x width x 3 or 4 uint8 arrays, all of the same size) one at a time:
+     - to a video or an animated GIF (any filename ffmpeg knows, e.g. 'run.mp4' or 'run.gif')
+       through an ffmpeg process fed the raw pixels, or
+     - to numbered PNG files if the filename contains a % format, e.g. 'frames/%05d.png'.
+    Only the current frame is held in memory. Use it as a context manager (or call close).
+
+    Arguments:
+    - filename = where to write (see above)
+    - fps = frames per second of the video
+    - ffmpeg = the ffmpeg executable
+    - options = extra ffmpeg output options, e.g. ['-crf', '18']
+    """
+    def __init__(self,filename,fps=20,ffmpeg='ffmpeg',options=()):
+        self.filename = filename
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.options = list(options)
+        self.process = None
+        self.shape = None
+        self.n = 0
+        self.pattern = '%' in os.path.basename(filename)
+        if self.pattern:
+            os.makedirs(os.path.dirname(filename) or '.',exist_ok=True)
+        elif shutil.which(ffmpeg) is None:
+            raise RuntimeError("writing '%s' needs ffmpeg, which wasn't found; write numbered PNG "
+                               "files instead with a filename like 'frames/%%05d.png'" % filename)
+
+    def _start(self,shape):
+        height, width, depth = shape
+        command = [self.ffmpeg,'-y','-loglevel','error','-f','rawvideo',
+                   '-pix_fmt','rgba' if depth==4 else 'rgb24','-s','%dx%d' % (width,height),
+                   '-r',str(self.fps),'-i','-']
+        if not self.filename.lower().endswith('.gif'):
+            #the usual codecs need even dimensions and yuv420p to be playable everywhere
+            command += ['-vf','pad=ceil(iw/2)*2:ceil(ih/2)*2','-pix_fmt','yuv420p']
+        self.process = subprocess.Popen(command+self.options+[self.filename],stdin=subprocess.PIPE)
+
+    def write(self,frame):
+        """
+        Writes the next frame
+        """
+        frame = np.asarray(frame,dtype=np.uint8)
+        if self.shape is None:
+            self.shape = frame.shape
+            if not self.pattern:
+                self._start(frame.shape)
+        elif frame.shape!=self.shape:
+            raise ValueError('frame of shape %s, the first one was %s' % (frame.shape,self.shape))
+        if self.pattern:
+            import matplotlib.image
+            matplotlib.image.imsave(self.filename % self.n,frame)
+        else:
+            self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        self.n += 1
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait()!=0:
+                raise RuntimeError("ffmpeg failed writing '%s'" % self.filename)
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+def animate_record(record,filename,fps=20,every=1,start=0,stop=None,size=6,dpi=100,
+                   vmax=None,cmap='Greens',marker_size=None,ffmpeg='ffmpeg'):
+    """
+    Renders the records start, start+every, ... (up to stop, default all) of a Recorder (e.g. the
+    one returned by run_ecolab, or Recorder.open of a run streamed to disk) as an animation of the
+    grass (if it was recorded) with the rabbits (blue) and foxes (red) on top, written with a
+    FrameWriter to filename (a video, a GIF, or PNG files 'dir/%05d.png'). Returns the number
+    of frames written.
+
+    The figure is drawn off screen (Agg) whatever the matplotlib backend, so it runs without a
+    display. The static parts (axes, ticks) are drawn once; each frame only redraws the
+    animated ones over that background.
+
+    Arguments:
+    - size, dpi = size of the figure in inches, and dots per inch
+    - vmax = the grass amount shown in the darkest colour (default = the largest in the first frame)
+    - cmap = colour map of the grass
+    - marker_size = size of the agents' markers (default = about a tile)
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    stop = len(record) if stop is None else min(stop,len(record))
+    if start>=stop:
+        return 0
+    fig = Figure(figsize=(size,size),dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    shape = record.shape
+    grass = record.grass(start) if record.grass_mode is not None else None
+    if shape is None: #no grass recorded: fit the agents of the first frame
+        agents = record.agents(start)
+        shape = tuple(np.maximum(agents[:,:2].max(axis=0,initial=0)+1,1).astype(int))
+    ax.set_xlim(-0.5,shape[0]-0.5)
+    ax.set_ylim(-0.5,shape[1]-0.5)
+    ax.set_aspect('equal')
+
+    animated = []
+    if grass is not None:
+        vmax = max(1,grass.max()) if vmax is None else vmax
+        image = ax.imshow(grass.T,origin='lower',cmap=cmap,vmin=0,vmax=vmax,interpolation='nearest',animated=True)
+        animated.append(image)
+    if marker_size is None:
+        marker_size = max(1,0.8*size*72/max(shape))
+    rabbits, = ax.plot([],[],'o',color='tab:blue',ms=marker_size,mew=0,animated=True)
+    foxes, = ax.plot([],[],'o',color='tab:red',ms=marker_size,mew=0,animated=True)
+    label = ax.text(0.02,0.98,'',transform=ax.transAxes,va='top',animated=True,
+                    bbox={'facecolor':'white','alpha':0.7,'edgecolor':'none'})
+    animated += [rabbits,foxes,label]
+
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    ticks = record.ticks
+
+    with FrameWriter(filename,fps,ffmpeg) as writer:
+        for i in range(start,stop,every):
+            if grass is not None:
+                image.set_data(record.grass(i).T)
+            agents = record.agents(i)
+            rabbit = agents[:,2]==1
+            rabbits.set_data(agents[rabbit,0],agents[rabbit,1])
+            foxes.set_data(agents[~rabbit,0],agents[~rabbit,1])
+            label.set_text('iteration %d: %d foxes, %d rabbits' % (ticks[i],np.count_nonzero(~rabbit),np.count_nonzero(rabbit)))
+
+            canvas.restore_region(background)
+            for artist in animated:
+                ax.draw_artist(artist)
+            writer.write(np.asarray(canvas.buffer_rgba()))
+    return writer.n
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+A disk cache for the results of simulations, so that rerunning a study only computes what changed.
+
+A result is stored under a key which is a hash of everything it was computed from: the function
+(and the source code of the module it is defined in, so editing the code invalidates its old
+results), the arguments (numbers, strings, numpy arrays, lists, dicts, and objects such as an
+Environment or a list of agents, through their attributes) and the state of the random number
+generators among them. For example
+
+    cache = Cache()
+    record = cache.call(run_ecolab, env, agents, Niterations=1000)           # runs it
+    record = cache.call(run_ecolab, env2, agents2, Niterations=1000)         # same inputs: loaded
+
+and cache.map(func, items) only calls func on the items it hasn't seen yet. For a bound method
+(e.g. NM.RungeKutta2) the object's attributes after the call are stored too, and restored when
+the result comes from the cache, so that NM.t_events etc. are the same either way. Changes that a
+function makes to its other arguments are not replayed. A function which reads some of its
+arguments as files (e.g. ecolab.checkpoint_setup) lists them in __fingerprint_files__; the
+contents of those files, not just their names, are then part of the keys of its calls and of the
+functools.partial of it.
+
+The entries are pickle files in one directory. When their total size goes over max_bytes the
+least recently used ones are deleted.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+import types
+import warnings
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def _file_hash(path,mtime):
+    with open(path,'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def code_version(module):
+    """
+    Returns a hash of the source file of a module (given by name or as a module), '' if it has none
+    """
+    if isinstance(module,str):
+        module = sys.modules.get(module)
+    path = getattr(module,'__file__',None)
+    if path is None or not os.path.exists(path):
+        return ''
+    return _file_hash(path,os.path.getmtime(path))
+
+
+def _file_contents(func,args=(),kwargs=None):
+    """
+    Returns {argument name: hash of the file's contents} for the arguments of a call of func
+    listed in func.__fingerprint_files__ (the ones which are missing, or not existing files, are
+    left out)
+    """
+    names = getattr(func,'__fingerprint_files__',())
+    if not names:
+        return {}
+    try:
+        arguments = inspect.signature(func).bind_partial(*args,**(kwargs or {})).arguments
+    except (TypeError,ValueError):
+        return {}
+    contents = {}
+    for name in names:
+        path = arguments.get(name)
+        if isinstance(path,(str,os.PathLike)) and os.path.isfile(path):
+            with open(path,'rb') as file:
+                contents[name] = hashlib.sha256(file.read()).hexdigest()
+    return contents
+
+
+def fingerprint(obj):
+    """
+    Returns a hash (hex string) of obj which only depends on its contents, e.g. two arrays
+    with the same dtype, shape and values, or two Environments with the same attributes, have
+    the same fingerprint. Raises TypeError if obj contains something it can't hash.
+    An object can choose what is hashed by defining a __fingerprint__() method returning it.
+    """
+    h = hashlib.sha256()
+    _update(h,obj,{})
+    return h.hexdigest()
+
+
+def _update(h,obj,seen):
+    """
+    Feeds a canonical description of obj into the hash h. seen maps the id of the containers
+    and objects already described to their position, so shared references and cycles are
+    described once and then referred to.
+    """
+    def tag(name,*parts):
+        h.update(('%s:%s;' % (name,','.join(str(p) for p in parts))).encode())
+
+    if obj is None or isinstance(obj,(bool,int,float,complex,str)):
+        tag(type(obj).__name__,repr(obj))
+        return
+    if isinstance(obj,bytes):
+        tag('bytes',len(obj))
+        h.update(obj)
+        return
+    if isinstance(obj,(np.ndarray,np.generic)):
+        obj = np.asarray(obj)
+        if obj.dtype.hasobject:
+            tag('objectarray',obj.shape)
+            _update(h,obj.tolist(),seen)
+        else:
+            tag('array',obj.dtype.str,obj.shape)
+            h.update(np.ascontiguousarray(obj).tobytes())
+        return
+
+    if id(obj) in seen:
+        tag('ref',seen[id(obj)])
+        return
+    seen[id(obj)] = len(seen)
+
+    if isinstance(obj,(list,tuple)):
+        tag(type(obj).__name__,len(obj))
+        for item in obj:
+            _update(h,item,seen)
+    elif isinstance(obj,dict):
+        tag('dict',len(obj))
+        for key,value in sorted(obj.items(),key=lambda item: fingerprint(item[0])):
+            _update(h,key,seen)
+            _update(h,value,seen)
+    elif isinstance(obj,(set,frozenset)):
+        tag('set',len(obj),*sorted(fingerprint(item) for item in obj))
+    elif isinstance(obj,functools.partial):
+        tag('partial')
+        _update(h,(obj.func,obj.args,obj.keywords),seen)
+        contents = _file_contents(obj.func,obj.args,obj.keywords)
+        if contents:
+            _update(h,contents,seen)
+    elif isinstance(obj,types.MethodType):
+        tag('method')
+        _update(h,(obj.__func__,obj.__self__),seen)
+    elif isinstance(obj,types.FunctionType):
+        #the name and module (with its source) identify the function; the code and the captured
+        #values are needed as well for lambdas and closures
+        tag('function',obj.__module__,obj.__qualname__,code_version(obj.__module__))
+        _update(h,(obj.__code__,obj.__defaults__,obj.__kwdefaults__,
+                   [cell.cell_contents for cell in obj.__closure__ or ()]),seen)
+    elif isinstance(obj,types.CodeType):
+        tag('code',obj.co_name)
+        h.update(obj.co_code)
+        _update(h,(obj.co_consts,obj.co_names),seen)
+    elif isinstance(obj,types.ModuleType):
+        tag('module',obj.__name__,code_version(obj))
+    elif isinstance(obj,(type,types.BuiltinFunctionType,np.ufunc)):
+        module = getattr(obj,'__module__',None) or ''
+        tag('named',type(obj).__name__,module,getattr(obj,'__qualname__',obj.__name__),code_version(module))
+    elif hasattr(obj,'__fingerprint__'):
+        tag('object',type(obj).__module__,type(obj).__qualname__,code_version(type(obj).__module__))
+        _update(h,obj.__fingerprint__(),seen)
+    elif isinstance(obj,np.random.Generator):
+        tag('Generator')
+        _update(h,obj.bit_generator.state,seen)
+    elif isinstance(obj,np.random.SeedSequence):
+        tag('SeedSequence')
+        _update(h,(obj.entropy,obj.spawn_key,obj.pool_size,obj.n_children_spawned),seen)
+    elif hasattr(obj,'__dict__') or hasattr(type(obj),'__slots__'):
+        tag('object',type(obj).__module__,type(obj).__qualname__,code_version(type(obj).__module__))
+        state = dict(getattr(obj,'__dict__',{}))
+        for name in getattr(type(obj),'__slots__',()):
+            if hasattr(obj,name):
+                state[name] = getattr(obj,name)
+        _update(h,state,seen)
+    else:
+        raise TypeError("can't fingerprint an object of type %s" % type(obj).__name__)
+
+
+class Cache:
+    """
+    A size-bounded, least recently used, disk cache of results (see the module's docstring).
+
+    Arguments:
+    - directory = where the entries are stored (created if needed)
+    - max_bytes = the total size the entries are kept under
+    - version = anything else the results depend on, e.g. a study name; it is part of every key
+    - enabled = if false, nothing is read or written (every call computes its result)
+
+    hits and misses count how many results were loaded and computed.
+    """
+    suffix = '.pkl'
+
+    def __init__(self,directory='.simcache',max_bytes=2**30,version=None,enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(directory,exist_ok=True)
+
+    def key(self,func,args=(),kwargs=None):
+        """
+        Returns the key of the result of func(*args, **kwargs)
+        """
+        contents = _file_contents(func,args,kwargs)
+        if contents:
+            return fingerprint((self.version,func,tuple(args),kwargs or {},contents))
+        return fingerprint((self.version,func,tuple(args),kwargs or {}))
+
+    def _path(self,key):
+        return os.path.join(self.directory,key+self.suffix)
+
+    def __contains__(self,key):
+        return self.enabled and os.path.exists(self._path(key))
+
+    def get(self,key,default=None):
+        """
+        Returns the value stored under key (and marks it as recently used), or default if there
+        is none or it can't be unpickled any more
+        """
+        if not self.enabled:
+            return default
+        path = self._path(key)
+        try:
+            with open(path,'rb') as file:
+                value = pickle.load(file)
+        except (OSError,EOFError,pickle.UnpicklingError,AttributeError,ImportError):
+            #unreadable, or stale: written by code whose classes have since moved or gone
+            return default
+        try:
+            os.utime(path)
+        except OSError: #evicted by another process in the meantime
+            pass
+        return value
+
+    def put(self,key,value):
+        """
+        Stores value under key, then evicts the least recently used entries if the cache is too
+        big. The file is written under a temporary name and renamed, so readers (other processes
+        included) never see a partial entry. Values which can't be pickled aren't stored (with
+        a warning).
+        """
+        if not self.enabled:
+            return
+        try:
+            data = pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError,TypeError,AttributeError) as error:
+            warnings.warn('result not cached, it cannot be pickled: %s' % error)
+            return
+        descriptor,temporary = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(descriptor,'wb') as file:
+            file.write(data)
+        os.replace(temporary,self._path(key))
+        self.evict()
+
+    def entries(self):
+        """
+        Returns a list of (last use time, size in bytes, path) of the entries, oldest first
+        """
+        result = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                result.append((stat.st_mtime,stat.st_size,entry.path))
+        return sorted(result)
+
+    def size(self):
+        """
+        Returns the total size (bytes) of the entries
+        """
+        return sum(size for used,size,path in self.entries())
+
+    def evict(self,max_bytes=None):
+        """
+        Deletes the least recently used entries until their total size is at most max_bytes
+        (default self.max_bytes). Returns the number of entries deleted.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for used,size,path in entries)
+        deleted = 0
+        for used,size,path in entries:
+            if total<=max_bytes:
+                break
+            try:
+                os.remove(path)
+                deleted += 1
+            except OSError:
+                pass
+            total -= size
+        return deleted
+
+    def clear(self):
+        """
+        Deletes every entry
+        """
+        return self.evict(0)
+
+    def call(self,func,*args,**kwargs):
+        """
+        Returns func(*args, **kwargs), from the cache if it was computed before with the same
+        inputs. For a bound method the object's attributes after the call are restored too.
+        """
+        key = self.key(func,args,kwargs)
+        owner = func.__self__ if isinstance(func,types.MethodType) else None
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            value,state = entry
+            if owner is not None:
+                owner.__dict__.update(state)
+            return value
+        self.misses += 1
+        value = func(*args,**kwargs)
+        self.put(key,(value,None if owner is None else dict(owner.__dict__)))
+        return value
+
+    def map(self,func,items,mapper=map):
+        """
+        Returns [func(item) for item in items], computing only the items which aren't in the
+        cache with mapper(func, missing items) (e.g. the map of a process pool) and storing them.
+        """
+        items = list(items)
+        keys = [self.key(func,(item,)) for item in items]
+        results = [self.get(key,self) for key in keys] #self marks a missing entry
+        missing = [i for i,result in enumerate(results) if result is self]
+        self.hits += len(items)-len(missing)
+        self.misses += len(missing)
+        if missing:
+            for i,result in zip(missing,mapper(func,[items[i] for i in missing])):
+                self.put(keys[i],result)
+                results[i] = result
+        return results
+
+    def memoize(self,func):
+        """
+        Decorator: the decorated function goes through the cache (see call)
+        """
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            return self.call(func,*args,**kwargs)
+        return wrapper
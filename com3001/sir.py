@@ -0,0 +1,1282 @@
+# -*- coding: utf-8 -*-
+
+## Integrators for systems of ODEs (Numerical_methods: Euler, Runge-Kutta, Dormand-Prince and
+## implicit methods, for single states or vectorized ensembles), the SIR model f, parameter
+## sweeps, a metapopulation SIR and a stochastic SIR. The study of the document is in
+## com3001.studies (python -m com3001 sir).
+
+import concurrent.futures
+import inspect
+import os
+
+import numpy as np
+
+
+## Butcher tableau of the Dormand-Prince 5(4) pair: stage coefficients A and C, 5th order
+## weights B, error weights E (5th minus 4th order, including the FSAL stage) and the matrix P
+## of the 4th order dense output (same coefficients as scipy's RK45).
+DORMAND_PRINCE=(
+    np.array([[0,0,0,0,0,0],
+              [1/5,0,0,0,0,0],
+              [3/40,9/40,0,0,0,0],
+              [44/45,-56/15,32/9,0,0,0],
+              [19372/6561,-25360/2187,64448/6561,-212/729,0,0],
+              [9017/3168,-355/33,46732/5247,49/176,-5103/18656,0],
+              [35/384,0,500/1113,125/192,-2187/6784,11/84]]),
+    np.array([0,1/5,3/10,4/5,8/9,1,1]),
+    np.array([35/384,0,500/1113,125/192,-2187/6784,11/84]),
+    np.array([-71/57600,0,71/16695,-71/1920,17253/339200,-22/525,1/40]),
+    np.array([[1,-8048581381/2820520608,8663915743/2820520608,-12715105075/11282082432],
+              [0,0,0,0],
+              [0,131558114200/32700410799,-68118460800/10900136933,87487479700/32700410799],
+              [0,-1754552775/470086768,14199869525/1410260304,-10690763975/1880347072],
+              [0,127303824393/49829197408,-318862633887/49829197408,701980252875/199316789632],
+              [0,-282668133/205662961,2019193451/616988883,-1453857185/822651844],
+              [0,40617522/29380423,-110615467/29380423,69997945/29380423]]))
+
+
+def _tableau(A,B,order):
+    
+    ## (A, B, C, order) of an explicit Runge-Kutta method from its rows of stage coefficients
+    ## (row i holds the i coefficients of stage i) and weights; C is the row sums of A.
+    
+    s=len(B)
+    A_full=np.zeros((s,s))
+    for i,row in enumerate(A):
+        A_full[i+1,:i+1]=row
+    return A_full, np.array(B,dtype=float), A_full.sum(axis=1), order
+
+
+## Butcher tableaux of the fixed-step explicit Runge-Kutta methods (see Numerical_methods.ExplicitRK),
+## each (A, B, C, order). They can be used by name wherever a fixed-step method is expected
+## (Stream, ToFile, sweep...). 'DP5' is the 5th order solution of Dormand-Prince with a fixed step.
+EXPLICIT_RK={
+    'Midpoint':_tableau([[1/2]],[0,1],2),
+    'Heun':_tableau([[1]],[1/2,1/2],2),
+    'RK3':_tableau([[1/2],[-1,2]],[1/6,2/3,1/6],3),                        ## Kutta's third order
+    'SSPRK3':_tableau([[1],[1/4,1/4]],[1/6,1/6,2/3],3),                    ## strong stability preserving
+    'RK4':_tableau([[1/2],[0,1/2],[0,0,1]],[1/6,1/3,1/3,1/6],4),           ## the classic one
+    'RK38':_tableau([[1/3],[-1/3,1],[1,-1,1]],[1/8,3/8,3/8,1/8],4),        ## Kutta's 3/8 rule
+    'RK5':_tableau([[1/4],[1/8,1/8],[0,-1/2,1],[3/16,0,0,9/16],[-3/7,2/7,12/7,-12/7,8/7]],
+                   [7/90,0,32/90,12/90,32/90,7/90],5),                     ## Butcher's fifth order
+    'DP5':_tableau([row[:i] for i,row in enumerate(DORMAND_PRINCE[0][1:6],1)],DORMAND_PRINCE[2],5)}
+
+
+def _accepts_out(f):
+    
+    ## True if f can be called as f(x,t,out=...).
+    
+    try:
+        return 'out' in inspect.signature(f).parameters
+    except (TypeError,ValueError):
+        return False
+
+
+def _times_path(path):
+    
+    ## 'run.npy' -> 'run_t.npy', the file that holds the times of a trajectory written by ToFile.
+    
+    root,ext=os.path.splitext(str(path))
+    return root+'_t'+(ext or '.npy')
+
+
+def _dense_output(x,h,Q,theta):
+    
+    ## State at t+theta*h inside a Dormand-Prince step from x, theta can hold one value per member.
+    
+    return x+h*(Q[0]*theta+Q[1]*theta**2+Q[2]*theta**3+Q[3]*theta**4)
+
+
+class Event:
+    
+    ## An event happens when g(x,t) crosses zero, for example
+    ##     Event(lambda x,t: x[1]-1e-9, terminal=True, direction=-1)   ## I falls below 1e-9
+    ##     Event(lambda x,t: f(x,t)[1], direction=-1)                  ## peak of I (dI/dt = 0)
+    ## direction=+1 (-1) only counts crossings where g increases (decreases), 0 counts both.
+    ## A terminal event stops the integration. For an ensemble, g receives the whole
+    ## (N_dim, N_members) block and returns one value per member; each member stops at its own
+    ## terminal event (and keeps that state) and the run ends once every member has stopped.
+    
+    def __init__(self,g,terminal=False,direction=0):
+        
+        self.g=g
+        self.terminal=terminal
+        self.direction=direction
+        
+    def __call__(self,x,t):
+        
+        return self.g(x,t)
+    
+    def crossed(self,g_old,g_new):
+        
+        ## Which members (boolean array) have g crossing zero in the allowed direction.
+        
+        up=(g_old<0)&(g_new>=0)
+        down=(g_old>0)&(g_new<=0)
+        if self.direction>0: return up
+        if self.direction<0: return down
+        return up|down
+
+
+class _EventMonitor:
+    
+    ## Watches a list of events during one integration. After every step it looks for sign
+    ## changes of each g, locates them on an interpolant of the step with the Illinois method
+    ## (a safeguarded regula falsi, vectorized over the members) and records them. Members are
+    ## handled as columns, a single state being an ensemble of one.
+    
+    def __init__(self,events,x,t):
+        
+        self.events=list(events)
+        self.scalar=np.ndim(x)==1
+        self.N_members=1 if self.scalar else np.shape(x)[1]
+        self.g=[self._values(event,x,t) for event in self.events]
+        self.stopped=np.zeros(self.N_members,dtype=bool)
+        self.x_stop=np.zeros((np.shape(x)[0],self.N_members))
+        self.t_stop=np.full(self.N_members,np.inf)
+        self.found=[[] for event in self.events]
+        
+    def _values(self,event,x,t):
+        
+        return np.broadcast_to(np.asarray(event(x,t),dtype=float),(self.N_members,))
+    
+    def _columns(self,x):
+        
+        return x[:,None] if self.scalar else x
+    
+    def _per_member(self,values):
+        
+        ## Converts a per-member array to what the integrator works with (a float for one state).
+        
+        return float(values[0]) if self.scalar else values
+        
+    def update(self,x,t_old,t,h,interp):
+        
+        ## x is the state at t = t_old+h, interp(theta) the state at t_old+theta*h.
+        
+        located=[]
+        first=np.full(self.N_members,np.inf)             ## earliest terminal event in this step
+        
+        for i,event in enumerate(self.events):
+            g_new=self._values(event,x,t)
+            hit=event.crossed(self.g[i],g_new)&~self.stopped
+            theta=self._locate(event,interp,t_old,h,self.g[i],g_new,hit) if hit.any() else None
+            located.append((hit,theta))
+            if event.terminal and theta is not None:
+                first=np.where(hit,np.minimum(first,theta),first)
+            self.g[i]=g_new
+        
+        for i,(hit,theta) in enumerate(located):
+            if theta is None: continue
+            hit=hit&(theta<=first)
+            states=self._columns(interp(self._per_member(np.where(hit,theta,1.0))))
+            for m in np.flatnonzero(hit):
+                self.found[i].append((t_old+theta[m]*h,states[:,m].copy(),m))
+        
+        newly=np.isfinite(first)
+        if newly.any():
+            states=self._columns(interp(self._per_member(np.where(newly,first,1.0))))
+            self.x_stop[:,newly]=states[:,newly]
+            self.t_stop[newly]=t_old+first[newly]*h
+            self.stopped|=newly
+    
+    def _locate(self,event,interp,t_old,h,g_a,g_b,hit):
+        
+        ## Returns theta in (0,1] with g just past zero, for the members in hit.
+        
+        a=np.zeros(self.N_members)
+        b=np.ones(self.N_members)
+        g_a=g_a.copy()
+        g_b=g_b.copy()
+        side=np.zeros(self.N_members,dtype=int)
+        
+        for iteration in range(100):
+            
+            active=hit&(b-a>1e-12)
+            if not active.any(): break
+            
+            with np.errstate(divide='ignore',invalid='ignore'):
+                theta=(a*g_b-b*g_a)/(g_b-g_a)
+            theta=np.where(np.isfinite(theta)&(theta>a)&(theta<b),theta,(a+b)/2)
+            
+            g=self._values(event,interp(self._per_member(theta)),self._per_member(t_old+theta*h))
+            
+            left=active&(np.sign(g)==np.sign(g_a))          ## the root is in [theta,b]
+            right=active&~left
+            
+            g_b=np.where(left&(side==1),g_b/2,g_b)          ## Illinois: halve the stale end
+            g_a=np.where(right&(side==-1),g_a/2,g_a)
+            a=np.where(left,theta,a)
+            g_a=np.where(left,g,g_a)
+            b=np.where(right,theta,b)
+            g_b=np.where(right,g,g_b)
+            side=np.where(left,1,np.where(right,-1,side))
+            
+            a=np.where(active&(g==0),theta,a)               ## landed exactly on the root
+        
+        return b
+    
+    def apply(self,nm):
+        
+        ## Puts the members that stopped back at their terminal event. Returns True once every
+        ## member has stopped (for a single state the state and time become those of the event).
+        
+        if not self.stopped.any(): return False
+        
+        if self.scalar:
+            nm.x[...]=self.x_stop[:,0]
+            nm.t=self.t_stop[0]
+            return True
+        
+        nm.x[:,self.stopped]=self.x_stop[:,self.stopped]
+        return bool(self.stopped.all())
+    
+    def hold(self,X,t_eval):
+        
+        ## Output at fixed times: a member that stopped keeps its event state; output after the
+        ## end of the run (all members stopped) is dropped.
+        
+        if not self.stopped.any(): return X, t_eval
+        
+        if self.scalar:
+            keep=t_eval<=self.t_stop[0]
+            return X[...,keep], t_eval[keep]
+        
+        after=self.stopped[:,None]&(t_eval[None,:]>self.t_stop[:,None])
+        X[:,after]=np.broadcast_to(self.x_stop[:,:,None],X.shape)[:,after]
+        if self.stopped.all():
+            keep=t_eval<=self.t_stop.max()
+            return X[...,keep], t_eval[keep]
+        return X, t_eval
+    
+    def store(self,nm):
+        
+        ## Saves the events found into nm.t_events, nm.x_events (one array per event, in order of
+        ## time within each step) and, for an ensemble, the member of each in nm.member_events.
+        
+        nm.t_events=[np.array([t for t,x,m in found]) for found in self.found]
+        nm.x_events=[np.array([x for t,x,m in found]).reshape(-1,len(self.x_stop)) for found in self.found]
+        nm.member_events=None if self.scalar else [np.array([m for t,x,m in found],dtype=int) for found in self.found]
+
+
+class Numerical_methods:
+    
+    def __init__(self,f,inplace=None,jac=None):  
+        
+        ## f can either return the derivative, f(x,t), or write it into a preallocated array,
+        ## f(x,t,out). The second form lets the integrators run without allocating new arrays
+        ## at every step. By default the form is detected from the signature of f.
+        ## jac(x,t) is the Jacobian of f, used by the implicit methods (BackwardEuler, BDF2):
+        ## shape (N_dim, N_dim), or (N_dim, N_dim, N_members) for an ensemble. Without it the
+        ## Jacobian is estimated by finite differences.
+        
+        self.f=f
+        self.inplace=_accepts_out(f) if inplace is None else inplace
+        self.jac=jac
+        self.newton_tol=1e-10            ## Newton iterations of the implicit methods stop when the
+        self.max_newton=10               ## update is below newton_tol*(1+|x|), or fail after max_newton
+        self.x=[]
+        self.t=[]
+        self.N_dim=[]
+        self.N_members=None
+        self.params={}
+        self.nfev=0
+        self.t_events=[]
+        self.x_events=[]
+        self.member_events=None
+        
+        
+    def __fingerprint__(self):
+        
+        ## What a cached run depends on (see simcache): the configuration and the state it starts
+        ## from, not the counters and events left by earlier runs, so that the same setup finds
+        ## the same entry however many times it was used.
+        
+        return {'f':self.f,'inplace':self.inplace,'jac':self.jac,'newton_tol':self.newton_tol,
+                'max_newton':self.max_newton,'x':self.x,'t':self.t,'params':self.params}
+        
+        
+    def Initialise(self,x_start,t_start,params=None):
+        
+        ## x_start is either a single initial condition, shape (N_dim,), or an ensemble of
+        ## initial conditions, shape (N_dim, N_members), with one column per member.
+        ## params are extra keyword arguments for f (e.g. {'b':0.5,'k':0.33}); each value can be
+        ## a scalar shared by all members or an array with one value per member.
+        
+        self.x=np.array(x_start,dtype=float)     ## a private copy, the integrators update it in place
+        self.N_dim=np.shape(self.x)[0]
+        self.N_members=np.shape(self.x)[1] if self.x.ndim>1 else None
+        self.t=t_start
+        self.params={} if params is None else dict(params)
+        self.nfev=0                      ## number of evaluations of f since the last Initialise
+        self.njev=0                      ## number of Jacobians computed (implicit methods)
+        self.nfact=0                     ## number of matrices I - c*dt*J inverted (implicit methods)
+        
+        for name,value in self.params.items():
+            if np.ndim(value)>0 and np.shape(value)!=np.shape(self.x)[1:]:
+                raise ValueError("parameter '%s' has shape %s, expected a scalar or shape %s"
+                                 % (name,np.shape(value),np.shape(self.x)[1:]))
+        
+        
+    
+    def RungeKutta2(self,dt,N_iter,decimate=1,events=None):
+        
+        ## For an ensemble X has shape (N_dim, N_members, N_iter): all members are advanced
+        ## together, so each step is a single vectorized call to f.
+        ## With decimate=k only every k-th step is kept (steps 0, k, 2k, ...).
+        ## events is an optional list of Event objects (see Event); the times and states at
+        ## which they happen are stored in self.t_events and self.x_events afterwards, and a
+        ## terminal event ends the run early (X and T are then shorter than N_iter).
+        
+        return self._run('RungeKutta2',dt,N_iter,decimate,events)
+    
+    
+    def Euler(self,dt,N_iter,decimate=1,events=None):
+        
+        ## Explicit (forward) Euler, x = x + dt*f(x,t). Same arguments and results as RungeKutta2.
+        
+        return self._run('Euler',dt,N_iter,decimate,events)
+    
+    
+    def RungeKutta4(self,dt,N_iter,decimate=1,events=None):
+        
+        ## The classic fourth order Runge-Kutta method, ExplicitRK with the 'RK4' tableau.
+        
+        return self._run('RK4',dt,N_iter,decimate,events)
+    
+    
+    def ExplicitRK(self,dt,N_iter,tableau='RK4',decimate=1,events=None):
+        
+        ## Fixed-step explicit Runge-Kutta method given by its Butcher tableau: the name of one of
+        ## EXPLICIT_RK ('RK3', 'RK4', 'RK5', ...) or a tuple (A, B, C) with A the (s, s) strictly
+        ## lower triangular stage matrix, B the s weights and C the s nodes. All methods share
+        ## one vectorized stage loop; a step costs s evaluations of f and its error goes down
+        ## like dt**order, so a higher order reaches a given accuracy with far fewer steps.
+        ## Same arguments and results as RungeKutta2.
+        
+        return self._run(tableau,dt,N_iter,decimate,events)
+    
+    
+    def BackwardEuler(self,dt,N_iter,decimate=1,events=None):
+        
+        ## Implicit Euler, x_new = x + dt*f(x_new,t+dt), for stiff problems: it is stable for any
+        ## dt on decaying solutions, where the explicit methods need dt below ~2/|fastest rate|.
+        ## Each step solves for x_new by Newton iterations with the matrix I - dt*J, which is
+        ## inverted once and reused for the following steps as long as the iterations converge
+        ## (J is recomputed, from jac or by finite differences, only when they stop converging).
+        ## Same arguments and results as RungeKutta2.
+        
+        return self._run('BackwardEuler',dt,N_iter,decimate,events)
+    
+    
+    def BDF2(self,dt,N_iter,decimate=1,events=None):
+        
+        ## Second order backward differentiation formula, x_new = 4/3 x - 1/3 x_old + 2/3 dt f(x_new),
+        ## solved like BackwardEuler (the first step is a BackwardEuler step). As stable as
+        ## BackwardEuler on stiff problems, but second order accurate.
+        
+        return self._run('BDF2',dt,N_iter,decimate,events)
+    
+    
+    def Stream(self,method,dt,N_iter,chunk_size=1000,decimate=1):
+        
+        ## Generator version of the fixed-step methods (method is the name, e.g. 'RungeKutta2').
+        ## It yields the trajectory in pieces (X_chunk, T_chunk) of at most chunk_size samples,
+        ## so only one chunk is held in memory however long the integration is.
+        ## decimate=k keeps every k-th step as in RungeKutta2.
+        
+        step=self._stepper(method,dt)
+        
+        X=np.zeros(np.shape(self.x)+(chunk_size,))
+        T=np.zeros([chunk_size])
+        X[...,0]=self.x
+        T[0]=self.t
+        j=1
+        
+        for n in range(1,N_iter):
+            
+            step()
+            
+            if n%decimate==0:
+                if j==chunk_size:
+                    yield X, T
+                    X=np.zeros(np.shape(self.x)+(chunk_size,))
+                    T=np.zeros([chunk_size])
+                    j=0
+                X[...,j]=self.x
+                T[j]=self.t
+                j+=1
+        
+        yield X[...,:j], T[:j]
+    
+    
+    def ToFile(self,path,method,dt,N_iter,chunk_size=1000,decimate=1):
+        
+        ## Runs a fixed-step method and writes the trajectory straight into the .npy file 'path'
+        ## (memory mapped, same layout as the X returned by RungeKutta2); the times go to a
+        ## second file with '_t' added to the name. Returns both as read-only memory maps.
+        
+        path_T=_times_path(path)
+        n_out=(N_iter-1)//decimate+1
+        
+        X=np.lib.format.open_memmap(path,mode='w+',dtype=float,shape=np.shape(self.x)+(n_out,))
+        T=np.lib.format.open_memmap(path_T,mode='w+',dtype=float,shape=(n_out,))
+        
+        start=0
+        for X_chunk,T_chunk in self.Stream(method,dt,N_iter,chunk_size,decimate):
+            stop=start+len(T_chunk)
+            X[...,start:stop]=X_chunk
+            T[start:stop]=T_chunk
+            start=stop
+        
+        X.flush()
+        T.flush()
+        del X, T
+        
+        return np.load(path,mmap_mode='r'), np.load(path_T,mmap_mode='r')
+    
+    
+    def _run(self,method,dt,N_iter,decimate=1,events=None):
+        
+        ## Fixed-step integration keeping the whole (possibly decimated) trajectory in memory.
+        
+        step=self._stepper(method,dt)
+        
+        n_out=(N_iter-1)//decimate+1
+        X=np.zeros(np.shape(self.x)+(n_out+1,))      ## one spare column for a terminal event
+        T=np.zeros([n_out+1])
+        X[...,0]=self.x
+        T[0]=self.t
+        
+        monitor=_EventMonitor(events,self.x,self.t) if events else None
+        if monitor is not None:
+            partial=self._partial_step(method)
+            x_prev=np.empty_like(self.x)
+        
+        for n in range(1,N_iter):
+            
+            if monitor is not None:
+                x_prev[...]=self.x
+                t_prev=self.t
+            
+            step()
+            
+            if monitor is not None:
+                monitor.update(self.x,t_prev,self.t,dt,lambda theta: partial(x_prev,t_prev,theta*dt))
+                if monitor.apply(self):
+                    last=(n-1)//decimate+1                ## every member has stopped
+                    X[...,last]=self.x
+                    T[last]=self.t
+                    n_out=last+1
+                    break
+            
+            if n%decimate==0:
+                X[...,n//decimate]=self.x
+                T[n//decimate]=self.t
+        
+        if monitor is not None:
+            monitor.store(self)
+        
+        return X[...,:n_out], T[:n_out]
+    
+    
+    def _stepper(self,method,dt):
+        
+        ## Returns step(), which advances self.x (in place) and self.t by one step of size dt.
+        
+        ## method is a name, or a Butcher tableau (A, B, C) for ExplicitRK.
+        
+        if not isinstance(method,str):
+            return self._tableau_step(dt,method)
+        
+        steppers={'Euler':self._Euler_step,
+                  'RungeKutta2':self._RungeKutta2_step,
+                  'BackwardEuler':lambda dt: self._implicit_step(dt,order=1),
+                  'BDF2':lambda dt: self._implicit_step(dt,order=2)}
+        for name,tableau in EXPLICIT_RK.items():
+            steppers[name]=lambda dt,tableau=tableau: self._tableau_step(dt,tableau)
+        
+        if method not in steppers:
+            raise ValueError("unknown fixed-step method '%s', expected one of %s"
+                             % (method,sorted(steppers)))
+        
+        return steppers[method](dt)
+    
+    
+    def _partial_step(self,method):
+        
+        ## Returns partial(x0,t0,h): the state after one step of size h from x0 (h can hold one
+        ## value per member). It is used to locate events inside a step.
+        
+        ## (For the implicit methods it is a BackwardEuler step, since BDF2 also needs x_old.)
+        
+        if not isinstance(method,str) or method in EXPLICIT_RK:
+            tableau=EXPLICIT_RK.get(method) if isinstance(method,str) else method
+            return lambda x0,t0,h: self._tableau_partial(x0,t0,h,tableau)
+        
+        partials={'Euler':self._Euler_partial,
+                  'RungeKutta2':self._RungeKutta2_partial,
+                  'BackwardEuler':self._implicit_partial,
+                  'BDF2':self._implicit_partial}
+        return partials[method]
+    
+    
+    def _Euler_partial(self,x0,t0,h):
+        
+        self.nfev+=1
+        return x0+h*self._evaluate(x0,t0)
+    
+    
+    def _Euler_step(self,dt):
+        
+        rhs=self._rhs()
+        x=self.x
+        k=np.empty_like(x)
+        
+        def step():
+            
+            nonlocal x,k                           ## updated in place
+            
+            rhs(x,self.t,k)
+            k*=dt
+            x+=k
+            
+            self.t=self.t+dt
+            self.nfev+=1
+        
+        return step
+    
+    
+    def _implicit_partial(self,x0,t0,h):
+        
+        ## One BackwardEuler step of size h (one value per member for an ensemble) from x0,
+        ## with a fresh Jacobian.
+        
+        y=np.array(x0,dtype=float)
+        M_inv=self._newton_matrix(y,t0+h,h)
+        for i in range(self.max_newton):
+            G=y-x0-h*self._evaluate(y,t0+h)
+            self.nfev+=1
+            delta=self._solve(M_inv,G)
+            y-=delta
+            if np.max(np.abs(delta)/(1+np.abs(y)))<self.newton_tol:
+                break
+        return y
+    
+    
+    def _implicit_step(self,dt,order):
+        
+        ## BackwardEuler (order 1) or BDF2 (order 2) step. Both solve
+        ##     G(y) = y - (a*x + b*x_old) - c*dt*f(y,t+dt) = 0
+        ## by simplified Newton iterations y -= M_inv G(y), with M_inv the inverse of I - c*dt*J
+        ## kept from step to step. If the iterations stop converging, the step is tried again with
+        ## full Newton iterations (J and M_inv recomputed at every iteration), and the last M_inv
+        ## is kept for the following steps.
+        
+        rhs=self._rhs()
+        x=self.x
+        x_old=np.empty_like(x)
+        y=np.empty_like(x)
+        fy=np.empty_like(x)
+        G=np.empty_like(x)
+        cache={'c':None,'M_inv':None}
+        n_steps=0
+        
+        def step():
+            
+            nonlocal n_steps,y,G                   ## y and G are updated in place
+            a,b,c=(4/3,-1/3,2/3) if (order==2 and n_steps>0) else (1,0,1)
+            t_new=self.t+dt
+            base=a*x+b*x_old if b!=0 else x
+            
+            for full in (False,True):
+                if cache['c']!=c:
+                    cache['M_inv']=self._newton_matrix(x,t_new,c*dt)
+                    cache['c']=c
+                
+                y[...]=x
+                converged=False
+                previous=np.inf
+                for i in range(self.max_newton):
+                    if full:
+                        cache['M_inv']=self._newton_matrix(y,t_new,c*dt)
+                    rhs(y,t_new,fy)
+                    self.nfev+=1
+                    np.multiply(fy,-c*dt,out=G)    ## G = y - base - c*dt*f(y)
+                    G+=y
+                    G-=base
+                    delta=self._solve(cache['M_inv'],G)
+                    y-=delta
+                    size=np.max(np.abs(delta)/(1+np.abs(y)))
+                    if size<self.newton_tol:
+                        converged=True
+                        break
+                    if size>0.9*previous and not full:     ## too slow with this M_inv
+                        break
+                    previous=size
+                
+                if converged:
+                    break
+                if full:
+                    raise RuntimeError('Newton iterations did not converge at t=%g, try a smaller dt' % t_new)
+            
+            x_old[...]=x
+            x[...]=y
+            self.t=t_new
+            n_steps+=1
+        
+        return step
+    
+    
+    def _jacobian(self,x,t):
+        
+        ## Jacobian of f at x, from jac if given or else by forward differences (one extra
+        ## evaluation of f per component; for an ensemble all members are done together).
+        
+        self.njev+=1
+        if self.jac is not None:
+            return np.asarray(self.jac(x,t,**self.params),dtype=float)
+        
+        f0=self._evaluate(x,t)
+        J=np.empty((self.N_dim,)+np.shape(x))
+        for j in range(self.N_dim):
+            h=np.sqrt(np.finfo(float).eps)*np.maximum(1,np.abs(x[j]))
+            x_h=np.array(x,dtype=float)
+            x_h[j]+=h
+            J[:,j]=(self._evaluate(x_h,t)-f0)/h
+        self.nfev+=self.N_dim+1
+        return J
+    
+    
+    def _newton_matrix(self,x,t,h):
+        
+        ## Inverse of I - h*J(x,t), shape (N_dim, N_dim), or (N_members, N_dim, N_dim) for an
+        ## ensemble (h can then hold one value per member).
+        
+        J=self._jacobian(x,t)
+        self.nfact+=1
+        if J.ndim>2:
+            J=np.moveaxis(J,-1,0)*np.reshape(h,(-1,1,1))
+        else:
+            J=J*h
+        return np.linalg.inv(np.eye(self.N_dim)-J)
+    
+    
+    def _solve(self,M_inv,G):
+        
+        ## M_inv applied to G (for an ensemble, each member's matrix to its own column).
+        
+        if M_inv.ndim>2:
+            return np.einsum('mij,jm->im',M_inv,G)
+        return M_inv@G
+    
+    
+    def _RungeKutta2_partial(self,x0,t0,h):
+        
+        k1=self._evaluate(x0,t0)
+        k2=self._evaluate(x0+h*k1,t0+h)
+        self.nfev+=2
+        
+        return x0+h*(k1+k2)/2
+    
+    
+    def _RungeKutta2_step(self,dt):
+        
+        ## The stages live in preallocated workspaces and the state is updated in place, so with
+        ## an in-place f a step does not allocate any array.
+        
+        rhs=self._rhs()
+        x=self.x
+        k1=np.empty_like(x)
+        k2=np.empty_like(x)
+        x_tmp=np.empty_like(x)
+        
+        def step():
+            
+            nonlocal x,k1,x_tmp                    ## updated in place, += does not create new arrays
+            
+            rhs(x,self.t,k1)
+            np.multiply(k1,dt,out=x_tmp)
+            x_tmp+=x
+            rhs(x_tmp,self.t+dt,k2)    
+            
+            k1+=k2                                 ## x = x + dt*(k1+k2)/2
+            k1*=dt
+            k1/=2
+            x+=k1
+            
+            self.t=self.t+dt
+            self.nfev+=2
+        
+        return step
+    
+    
+    def _tableau_partial(self,x0,t0,h,tableau):
+        
+        A,B,C=tableau[:3]
+        K=[]
+        for i in range(len(B)):
+            x_stage=x0+h*sum(A[i,j]*K[j] for j in range(i) if A[i,j]!=0)
+            K.append(self._evaluate(x_stage,t0+C[i]*h))
+        self.nfev+=len(B)
+        
+        return x0+h*sum(b*k for b,k in zip(B,K) if b!=0)
+    
+    
+    def _tableau_step(self,dt,tableau):
+        
+        ## The stage loop shared by every explicit tableau, with the same preallocated
+        ## workspaces and in-place updates as _RungeKutta2_step.
+        
+        A,B,C=[np.asarray(a,dtype=float) for a in tableau[:3]]
+        if A.shape!=(len(B),len(B)) or len(C)!=len(B) or np.any(np.triu(A)!=0):
+            raise ValueError("an explicit tableau needs A of shape (s, s), strictly lower triangular, "
+                             "and B and C of length s")
+        
+        rhs=self._rhs()
+        x=self.x
+        K=np.zeros((len(B),)+np.shape(x))
+        x_stage=np.empty_like(x)
+        work=np.empty_like(x)
+        
+        def step():
+            
+            nonlocal x                             ## updated in place
+            
+            rhs(x,self.t,K[0])
+            for i in range(1,len(B)):
+                self._combine(x,dt,A[i,:i],K,x_stage,work)
+                rhs(x_stage,self.t+C[i]*dt,K[i])
+            self._combine(x,dt,B,K,x,work)         ## x = x + dt*sum(B*K)
+            
+            self.t=self.t+dt
+            self.nfev+=len(B)
+        
+        return step
+    
+    
+    def DormandPrince(self,t_end,rtol=1e-6,atol=1e-9,t_eval=None,dt=None,max_steps=100000,events=None):
+        
+        ## Adaptive Runge-Kutta method of Dormand and Prince (order 5 with an embedded order 4
+        ## error estimate). The step size is chosen automatically so that the estimated local error
+        ## stays below atol + rtol*|x| in every component (and for every member of an ensemble,
+        ## which share the same steps). Few steps are taken where the solution is flat.
+        ##
+        ## If t_eval is given (times between the current t and t_end, ValueError otherwise), the
+        ## solution is returned at those times using the dense output (a 4th order interpolant
+        ## built from the stages of each step); otherwise it is returned
+        ## at the accepted steps. dt optionally sets the first step size.
+        ## events works as in RungeKutta2, with the events located on the dense output.
+        ## RuntimeError is raised if max_steps steps are not enough to reach t_end, or if the step
+        ## size has to go below the spacing of floats at t (e.g. a solution which blows up).
+        
+        A,C,B,E,P=DORMAND_PRINCE
+        
+        rhs=self._rhs()
+        x=self.x
+        K=np.zeros((7,)+np.shape(x))           ## stages, K[6] is f at the end of the step
+        x_new=np.empty_like(x)
+        x_stage=np.empty_like(x)
+        work=np.empty_like(x)
+        
+        rhs(x,self.t,K[0])
+        self.nfev+=1
+        
+        if dt is None:
+            dt=self._initial_step(K[0],5,rtol,atol)
+        
+        if t_eval is not None:
+            t_eval=np.asarray(t_eval,dtype=float)
+            if np.any(t_eval<self.t) or np.any(t_eval>t_end):
+                raise ValueError("DormandPrince: t_eval must lie within [t_start, t_end] = [%g, %g]" % (self.t,t_end))
+            X=np.zeros(np.shape(self.x)+(len(t_eval),))
+            X[...,t_eval<=self.t]=x[...,None]
+        else:
+            X=[np.copy(x)]
+            T=[self.t]
+        
+        monitor=_EventMonitor(events,x,self.t) if events else None
+        
+        n_steps=0
+        while self.t<t_end:
+            
+            if n_steps>=max_steps:
+                raise RuntimeError("DormandPrince: reached max_steps=%d before t_end" % max_steps)
+            n_steps+=1
+            
+            h=min(dt,t_end-self.t)
+            
+            for i in range(1,7):
+                self._combine(x,h,A[i,:i],K,x_stage,work)
+                rhs(x_stage,self.t+C[i]*h,K[i])
+            self.nfev+=6
+            
+            x_new[...]=x_stage                  ## the last stage is evaluated at x + h*sum(B*K)
+            
+            self._combine(0,h,E,K,x_stage,work)  ## local error estimate, scaled by the tolerance
+            np.maximum(np.abs(x),np.abs(x_new),out=work)
+            work*=rtol
+            work+=atol
+            x_stage/=work
+            err=self._error_norm(x_stage)
+            
+            if not err<=1:                      ## rejected (a NaN error too): retry with a smaller step
+                dt=h*max(0.2,0.9*err**-0.2) if np.isfinite(err) else 0.2*h
+                if dt<10*np.spacing(self.t):
+                    raise RuntimeError("DormandPrince: the step size fell below the spacing of t at t=%g "
+                                       "(the solution may blow up there)" % self.t)
+                continue
+            
+            t_new=t_end if h==t_end-self.t else self.t+h
+            Q=np.tensordot(P.T,K,1)                 ## dense output coefficients, shape (4,)+shape of x
+            
+            t_stop=t_new
+            if monitor is not None:
+                x_old=np.copy(x)
+                monitor.update(x_new,self.t,t_new,h,lambda theta: _dense_output(x_old,h,Q,theta))
+                if monitor.scalar and monitor.stopped[0]:
+                    t_stop=monitor.t_stop[0]
+            
+            if t_eval is not None:
+                inside=(t_eval>self.t)&(t_eval<=t_stop)
+                if np.any(inside):
+                    theta=(t_eval[inside]-self.t)/h
+                    powers=np.cumprod(np.tile(theta,(4,1)),axis=0)          ## theta, theta^2, ...
+                    X[...,inside]=x[...,None]+h*np.tensordot(Q,powers,(0,0))
+            
+            x[...]=x_new
+            self.t=t_new
+            K[0]=K[6]                           ## first-same-as-last: K[6] is f(x_new,t_new)
+            
+            if monitor is not None and monitor.stopped.any():
+                done=monitor.apply(self)
+                if done:
+                    if t_eval is None:
+                        X.append(np.copy(x))
+                        T.append(self.t)
+                    break
+                rhs(x,self.t,K[0])              ## some members were put back at their event
+                self.nfev+=1
+            
+            if t_eval is None:
+                X.append(np.copy(x))
+                T.append(self.t)
+            
+            dt=h*(10 if err==0 else min(10,0.9*err**-0.2))
+        
+        if monitor is not None:
+            monitor.store(self)
+        
+        if t_eval is not None:
+            if monitor is not None:
+                X,t_eval=monitor.hold(X,t_eval)
+            return X, t_eval
+        return np.stack(X,axis=-1), np.array(T)
+    
+    
+    def _evaluate(self,x,t):
+        
+        ## f(x,t) as a new array, whichever convention f follows (outside the hot loops).
+        
+        if self.inplace:
+            return self.f(x,t,out=np.empty_like(x),**self.params)
+        return np.asarray(self.f(x,t,**self.params),dtype=float)
+    
+    
+    def _rhs(self):
+        
+        ## Returns rhs(x,t,out), which stores f(x,t) in out whichever convention f follows.
+        
+        f=self.f
+        params=self.params
+        
+        if self.inplace:
+            if params:
+                return lambda x,t,out: f(x,t,out=out,**params)
+            return lambda x,t,out: f(x,t,out=out)
+        
+        def rhs(x,t,out):
+            out[...]=f(x,t,**params)
+        return rhs
+    
+    
+    def _combine(self,x,h,coefficients,K,out,work):
+        
+        ## out = x + h*sum(coefficients[j]*K[j]), computed in place (zero coefficients are skipped).
+        
+        out[...]=x
+        for j,c in enumerate(coefficients):
+            if c!=0:
+                np.multiply(K[j],h*c,out=work)
+                out+=work
+    
+    
+    def _error_norm(self,v):
+        
+        ## RMS norm over the components of the state; for an ensemble the worst member is used
+        ## so that one step size suits every member.
+        
+        return np.max(np.sqrt(np.mean(v**2,axis=0)))
+    
+    
+    def _initial_step(self,f0,order,rtol,atol):
+        
+        ## Starting step size from the algorithm of Hairer, Norsett and Wanner.
+        
+        scale=atol+rtol*np.abs(self.x)
+        d0=self._error_norm(self.x/scale)
+        d1=self._error_norm(f0/scale)
+        h0=1e-6 if (d0<1e-5 or d1<1e-5) else 0.01*d0/d1
+        
+        f1=self._evaluate(self.x+h0*f0,self.t+h0)
+        self.nfev+=1
+        d2=self._error_norm((f1-f0)/scale)/h0
+        
+        if max(d1,d2)<=1e-15:
+            h1=max(1e-6,h0*1e-3)
+        else:
+            h1=(0.01/max(d1,d2))**(1/(order+1))
+        
+        return min(100*h0,h1)
+
+
+
+def f(x,t,b=0.5,k=0.33,out=None):    
+    
+    ## b = infection rate, k = recovery rate. x can be a single state (3,) or an
+    ## ensemble (3, N_members), in which case b and k can also be given per member.
+    ## If out is given the derivative is written into it without allocating new arrays.
+    
+    
+    z=np.zeros(np.shape(x)) if out is None else out
+    
+    if np.ndim(x)==1:                 ## a single state: scalar arithmetic is the cheapest
+        infection=b*x[0]*x[1]
+        recovery=k*x[1]
+        z[0]=-infection
+        z[1]=infection-recovery
+        z[2]=recovery
+        return z
+    
+    np.multiply(x[0],x[1],out=z[1])
+    z[1]*=b                           ## b*S*I
+    np.multiply(x[1],k,out=z[2])      ## k*I
+    np.negative(z[1],out=z[0])
+    z[1]-=z[2]
+    
+    return z
+
+
+def sweep(grid,x_start,dt=0.2,N_iter=1000,rhs=f,method='RungeKutta2',processes=None,batch_size=2000,t_start=0):
+    
+    ## Parameter sweep for compartment models whose first two components are S and I (e.g. f).
+    ## grid maps parameter names of rhs to lists of values, e.g. {'b':np.linspace(0.1,1,100),
+    ## 'k':[0.2,0.33]}; every combination is run from every initial condition in x_start (a single
+    ## state or a list of states). The points are integrated in vectorized batches of batch_size
+    ## ensemble members, spread over a pool of 'processes' worker processes (None = one per CPU,
+    ## 1 = no pool). The trajectories are streamed and reduced on the fly, so memory stays small.
+    ##
+    ## Returns a structured array with one row per point: the parameters, 'ic' (index of the
+    ## initial condition), 'peak_I', 't_peak' (time of the peak) and 'final_size' (the fraction
+    ## of the population infected during the run, S(0)-S(end)).
+    
+    names=list(grid)
+    values=np.meshgrid(*[np.asarray(grid[name],dtype=float) for name in names],indexing='ij')
+    values=[v.ravel() for v in values]
+    n_params=len(values[0]) if names else 1
+    
+    x_start=np.array(x_start,dtype=float)
+    if x_start.ndim==1: x_start=x_start[None,:]
+    n_ic=len(x_start)
+    
+    table=np.zeros(n_params*n_ic,dtype=[(name,float) for name in names]
+                   +[('ic',int),('peak_I',float),('t_peak',float),('final_size',float)])
+    for name,v in zip(names,values):
+        table[name]=np.tile(v,n_ic)
+    table['ic']=np.repeat(np.arange(n_ic),n_params)
+    
+    jobs=[]
+    for start in range(0,len(table),batch_size):
+        rows=table[start:start+batch_size]
+        params={name:rows[name] for name in names}
+        jobs.append((rhs,method,x_start[rows['ic']].T,t_start,params,dt,N_iter))
+    
+    def store(results):
+        start=0
+        for peak_I,t_peak,final_size in results:
+            stop=start+len(peak_I)
+            table['peak_I'][start:stop]=peak_I
+            table['t_peak'][start:stop]=t_peak
+            table['final_size'][start:stop]=final_size
+            start=stop
+    
+    if processes==1:
+        store(map(_sweep_batch,jobs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:   ## shut down even if a batch raises
+            store(pool.map(_sweep_batch,jobs))
+    
+    return table
+
+
+def _sweep_batch(job):
+    
+    ## Runs one batch of a sweep as an ensemble and reduces it to the summary metrics.
+    
+    rhs,method,x_start,t_start,params,dt,N_iter=job
+    
+    NM=Numerical_methods(rhs)
+    NM.Initialise(x_start,t_start,params)
+    
+    peak_I=np.full(NM.N_members,-np.inf)
+    t_peak=np.zeros(NM.N_members)
+    members=np.arange(NM.N_members)
+    
+    for X,T in NM.Stream(method,dt,N_iter,chunk_size=100):
+        j=np.argmax(X[1],axis=1)
+        higher=X[1,members,j]>peak_I
+        peak_I[higher]=X[1,members,j][higher]
+        t_peak[higher]=T[j][higher]
+    
+    return peak_I, t_peak, x_start[0]-NM.x[0]
+
+
+class Mobility:
+    
+    ## Rates at which people move between regions, as a sparse matrix in CSR form: row i lists
+    ## the regions j that people leave region i for (indices[indptr[i]:indptr[i+1]]) and the
+    ## rate of each move (rates[...], per unit time, per person in region i). Only the links that
+    ## exist are stored, so thousands of regions with a few links each cost little.
+    
+    def __init__(self,indptr,indices,rates,N_regions):
+        
+        self.indptr=np.asarray(indptr,dtype=np.int64)
+        self.indices=np.asarray(indices,dtype=np.int64)
+        self.rates=np.asarray(rates,dtype=float)
+        self.N_regions=N_regions
+        
+        ## the source region of every link, and the total rate of leaving each region
+        self.sources=np.repeat(np.arange(N_regions),np.diff(self.indptr))
+        self.out_rate=np.bincount(self.sources,weights=self.rates,minlength=N_regions)
+        
+        
+    @classmethod
+    def from_edges(cls,source,target,rate,N_regions):
+        
+        ## From a list of links: people move from source[e] to target[e] at rate[e].
+        
+        source=np.asarray(source,dtype=np.int64)
+        order=np.argsort(source,kind='stable')
+        indptr=np.concatenate([[0],np.cumsum(np.bincount(source,minlength=N_regions))])
+        return cls(indptr,np.asarray(target)[order],np.broadcast_to(rate,source.shape)[order],N_regions)
+    
+    
+    @classmethod
+    def from_dense(cls,M):
+        
+        ## From a full N_regions x N_regions matrix of rates (the diagonal is ignored).
+        
+        M=np.array(M,dtype=float)
+        np.fill_diagonal(M,0)
+        source,target=np.nonzero(M)
+        return cls.from_edges(source,target,M[source,target],len(M))
+
+
+class MetapopulationSIR:
+    
+    ## SIR right hand side for many regions linked by a Mobility: the state x has shape
+    ## (3, N_regions), one column of S, I, R per region (the same layout as an ensemble, so it
+    ## plugs straight into Numerical_methods), and every region follows f with its own b and k
+    ## (scalars or one value per region) plus the movement of people in and out.
+    ## It follows the out= convention of f, reusing its workspaces from call to call.
+    
+    def __init__(self,mobility):
+        
+        self.mobility=mobility
+        self.work=None
+        self.targets=None
+        self.workspace_for=None          ## (mobility, shape of x) the workspaces were made for
+        
+        
+    def __fingerprint__(self):
+        
+        ## The workspaces are scratch space, only the mobility matters (see simcache).
+        
+        return self.mobility
+        
+        
+    def __call__(self,x,t,b=0.5,k=0.33,out=None):
+        
+        z=np.zeros(np.shape(x)) if out is None else out
+        m=self.mobility
+        
+        ## the workspaces are made again if the mobility is replaced or x changes shape
+        if self.workspace_for is None or self.workspace_for[0] is not m or self.workspace_for[1]!=np.shape(x):
+            self.work=np.empty((np.shape(x)[0],len(m.rates)))
+            self.targets=(m.indices+m.N_regions*np.arange(np.shape(x)[0])[:,None]).ravel()
+            self.outflow=np.empty(np.shape(x))
+            self.workspace_for=(m,np.shape(x))
+        
+        ## movement: the flow along every link, summed per target region with one bincount
+        np.multiply(x[:,m.sources],m.rates,out=self.work)
+        z[...]=np.bincount(self.targets,weights=self.work.ravel(),minlength=z.size).reshape(z.shape)
+        np.multiply(x,m.out_rate,out=self.outflow)
+        z-=self.outflow
+        
+        ## local SIR dynamics, as in f
+        infection=self.outflow[0]
+        np.multiply(x[0],x[1],out=infection)
+        infection*=b
+        recovery=self.outflow[1]
+        np.multiply(x[1],k,out=recovery)
+        z[0]-=infection
+        z[1]+=infection
+        z[1]-=recovery
+        z[2]+=recovery
+        
+        return z
+    
+    
+    def jacobian(self,x,t,b=0.5,k=0.33):
+        
+        ## The 3 x 3 Jacobian of each region, shape (3, 3, N_regions), for the implicit methods
+        ## (Numerical_methods(model, jac=model.jacobian)). The movement into a region from the
+        ## others is left out, so each region's block is independent; the Newton iterations still
+        ## converge unless movement is much faster than 1/dt.
+        
+        S,I=x[0],x[1]
+        J=np.zeros((3,3)+np.shape(S))
+        J[0,0]=-b*I
+        J[0,1]=-b*S
+        J[1,0]=b*I
+        J[1,1]=b*S-k
+        J[2,1]=k
+        for c in range(3):
+            J[c,c]-=self.mobility.out_rate
+        return J
+
+
+def stochastic_SIR(x_start,t_end,N_replicates=1000,population=7.9e6,b=0.5,k=0.33,tau=0.05,leap_threshold=20,
+                   t_eval=None,seed=None,max_iter=10**7):
+    
+    ## Stochastic counterpart of f: the S, I, R of a population of 'population' people are whole
+    ## numbers and each infection (rate b*S*I/population) and recovery (rate k*I) happens at a
+    ## random time. N_replicates independent runs are advanced together with array operations.
+    ## Each run uses the exact stochastic simulation algorithm (Gillespie, one event at a time)
+    ## while few events are expected in a time tau, and switches to binomial tau-leaping
+    ## (steps of tau, with Binomial(S, 1-exp(-b*I/population*tau)) infections and
+    ## Binomial(I, 1-exp(-k*tau)) recoveries, never negative) once more than leap_threshold are.
+    ## x_start holds the starting fractions of S, I, R as for f; b and k can be scalars or
+    ## one value per replicate. seed seeds the random number generator.
+    ##
+    ## Returns a structured array with one row per replicate: 'final_size' (fraction of the
+    ## population infected during the run), 'peak_I' and 't_peak' (largest fraction infected at
+    ## once, and when), 't_extinct' (when the infection died out, inf if it hadn't by t_end);
+    ## and, if t_eval (a sorted array of times) is given, the fractions at those times in an
+    ## array of shape (3, N_replicates, len(t_eval)), otherwise None.
+    
+    rng=np.random.default_rng(seed)
+    n=N_replicates
+    counts=np.rint(np.asarray(x_start,dtype=float)*population).astype(np.int64)
+    S=np.full(n,counts[0])
+    I=np.full(n,counts[1])
+    R=np.full(n,counts[2])
+    b=np.broadcast_to(np.asarray(b,dtype=float),(n,))
+    k=np.broadcast_to(np.asarray(k,dtype=float),(n,))
+    t=np.zeros(n)
+    
+    peak_I=I.copy()
+    t_peak=np.zeros(n)
+    t_extinct=np.where(I==0,0.,np.inf)
+    
+    if t_eval is not None:
+        t_eval=np.asarray(t_eval,dtype=float)
+        X=np.zeros((3,n,len(t_eval)))
+        next_eval=np.zeros(n,dtype=int)          ## index of the next time of t_eval to fill in
+    
+    def record(idx,t_next):
+        ## the state of the runs idx holds until t_next: fill in the times of t_eval before it
+        while True:
+            due=next_eval[idx]<len(t_eval)
+            due[due]=t_eval[next_eval[idx[due]]]<t_next[due]
+            if not due.any(): return
+            r=idx[due]
+            X[:,r,next_eval[r]]=np.array([S[r],I[r],R[r]])/population
+            next_eval[r]+=1
+    
+    active=(I>0)&(t<t_end)
+    for iteration in range(max_iter):
+        idx=np.flatnonzero(active)
+        if len(idx)==0: break
+        
+        infection=b[idx]*S[idx]*I[idx]/population
+        recovery=k[idx]*I[idx]
+        total=infection+recovery
+        leap=total*tau>=leap_threshold
+        
+        ## exact steps: the time to the next event, then which event it is
+        r=idx[~leap]
+        if len(r)>0:
+            with np.errstate(divide='ignore'):
+                t_next=t[r]+rng.exponential(1/total[~leap])
+            late=t_next>=t_end                     ## no more events before t_end
+            t_next[late]=t_end
+            if t_eval is not None: record(r,t_next)
+            t[r]=t_next
+            event=r[~late]
+            infected=rng.random(len(event))*total[~leap][~late]<infection[~leap][~late]
+            S[event[infected]]-=1
+            I[event[infected]]+=1
+            I[event[~infected]]-=1
+            R[event[~infected]]+=1
+        
+        ## tau-leaping steps
+        r=idx[leap]
+        if len(r)>0:
+            h=np.minimum(tau,t_end-t[r])
+            if t_eval is not None: record(r,t[r]+h)
+            new_infections=rng.binomial(S[r],-np.expm1(-b[r]*I[r]/population*h))
+            new_recoveries=rng.binomial(I[r],-np.expm1(-k[r]*h))
+            S[r]-=new_infections
+            I[r]+=new_infections-new_recoveries
+            R[r]+=new_recoveries
+            t[r]+=h
+        
+        higher=I[idx]>peak_I[idx]
+        peak_I[idx[higher]]=I[idx[higher]]
+        t_peak[idx[higher]]=t[idx[higher]]
+        over=idx[I[idx]==0]
+        t_extinct[over]=t[over]
+        active[idx]=(I[idx]>0)&(t[idx]<t_end)
+    else:
+        raise RuntimeError('stochastic_SIR did not finish in max_iter=%d iterations' % max_iter)
+    
+    if t_eval is not None:                         ## the state at the end holds from then on
+        rest=np.arange(len(t_eval))[None,:]>=next_eval[:,None]
+        for c,x in enumerate((S,I,R)):
+            X[c][rest]=np.broadcast_to(x[:,None]/population,rest.shape)[rest]
+    
+    results=np.zeros(n,dtype=[('final_size',float),('peak_I',float),('t_peak',float),('t_extinct',float)])
+    results['final_size']=(counts[0]-S)/population
+    results['peak_I']=peak_I/population
+    results['t_peak']=t_peak
+    results['t_extinct']=t_extinct
+    return results, (X if t_eval is not None else None)
+
+
+def outbreak_statistics(results,minor=0.01):
+    
+    ## Summary of the runs of stochastic_SIR: the probability of early extinction (the infection
+    ## died out having reached less than a fraction 'minor' of the population) with its standard
+    ## error, and the distribution of the final size of the other (major) outbreaks.
+    
+    early=(results['t_extinct']<np.inf)&(results['final_size']<minor)
+    p=np.mean(early)
+    major=results['final_size'][~early]
+    summary={'p_early_extinction':p,
+             'stderr':np.sqrt(p*(1-p)/len(results)),
+             'N_major':len(major)}
+    if len(major)>0:
+        summary['final_size_mean']=np.mean(major)
+        summary['final_size_quantiles']=dict(zip((5,25,50,75,95),np.percentile(major,[5,25,50,75,95])))
+    return summary
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+The studies of the project, run from the command line (python -m com3001 ecolab / sir) or by the
+scripts modeltest.py and Task2.py. matplotlib is only imported when a study runs, so that the
+library modules stay quick to import.
+"""
+
+import os
+
+import numpy as np
+
+from . import render, simcache
+from .ecolab import SpeciesExtinct, extinction_probability, get_agent_counts, run_ecolab, run_replicates, speed_setup
+from .sir import Event, Numerical_methods, f, outbreak_statistics, stochastic_SIR
+
+
+def _pyplot(show):
+    """
+    Imports and returns matplotlib.pyplot, with the non-interactive Agg backend if the figures
+    are not going to be shown (so that it runs without a display)
+    """
+    import matplotlib
+    if not show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _show(plt,show,output,name):
+    """
+    Saves the open figures to output/name.png (name_2.png... if there are several) if output
+    is given, shows them if show, then closes them
+    """
+    if output is not None:
+        os.makedirs(output,exist_ok=True)
+        for i, number in enumerate(plt.get_fignums()):
+            suffix = '' if i==0 else '_%d' % (i+1)
+            plt.figure(number).savefig(os.path.join(output,name+suffix+'.png'))
+    if show:
+        plt.show()
+    plt.close('all')
+
+
+def ecolab_study(show=True,output=None,cache=True,n_simulations=30,Niterations=1000,processes=None,animation=None):
+    """
+    The rabbit speed study: a baseline run, the rabbit population for five rabbit speeds, and
+    the extinction probability of the rabbits for each speed over n_simulations seeded runs.
+
+    Arguments:
+    - show = show the figures (in a window) at the end of each part
+    - output = a directory to save the figures to as PNG files (None = don't save them)
+    - cache = keep the results of the runs in a simcache.Cache, so running the study again
+      only computes what changed
+    - n_simulations, Niterations = runs per speed and iterations per run
+    - processes = worker processes for the replicates (default = one per CPU)
+    - animation = a file to render the baseline run to (see render.animate_record), or None
+    """
+    plt = _pyplot(show)
+
+    #The results of the runs are kept on disk, so running the study again only computes what
+    #changed (new speeds, other settings, or after editing this file)
+    cache = simcache.Cache(enabled=cache)
+
+    #The default environment with 150 rabbits and 50 foxes, everything random drawn from a seeded
+    #generator so that the runs can be reproduced (and found in the cache)
+    Nrabbits = 150
+    Nfoxes = 50
+    env, agents = speed_setup(1,np.random.default_rng(0),Nrabbits,Nfoxes)
+
+    #Run the agent-based simulation
+    record = cache.call(run_ecolab,env,agents,Niterations=Niterations,earlystop=True)
+    if animation is not None:
+        render.animate_record(record,animation)
+
+    #Analyze the effect of a parameter (e.g., rabbit speed) on the system's behavior
+    rabbit_speeds = [0.5,1,2,3,4]
+
+    for i, speed in enumerate(rabbit_speeds):
+        env, agents = speed_setup(speed,np.random.default_rng(np.random.SeedSequence(0,spawn_key=(i,))),Nrabbits,Nfoxes)
+
+        record = cache.call(run_ecolab,env,agents,Niterations=Niterations,earlystop=True)
+        counts = get_agent_counts(record)
+        render.plot_lod(plt.gca(),np.arange(len(counts)),counts[:,1],label=f"Rabbit speed: {speed}")
+
+    plt.legend()
+    plt.xlabel("Iteration")
+    plt.ylabel("Number of rabbits")
+    plt.title("Effect of rabbit speed on rabbit population")
+    _show(plt,show,output,'ecolab_1')
+
+    #Calculate the extinction probability of rabbits for each speed value
+    #(the runs are spread over all the CPUs, and seeded so the results can be reproduced)
+    results = run_replicates(speed_setup,rabbit_speeds,n_simulations,seed=0,Niterations=Niterations,
+                             stop=[SpeciesExtinct('rabbits')],cache=cache,
+                             processes=processes)
+    print('%d runs loaded from the cache, %d computed' % (cache.hits,cache.misses))
+    speeds, extinction_probabilities, lower, upper = extinction_probability(results)
+
+    #Plot the extinction probability of rabbits for each speed value (with 95% confidence intervals)
+    plt.errorbar(speeds,extinction_probabilities,yerr=[extinction_probabilities-lower,upper-extinction_probabilities],marker="o",capsize=3)
+    plt.xlabel("Rabbit speed")
+    plt.ylabel("Extinction probability")
+    plt.title("Rabbit extinction probability vs. rabbit speed")
+    _show(plt,show,output,'ecolab_2')
+
+
+def sir_study(show=True,output=None,cache=True,dt=0.2,N_iter=1000,N_replicates=1000):
+    """
+    The SIR study of the document: the three scenarios (7.9 mil Susceptible and 10, 10000 or 1
+    Infected) with RungeKutta2, and the third one with the stochastic model.
+
+    Arguments:
+    - show, output, cache = as ecolab_study
+    - dt, N_iter = the steps of RungeKutta2
+    - N_replicates = the number of stochastic runs
+    """
+    plt = _pyplot(show)
+
+    NM = Numerical_methods(f) #Object definition
+    cache = simcache.Cache(enabled=cache) #the results are kept on disk, a rerun only computes what changed
+
+    t_start = 0
+
+    #The three scenarios of the document (7.9 mil Susceptible and 10, 10000 or 1 Infected)
+    #are integrated together as one ensemble, one column per scenario.
+    x_start = np.array([[1,1,1],
+                        [1.27*10**-6,1.27*10**-6*1000,1.27*10**-6/10],
+                        [0,0,0]])
+
+    #The infection peak is where dI/dt changes from positive to negative
+    peak = Event(lambda x,t: f(x,t)[1],direction=-1)
+
+    NM.Initialise(x_start,t_start) #Setting the initial conditions in the object
+    X_ensemble, ts = cache.call(NM.RungeKutta2,dt,N_iter,events=[peak])
+    t_plot, X_plot = render.decimate(ts,X_ensemble) #at most ~2000 points per line, the peaks kept
+
+    for t_peak,x_peak,m in zip(NM.t_events[0],NM.x_events[0],NM.member_events[0]):
+        print('Scenario %d: infection peak I = %.4f at t = %.2f' % (m+1,x_peak[1],t_peak))
+
+    #initial conditions of the document - 7.9 mil Susceptible and 10 Infected
+    X_RK2 = X_plot[:,0,:]
+
+    fig1 = plt.figure() #Create a new figure for the first 3D plot
+    ax1 = fig1.add_subplot(111,projection='3d')
+    ax1.plot3D(X_RK2[0,:],X_RK2[1,:],X_RK2[2,:],'red')
+
+    fig2, ax2 = plt.subplots() #one axis on figure
+    ax2.plot(t_plot,X_RK2[0,:],color='blue',label='Susceptible (S)')
+    ax2.plot(t_plot,X_RK2[1,:],color='orange',label='Infected (I)')
+    ax2.plot(t_plot,X_RK2[2,:],color='green',label='Recovered (R)')
+    ax2.legend() #Display the legend on the plot
+
+    #new initial conditions (2nd scenario) - 7.9 mil Susceptible and 10000 Infected
+    X_RK2 = X_plot[:,1,:]
+
+    fig3 = plt.figure()
+    ax3 = fig3.add_subplot(111,projection='3d')
+    ax3.plot3D(X_RK2[0,:],X_RK2[1,:],X_RK2[2,:],'red')
+
+    fig4, ax4 = plt.subplots() #one axis on figure
+    ax4.plot(t_plot,X_RK2[0,:],color='blue',label='Susceptible (S)')
+    ax4.plot(t_plot,X_RK2[1,:],color='orange',label='Infected (I)')
+    ax4.plot(t_plot,X_RK2[2,:],color='green',label='Recovered (R)')
+    ax4.legend()
+
+    #new initial conditions (3rd scenario) - 7.9 mil Susceptible and 1 Infected
+    X_RK2 = X_plot[:,2,:]
+
+    fig5 = plt.figure()
+    ax5 = fig5.add_subplot(111,projection='3d')
+    ax5.plot3D(X_RK2[0,:],X_RK2[1,:],X_RK2[2,:],'red')
+
+    fig6, ax6 = plt.subplots() #one axis on figure
+    ax6.plot(t_plot,X_RK2[0,:],color='blue',label='Susceptible (S)')
+    ax6.plot(t_plot,X_RK2[1,:],color='orange',label='Infected (I)')
+    ax6.plot(t_plot,X_RK2[2,:],color='green',label='Recovered (R)')
+
+    #With a single Infected the deterministic model always has an epidemic, but chance decides
+    #whether that one person infects anybody: N_replicates stochastic runs of the 3rd scenario
+    results, X_stochastic = cache.call(stochastic_SIR,x_start[:,2],ts[-1],N_replicates=N_replicates,t_eval=ts[::10],seed=0)
+    summary = outbreak_statistics(results)
+    print('Scenario 3, stochastic: P(early extinction) = %.3f +- %.3f (about k/b = %.3f), median final size of the other outbreaks %.3f'
+          % (summary['p_early_extinction'],summary['stderr'],0.33/0.5,summary.get('final_size_quantiles',{}).get(50,np.nan)))
+
+    fig7, ax7 = plt.subplots()
+    render.plot_many(ax7,ts[::10],X_stochastic[1,:50],color='orange',alpha=0.3)
+    ax7.plot(t_plot,X_RK2[1,:],color='black',label='deterministic')
+    ax7.set_xlabel('t')
+    ax7.set_ylabel('Infected (I)')
+    ax7.legend()
+
+    fig8, ax8 = plt.subplots()
+    ax8.hist(results['final_size'],bins=50)
+    ax8.set_xlabel('final size')
+    ax8.set_ylabel('runs')
+
+    _show(plt,show,output,'sir')
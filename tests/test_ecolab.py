@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the agent simulation of com3001.ecolab.
+"""
+
+import contextlib
+import copy
+import functools
+import io
+import json
+import pickle
+
+import numpy as np
+
+from com3001 import ecolab
+from com3001.ecolab import (AgentArrays, Checkpointer, Counts, DiffusionGrowth, Environment, Fox, LogisticGrowth,
+                            Observer, PopulationBounds, Profiler, Rabbit, RabbitGrid, RandomTufts, Recorder, SpeciesExtinct,
+                            Stationary, checkpoint_setup,
+                            get_agent_counts, load_checkpoint, run_ecolab, run_ecolab_vectorized, run_replicates,
+                            set_rabbit_speed, speed_setup)
+from com3001.simcache import Cache, fingerprint
+
+
+def test_environment_copy_keeps_bordered_grid():
+    """
+    After a deepcopy or a pickle round trip, the grass is still a view of the bordered grid
+    """
+    env = Environment(shape=[20, 20], startgrass=0, maxgrass=5, rng=np.random.default_rng(0))
+    for other in [copy.deepcopy(env), pickle.loads(pickle.dumps(env))]:
+        other.grass[5, 5] = 3
+        b = other.boundary
+        assert other.grasswithboundary[5+b, 5+b] == 3
+        assert tuple(other.get_loc_of_grass(np.array([5, 6]), 2)) == (5, 5)
+        assert env.grass[5, 5] == 0
+
+
+def test_recorder_slices():
+    """
+    Slicing a Recorder gives the list of records the old list of dictionaries gave
+    """
+    rng = np.random.default_rng(0)
+    env, agents = speed_setup(1, rng, Nrabbits=20, Nfoxes=5)
+    record = Recorder(grass='delta', keyframe=4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_ecolab(env, agents, Niterations=12, earlystop=False, recorder=record)
+    records = list(record)
+    for index in [slice(1, 3), slice(None, None, 5), slice(-3, None), slice(10, 2, -3)]:
+        sliced = record[index]
+        assert isinstance(sliced, list)
+        assert len(sliced) == len(records[index])
+        for a, b in zip(sliced, records[index]):
+            np.testing.assert_array_equal(a['grass'], b['grass'])
+            np.testing.assert_array_equal(a['agents'], b['agents'])
+
+
+def test_checkpoint_series_and_fork(tmp_path):
+    """
+    A Checkpointer with any % format keeps every checkpoint, and replicates forked from one
+    continue from its iteration, exactly as resuming it by hand
+    """
+    env, agents = speed_setup(1, np.random.default_rng(0), Nrabbits=40, Nfoxes=10)
+    pattern = str(tmp_path / 'ck%05d.npz')
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_ecolab(env, agents, Niterations=20, earlystop=False, recorder=False, observers=[Checkpointer(pattern, 10)])
+    assert (tmp_path / 'ck00010.npz').exists() and (tmp_path / 'ck00020.npz').exists()
+
+    filename = pattern % 20
+    setup = functools.partial(checkpoint_setup, filename=filename, apply=set_rabbit_speed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run_replicates(setup, [2], 2, seed=3, Niterations=30, processes=1)
+        for r in range(2):
+            rng = np.random.default_rng(np.random.SeedSequence(3, spawn_key=(0, r)))
+            env, agents, iteration = load_checkpoint(filename, rng)
+            assert iteration == 20
+            set_rabbit_speed(2, env, agents)
+            counts = Counts()
+            run_ecolab(env, agents, Niterations=30, recorder=False, observers=[counts], start_iteration=iteration)
+            assert (results['foxes'][r], results['rabbits'][r], results['iterations'][r]) == (counts.foxes, counts.rabbits, counts.iterations)
+            assert results['iterations'][r] <= 30
+
+
+def test_replicates_cache_ignores_stop_condition_state(tmp_path):
+    """
+    Stop conditions which have already been used in runs key the same cached runs as fresh
+    ones, so extending a study only computes the new points
+    """
+    setup = functools.partial(speed_setup, Nrabbits=40, Nfoxes=10)
+    stop = [Stationary(window=5, tolerance=1)]
+    fresh = fingerprint(Stationary(window=5, tolerance=1))
+    cache = Cache(tmp_path / 'cache')
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = run_replicates(setup, [1], 2, Niterations=20, processes=1, stop=stop, cache=cache)
+        assert fingerprint(stop[0]) == fresh
+        second = run_replicates(setup, [1, 2], 2, Niterations=20, processes=1, stop=stop, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert np.array_equal(second['rabbits'][:2], first['rabbits'])
+
+
+def test_checkpoint_resume_is_exact(tmp_path):
+    """
+    Resuming from a checkpoint taken in the middle of a run ends exactly as the run did, with
+    the object and the vectorized engines
+    """
+    pattern = str(tmp_path / 'ck%d.npz')
+    for engine in [run_ecolab, run_ecolab_vectorized]:
+        env, agents = speed_setup(1, np.random.default_rng(5), Nrabbits=40, Nfoxes=10)
+        if engine is run_ecolab_vectorized:
+            agents = AgentArrays.from_agents(agents)
+        whole = Counts()
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine(env, agents, Niterations=30, earlystop=False, recorder=False, observers=[whole, Checkpointer(pattern, 15)])
+            env2, agents2, iteration = load_checkpoint(pattern % 15)
+            resumed = Counts()
+            engine(env2, agents2, Niterations=30, earlystop=False, recorder=False, observers=[resumed], start_iteration=iteration)
+        assert (resumed.foxes, resumed.rabbits, resumed.iterations) == (whole.foxes, whole.rabbits, whole.iterations)
+        assert np.array_equal(env2.grass, env.grass)
+
+
+def test_recorder_buffers_of_large_grids():
+    """
+    The grass columns of a large grid start with a few rows, not 1024 whole grids, and grow
+    when more records come
+    """
+    env = Environment(shape=[2000, 2000], startgrass=1, maxgrass=5, rng=np.random.default_rng(0))
+    for grass, name in [('full', 'grass'), ('delta', 'keyframes')]:
+        record = Recorder(grass=grass, keyframe=1)
+        for it in range(5):
+            record.record(it, env, [])
+        column = record.columns[name]
+        assert column.n == 5 and len(column.buffer) >= 5
+        assert column.buffer.nbytes <= 2*64*2**20
+        assert len(record.columns['ticks'].buffer) == 1024
+        np.testing.assert_array_equal(record.grass(4), env.grass)
+
+
+def test_replicates_cache_follows_checkpoint_contents(tmp_path):
+    """
+    Runs forked from a checkpoint are keyed by its contents: after overwriting it with another
+    warm-up they are run again, not loaded from the cache
+    """
+    filename = str(tmp_path / 'warmup.npz')
+    setup = functools.partial(checkpoint_setup, filename=filename, apply=set_rabbit_speed)
+    cache = Cache(tmp_path / 'cache')
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for Nrabbits in [40, 200]:
+            env, agents = speed_setup(1, np.random.default_rng(0), Nrabbits=Nrabbits, Nfoxes=10)
+            run_ecolab(env, agents, Niterations=5, earlystop=False, recorder=False, observers=[Checkpointer(filename, 5)])
+            results.append(run_replicates(setup, [1], 2, Niterations=10, processes=1, cache=cache))
+        fresh = run_replicates(setup, [1], 2, Niterations=10, processes=1)
+    assert (cache.hits, cache.misses) == (0, 4)
+    np.testing.assert_array_equal(results[1], fresh)
+    assert not np.array_equal(results[0]['rabbits'], results[1]['rabbits'])
+
+
+class BruteForceIndex:
+    """
+    Stands in for RabbitGrid with the search over every agent Fox.get_nearby_rabbit did before it
+    """
+    def __init__(self, agents, cellsize):
+        self.agents = agents
+
+    def add(self, agent):
+        pass
+
+    def move(self, rabbit, oldposition):
+        pass
+
+    def nearest(self, position, vision):
+        return Fox.get_nearby_rabbit(None, position, vision, self.agents)
+
+
+def test_rabbit_grid_nearest_matches_brute_force():
+    """
+    RabbitGrid.nearest finds the same rabbit as the search over every agent (ties to the first
+    one in the list), after rabbits moved to other cells and some of them died
+    """
+    rng = np.random.default_rng(1)
+    env = Environment(shape=[40, 40], rng=rng)
+    agents = [Rabbit(env.get_random_location(), speed=4, rng=rng) for i in range(60)]
+    agents += [Fox(env.get_random_location(), rng=rng) for i in range(5)]
+    env.rabbit_index = grid = RabbitGrid(agents, cellsize=Fox.vision)
+    moved = 0
+    for a in agents[:60]:
+        old = grid.cell(a.position)
+        a.trymove(a.position + rng.integers(-4, 5, size=2), env)
+        moved += grid.cell(a.position) != old
+    for a in agents[:60:4]:
+        a.eaten = True
+    agents[5].food = 0
+    assert moved > 10
+    for position in rng.integers(0, 40, size=(300, 2)):
+        for vision in [3, Fox.vision, 12]:
+            assert grid.nearest(position, vision) is Fox.get_nearby_rabbit(None, position, vision, agents)
+
+
+def test_rabbit_grid_run_matches_brute_force(monkeypatch):
+    """
+    A seeded run with the RabbitGrid records the same as the old search over every agent
+    """
+    class Kills(Observer):
+        def __init__(self):
+            self.n = 0
+
+        def died(self, agents):
+            self.n += sum(getattr(a, 'eaten', False) for a in agents)
+
+    records = []
+    for index in [RabbitGrid, BruteForceIndex]:
+        monkeypatch.setattr(ecolab, 'RabbitGrid', index)
+        env, agents = speed_setup(1, np.random.default_rng(4), Nrabbits=80, Nfoxes=20)
+        kills = Kills()
+        with contextlib.redirect_stdout(io.StringIO()):
+            records.append(run_ecolab(env, agents, Niterations=30, earlystop=False, observers=[kills]))
+        assert kills.n > 0
+    assert len(records[0]) == len(records[1])
+    for a, b in zip(records[0], records[1]):
+        np.testing.assert_array_equal(a['agents'], b['agents'])
+        np.testing.assert_array_equal(a['grass'], b['grass'])
+
+
+def test_random_tufts_match_one_at_a_time():
+    """
+    RandomTufts adds the tufts landing on the same tile together, up to maxgrass, and leaves
+    full tiles alone, like the old loop adding one tuft at a time at the same locations
+    """
+    for seed in range(5):
+        env = Environment(shape=[6, 8], maxgrass=3, growrate=100, rng=np.random.default_rng(seed))
+        env.grass = np.random.default_rng(10+seed).integers(0, 5, size=(6, 8))   #some tiles above maxgrass
+        expected = env.grass.copy()
+        locs = np.random.default_rng(seed).integers([0, 0], env.shape, size=(env.growrate, 2))
+        for x, y in locs:
+            if expected[x, y] < env.maxgrass:
+                expected[x, y] += 1
+        RandomTufts()(env)
+        np.testing.assert_array_equal(env.grass, expected)
+        assert np.all(env.grass[expected > 3] == expected[expected > 3])
+
+
+def test_growth_rules_stay_in_bounds():
+    """
+    LogisticGrowth and DiffusionGrowth keep the grass whole numbers between 0 and maxgrass, and
+    without seeding nothing grows on bare tiles (away from grass, for the diffusion)
+    """
+    for growth in [LogisticGrowth(rate=0.9, seed=0.05), DiffusionGrowth(rate=0.9, seed=0.05)]:
+        env = Environment(shape=[20, 20], maxgrass=4, growth=growth, rng=np.random.default_rng(0))
+        env.grass = np.random.default_rng(1).integers(0, 5, size=(20, 20))
+        for it in range(50):
+            env.grow()
+            assert env.grass.min() >= 0 and env.grass.max() <= 4
+        assert np.issubdtype(env.grass.dtype, np.integer) and env.grass.mean() > 3
+
+    env = Environment(shape=[20, 20], startgrass=0, maxgrass=4, growth=LogisticGrowth(seed=0), rng=np.random.default_rng(0))
+    env.grass[5, 5] = 2
+    for it in range(20):
+        env.grow()
+    assert np.count_nonzero(env.grass) == 1 and env.grass[5, 5] >= 2
+
+    env = Environment(shape=[20, 20], startgrass=0, maxgrass=4, growth=DiffusionGrowth(rate=1, seed=0), rng=np.random.default_rng(0))
+    env.grass[5, 5] = 4
+    env.grow()
+    grown = np.argwhere(env.grass > 0)
+    assert np.all(np.abs(grown-[5, 5]).sum(axis=1) <= 1) and len(grown) > 1
+
+
+def recorded_run(recorder, seed=2, Niterations=25, **kwargs):
+    """
+    A seeded run of run_ecolab recorded with recorder
+    """
+    env, agents = speed_setup(1, np.random.default_rng(seed), Nrabbits=40, Nfoxes=10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_ecolab(env, agents, Niterations=Niterations, earlystop=False, recorder=recorder, **kwargs)
+
+
+def assert_same_records(a, b):
+    assert len(a) == len(b)
+    np.testing.assert_array_equal(a.ticks, b.ticks)
+    np.testing.assert_array_equal(a.counts, b.counts)
+    assert a.stop_reason == b.stop_reason
+    for i in [0, 5, 3, len(a)-1, 7, 6, 4, 1]:   #out of order, to go around the cache of the delta decoding
+        np.testing.assert_array_equal(a[i]['grass'], b[i]['grass'])
+        np.testing.assert_array_equal(a[i]['agents'], b[i]['agents'])
+
+
+def test_recorder_delta_streaming_and_saving(tmp_path):
+    """
+    The delta encoding decodes to the same grids as recording every grid, and a recording
+    streamed to a directory (read back with Recorder.open) or saved with save (read back with
+    load) gives the same records
+    """
+    full = recorded_run(Recorder())
+    assert_same_records(full, recorded_run(Recorder(grass='delta', keyframe=4)))
+    assert_same_records(full, recorded_run(Recorder(grass='delta', keyframe=1)))
+
+    streamed = recorded_run(Recorder(grass='delta', keyframe=4, path=str(tmp_path / 'run')))
+    opened = Recorder.open(str(tmp_path / 'run'))
+    assert_same_records(full, opened)
+    assert opened.grass_mode == 'delta' and opened.last_tick == 24
+
+    full.save(str(tmp_path / 'full.npz'))
+    streamed.save(str(tmp_path / 'delta.npz'))
+    assert_same_records(full, Recorder.load(str(tmp_path / 'full.npz')))
+    assert_same_records(full, Recorder.load(str(tmp_path / 'delta.npz')))
+
+    sparse = recorded_run(Recorder(interval=10, grass=None))
+    np.testing.assert_array_equal(sparse.ticks, [9, 19, 24])
+    np.testing.assert_array_equal(sparse.counts, full.counts[[9, 19, 24]])
+    assert sparse[1]['grass'] is None
+
+
+def test_counts_history_matches_recorder():
+    """
+    The running counts of a Counts observer are the counts the Recorder takes from the grids
+    and agents, with the object and the vectorized engines, and a run which isn't recorded
+    gives the same counts
+    """
+    for engine in [run_ecolab, run_ecolab_vectorized]:
+        env, agents = speed_setup(1, np.random.default_rng(3), Nrabbits=40, Nfoxes=10)
+        if engine is run_ecolab_vectorized:
+            agents = AgentArrays.from_agents(agents)
+        counts = Counts(history=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            record = engine(env, agents, Niterations=30, earlystop=False, observers=[counts])
+        np.testing.assert_array_equal(counts.array(), record.counts)
+        np.testing.assert_array_equal(get_agent_counts(list(record)), record.counts)
+        assert (counts.foxes, counts.rabbits, counts.iterations) == (record.counts[-1, 0], record.counts[-1, 1], 30)
+
+        env, agents = speed_setup(1, np.random.default_rng(3), Nrabbits=40, Nfoxes=10)
+        if engine is run_ecolab_vectorized:
+            agents = AgentArrays.from_agents(agents)
+        unrecorded = Counts(history=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert engine(env, agents, Niterations=30, earlystop=False, recorder=False, observers=[unrecorded]) is None
+        np.testing.assert_array_equal(unrecorded.array(), counts.array())
+
+
+def test_stop_conditions_reasons():
+    """
+    Each stop condition ends the run at the first iteration it is met, says why in its reason
+    and in the recorder's stop_reason; with several, the first one met stops the run
+    """
+    cases = [(SpeciesExtinct('rabbits'), {'Nrabbits': 0, 'Nfoxes': 5}, 'rabbits extinct', lambda c: c[1] == 0),
+             (SpeciesExtinct('foxes'), {'Nfoxes': 3}, 'foxes extinct', lambda c: c[0] == 0),
+             (PopulationBounds('rabbits', high=45), {}, 'rabbits above 45', lambda c: c[1] > 45),
+             (PopulationBounds('rabbits', low=35), {}, 'rabbits below 35', lambda c: c[1] < 35),
+             (PopulationBounds('foxes', low=8), {}, 'foxes below 8', lambda c: c[0] < 8),
+             (Stationary(window=10), {'Nrabbits': 0, 'Nfoxes': 0}, 'stationary', None)]
+    for condition, kwargs, reason, met in cases:
+        env, agents = speed_setup(1, np.random.default_rng(0), **dict({'Nrabbits': 40, 'Nfoxes': 10}, **kwargs))
+        with contextlib.redirect_stdout(io.StringIO()):
+            record = run_ecolab(env, agents, Niterations=300, earlystop=False, stop=[condition])
+        assert condition.reason == record.stop_reason == reason
+        assert len(record) < 300
+        if met is None:
+            assert len(record) == 10
+        else:
+            assert met(record.counts[-1]) and not any(met(c) for c in record.counts[:-1])
+
+    env, agents = speed_setup(1, np.random.default_rng(0), Nrabbits=40, Nfoxes=10)
+    stop = [PopulationBounds('rabbits', high=45), PopulationBounds('rabbits', low=35)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        record = run_ecolab_vectorized(env, AgentArrays.from_agents(agents), Niterations=300, stop=stop)
+    assert record.stop_reason in ('rabbits above 45', 'rabbits below 35') and len(record) < 300
+    assert [c.reason for c in stop].count(None) == 1
+
+
+def test_profiler_leaves_runs_unchanged(tmp_path):
+    """
+    A profiled run records exactly what the same seeded run records without a profiler, with
+    both engines, and the profiler has timed every iteration
+    """
+    for engine, phases in [(run_ecolab, {'index', 'move', 'eat', 'breed', 'die', 'grow', 'observers', 'record'}),
+                           (run_ecolab_vectorized, {'feed rabbits', 'move foxes', 'eat', 'breed', 'die', 'grow', 'observers', 'record'})]:
+        records = []
+        for profiler in [None, Profiler()]:
+            env, agents = speed_setup(1, np.random.default_rng(6), Nrabbits=40, Nfoxes=10)
+            if engine is run_ecolab_vectorized:
+                agents = AgentArrays.from_agents(agents)
+            with contextlib.redirect_stdout(io.StringIO()):
+                records.append(engine(env, agents, Niterations=20, earlystop=False, observers=[Counts()], profiler=profiler))
+        plain, profiled = records
+        assert len(plain) == len(profiled) == 20
+        for a, b in zip(plain, profiled):
+            np.testing.assert_array_equal(a['agents'], b['agents'])
+            np.testing.assert_array_equal(a['grass'], b['grass'])
+
+        assert len(profiler.ticks) == 20
+        times, counts = profiler.totals()
+        assert set(times) == phases and all(t >= 0 for t in times.values())
+        assert 'total' in profiler.summary()
+        profiler.write_trace(str(tmp_path / 'trace.json'))
+        with open(tmp_path / 'trace.json') as file:
+            assert len(json.load(file)['traceEvents']) >= 20*len(phases)
+
+
+def test_recorder_grass_outgrowing_its_dtype(tmp_path):
+    """
+    Grass which grows past the range of the dtype picked at the first record (or goes below 0)
+    is stored exactly, in memory and streamed to disk, with every grass mode
+    """
+    grids = [np.full((6, 5), 1), np.full((6, 5), 3)]
+    grids.append(grids[-1].copy())
+    grids[-1][2, 3] = 300
+    grids.append(grids[-1].copy())
+    grids[-1][0, 0] = -1
+    grids.append(np.full((6, 5), 70000))
+    for grass, path in [('full', None), ('delta', None), ('delta', str(tmp_path / 'delta')), ('full', str(tmp_path / 'full'))]:
+        env = Environment(shape=[6, 5], maxgrass=5, rng=np.random.default_rng(0))
+        record = Recorder(grass=grass, keyframe=2, path=path)
+        for it, grid in enumerate(grids):
+            env.grass = grid
+            record.record(it, env, [])
+            if it == 1:
+                record.grass(1)   #decoded in the first dtype
+        record.close()
+        for recorded in [record, Recorder.open(path) if path else record]:
+            for i, grid in enumerate(grids):
+                np.testing.assert_array_equal(recorded.grass(i), grid)
+            np.testing.assert_array_equal(recorded.counts[:, 2], [grid.sum() for grid in grids])
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the package itself: its lazy exports and the command line.
+"""
+
+import contextlib
+import importlib
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+import com3001
+from com3001.__main__ import main
+from com3001.ecolab import Recorder, run_ecolab, speed_setup
+
+
+def test_lazy_exports_resolve():
+    """
+    Every name of __all__ and every submodule is available from the package, is the object of
+    its submodule, and is listed by dir(); other names raise AttributeError
+    """
+    for name in com3001.__all__:
+        module = importlib.import_module('com3001.' + com3001._origin[name])
+        assert getattr(com3001, name) is getattr(module, name)
+    for name in com3001._submodules:
+        assert getattr(com3001, name) is importlib.import_module('com3001.' + name)
+    assert set(com3001.__all__) | set(com3001._submodules) <= set(dir(com3001))
+
+    with pytest.raises(AttributeError, match='no_such_name'):
+        com3001.no_such_name
+    assert not hasattr(com3001, 'Numerical_method')
+    with pytest.raises(ImportError):
+        from com3001 import no_such_name
+
+
+def test_console_script_entry_point():
+    """
+    The com3001 command of pyproject.toml points at the main function of the command line
+    """
+    tomllib = pytest.importorskip('tomllib')
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pyproject.toml'), 'rb') as file:
+        project = tomllib.load(file)['project']
+    module, function = project['scripts']['com3001'].split(':')
+    assert getattr(importlib.import_module(module), function) is main
+
+
+def run_main(argv):
+    """
+    Runs the command line with argv, and returns its exit status and what it printed
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        status = main(argv)
+    return status, output.getvalue()
+
+
+def test_cli_studies_headless(tmp_path):
+    """
+    The ecolab and sir subcommands run without a display, at small sizes, and save their figures
+    (and the animation of the baseline run)
+    """
+    status, _ = run_main(['ecolab', '--no-show', '--no-cache', '--output', str(tmp_path / 'ecolab'),
+                          '--simulations', '2', '--iterations', '10', '--processes', '1',
+                          '--animation', str(tmp_path / 'frames' / '%03d.png')])
+    assert status == 0
+    assert sorted(os.listdir(str(tmp_path / 'ecolab'))) == ['ecolab_1.png', 'ecolab_2.png']
+    assert len(os.listdir(str(tmp_path / 'frames'))) > 0
+
+    status, printed = run_main(['sir', '--no-show', '--no-cache', '--output', str(tmp_path / 'sir'),
+                                '--steps', '50', '--replicates', '10'])
+    assert status == 0 and 'Scenario 3' in printed
+    assert 'sir.png' in os.listdir(str(tmp_path / 'sir'))
+
+
+def test_cli_animate_and_bench(tmp_path):
+    """
+    The animate subcommand renders one PNG per record of a recording streamed to a directory,
+    and bench runs the selected benchmarks and writes their results
+    """
+    env, agents = speed_setup(1, np.random.default_rng(0), 30, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_ecolab(env, agents, Niterations=6, earlystop=False, recorder=Recorder(path=str(tmp_path / 'run')))
+    status, printed = run_main(['animate', str(tmp_path / 'run'), str(tmp_path / 'frames' / '%03d.png'), '--size', '2'])
+    assert status == 0
+    n_records = len(Recorder.open(str(tmp_path / 'run')))
+    assert printed.startswith('%d frames' % n_records)
+    assert len(os.listdir(str(tmp_path / 'frames'))) == n_records
+
+    status, printed = run_main(['bench', '--quick', '--filter', 'integrator/RK4/LV/members=1', '--repeat', '1',
+                                '--output', str(tmp_path / 'bench.json')])
+    assert status == 0
+    with open(str(tmp_path / 'bench.json')) as file:
+        results = json.load(file)['results']
+    assert sorted(results) == ['integrator/RK4/LV/members=1', 'integrator/RK4/LV/members=100',
+                               'integrator/RK4/LV/members=10000']
+
+    with pytest.raises(SystemExit):
+        run_main(['no_such_command'])
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Regression checks of run_ecolab_parallel (the strips, their two-colour turns, the ghost rabbits
+and kills sent between strips, the migration and the growth of each strip): its runs must not
+depend on the number of workers, and must agree statistically with run_ecolab_vectorized.
+Also checks that the replicates of run_replicates don't depend on the number of processes.
+"""
+
+import contextlib
+import functools
+import io
+import threading
+
+import numpy as np
+
+from com3001.ecolab import (AgentArrays, Environment, Fox, Rabbit, extinction_probability, run_ecolab_parallel,
+                            run_ecolab_vectorized, run_replicates, speed_setup)
+
+
+def setup(seed, size=120, Nrabbits=400, Nfoxes=100):
+    """
+    A size x size grid (grass growing on size*size/60 tiles per iteration) with random agents
+    """
+    rng = np.random.default_rng(seed)
+    env = Environment(shape=[size, size], growrate=size*size // 60, maxgrass=5, startgrass=1, rng=rng)
+    agents = [Rabbit(env.get_random_location(), speed=1, rng=rng) for i in range(Nrabbits)]
+    agents += [Fox(env.get_random_location(), speed=3, rng=rng) for i in range(Nfoxes)]
+    return env, AgentArrays.from_agents(agents)
+
+
+def run(engine, seed, Niterations, **kwargs):
+    """
+    Returns the counts of every iteration and the final grass of a seeded run
+    """
+    env, agents = setup(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        record = engine(env, agents, Niterations=Niterations, earlystop=False, **kwargs)
+    return record.counts, env.grass
+
+
+def test_parallel_does_not_depend_on_workers():
+    """
+    Same seed and strips: the same run with one worker keeping every strip or two sharing them
+    """
+    counts_1, grass_1 = run(run_ecolab_parallel, 0, 30, workers=1, strips=4)
+    counts_2, grass_2 = run(run_ecolab_parallel, 0, 30, workers=2, strips=4)
+    np.testing.assert_array_equal(counts_1, counts_2)
+    np.testing.assert_array_equal(grass_1, grass_2)
+    assert counts_1[-1, 1] > 0 and counts_1[-1, 0] > 0   #the check is about a run that still has agents
+
+
+def test_parallel_agrees_with_vectorized():
+    """
+    The mean counts after 40 iterations over several seeds agree with run_ecolab_vectorized
+    within a few standard errors
+    """
+    seeds = range(8)
+    final = {}
+    for engine, kwargs in [(run_ecolab_parallel, {'workers': 2, 'strips': 4}), (run_ecolab_vectorized, {})]:
+        final[engine] = np.array([run(engine, seed, 40, **kwargs)[0][-1] for seed in seeds], dtype=float)
+    parallel, vectorized = final[run_ecolab_parallel], final[run_ecolab_vectorized]
+    error = np.sqrt((parallel.var(axis=0, ddof=1) + vectorized.var(axis=0, ddof=1)) / len(seeds))
+    difference = np.abs(parallel.mean(axis=0) - vectorized.mean(axis=0))
+    assert np.all(difference <= 4*error + 0.02*np.abs(vectorized.mean(axis=0)) + 1), (parallel.mean(axis=0), vectorized.mean(axis=0), error)
+
+
+def test_replicates_do_not_depend_on_processes():
+    """
+    The same study run without a pool and over three processes gives exactly the same table
+    """
+    setup = functools.partial(speed_setup, Nrabbits=40, Nfoxes=10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        one = run_replicates(setup, [1, 2, 3], 3, seed=7, Niterations=40, processes=1)
+        three = run_replicates(setup, [1, 2, 3], 3, seed=7, Niterations=40, processes=3)
+    assert one.dtype == three.dtype
+    for name in one.dtype.names:
+        np.testing.assert_array_equal(one[name], three[name])
+    assert len(np.unique(one['rabbits'])) > 1   #the runs differ from each other
+
+
+def test_extinction_probability_wilson_interval():
+    """
+    3 extinctions out of 10 runs: p = 0.3 with the 95% Wilson score interval (0.1078, 0.6032)
+    """
+    results = np.zeros(20, dtype=[('value', float), ('rabbits', int)])
+    results['value'][10:] = 2
+    results['rabbits'] = [0, 0, 0] + [5]*7 + [0]*10
+    values, p, lower, upper = extinction_probability(results)
+    np.testing.assert_array_equal(values, [0, 2])
+    np.testing.assert_allclose(p, [0.3, 1])
+    np.testing.assert_allclose(lower, [0.10779, 0.72247], atol=1e-5)
+    np.testing.assert_allclose(upper, [0.60322, 1], atol=1e-5)
+
+
+def test_parallel_many_strips_per_worker():
+    """
+    With more strips than workers can keep two each and strips holding thousands of agents
+    (messages much bigger than a pipe's buffer), the run doesn't deadlock, and still doesn't
+    depend on the number of workers
+    """
+    final = {}
+
+    def run_workers(workers):
+        env, agents = setup(0, size=240, Nrabbits=30000, Nfoxes=3000)
+        with contextlib.redirect_stdout(io.StringIO()):
+            record = run_ecolab_parallel(env, agents, Niterations=3, earlystop=False, workers=workers, strips=8)
+        final[workers] = record.counts, env.grass
+
+    for workers in [1, 3]:
+        thread = threading.Thread(target=run_workers, args=(workers,), daemon=True)
+        thread.start()
+        thread.join(timeout=300)
+        assert not thread.is_alive(), 'run_ecolab_parallel deadlocked with %d workers' % workers
+    np.testing.assert_array_equal(final[1][0], final[3][0])
+    np.testing.assert_array_equal(final[1][1], final[3][1])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the plotting and animation helpers of com3001.render, drawn off screen (Agg).
+"""
+
+import contextlib
+import io
+import os
+
+import numpy as np
+import pytest
+
+from com3001.ecolab import Recorder, run_ecolab, speed_setup
+from com3001.render import FrameWriter, animate_record, decimate, lod_indices, plot_lod, plot_many
+
+pytest.importorskip('matplotlib')
+from matplotlib.figure import Figure
+
+
+def test_lod_keeps_extrema_and_endpoints():
+    """
+    lod_indices keeps the first and last samples and the smallest and largest sample of every
+    bucket of every component, with a bounded number of samples; short series are kept whole
+    """
+    rng = np.random.default_rng(0)
+    n = 100003
+    for shape in [(n,), (3, n), (2, 3, n)]:
+        X = np.cumsum(rng.normal(size=shape), axis=-1)
+        X[..., rng.integers(n, size=5)] += 1000 #isolated spikes
+        t = np.linspace(0, 10, n)
+        index = lod_indices(X, 2000)
+        assert np.all(np.diff(index) > 0) and len(index) <= 2000
+        assert index[0] == 0 and index[-1] == n-1
+
+        Y = X.reshape(-1, n)
+        buckets = max(1, 2000//(2*len(Y)+2))
+        size = -(-n//buckets)
+        kept = set(index)
+        for row in Y:
+            for start in range(0, n, size):
+                piece = row[start:start+size]
+                assert start+piece.argmin() in kept and start+piece.argmax() in kept
+
+        t_d, X_d = decimate(t, X, 2000)
+        np.testing.assert_array_equal(t_d, t[index])
+        np.testing.assert_array_equal(X_d, X[..., index])
+        np.testing.assert_array_equal(X_d.max(axis=-1), X.max(axis=-1))
+        np.testing.assert_array_equal(X_d.min(axis=-1), X.min(axis=-1))
+
+    np.testing.assert_array_equal(lod_indices(np.zeros((3, 500)), 2000), np.arange(500))
+
+
+def test_plots_on_agg():
+    """
+    plot_lod draws one decimated line per row, and plot_many one collection of all the curves
+    """
+    ax = Figure().add_subplot()
+    t = np.linspace(0, 1, 50000)
+    X = np.stack([np.sin(20*t), np.cos(20*t)])
+    lines = plot_lod(ax, t, X, max_points=1000)
+    assert len(lines) == 2
+    assert all(len(line.get_xdata()) <= 1000 for line in lines)
+    assert lines[0].get_ydata().max() == X[0].max()
+
+    collection = plot_many(ax, t, np.tile(X, (5, 1)), max_points=500)
+    assert len(collection.get_segments()) == 10
+
+
+def test_animate_record_png_frames(tmp_path):
+    """
+    animate_record with a PNG pattern writes one image of the same size per rendered record
+    (every, start and stop included), and FrameWriter refuses frames of another size and
+    videos without ffmpeg
+    """
+    env, agents = speed_setup(1, np.random.default_rng(0), 30, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        record = run_ecolab(env, agents, Niterations=9, earlystop=False, recorder=Recorder(grass='delta', keyframe=4))
+    n_records = len(record)
+
+    n = animate_record(record, str(tmp_path / 'all' / '%03d.png'), size=2, dpi=50)
+    assert n == n_records
+    assert sorted(os.listdir(str(tmp_path / 'all'))) == ['%03d.png' % i for i in range(n_records)]
+
+    n = animate_record(record, str(tmp_path / 'some' / '%03d.png'), every=3, start=1, stop=8, size=2, dpi=50)
+    assert n == len(range(1, 8, 3))
+    assert len(os.listdir(str(tmp_path / 'some'))) == n
+    import matplotlib.image
+    assert matplotlib.image.imread(str(tmp_path / 'some' / '000.png')).shape[:2] == (100, 100)
+
+    assert animate_record(record, str(tmp_path / 'none' / '%03d.png'), start=n_records) == 0
+
+    with FrameWriter(str(tmp_path / 'writer' / '%03d.png')) as writer:
+        writer.write(np.zeros((4, 4, 3)))
+        with pytest.raises(ValueError):
+            writer.write(np.zeros((5, 4, 3)))
+    assert writer.n == 1
+    with pytest.raises(RuntimeError, match='ffmpeg'):
+        FrameWriter(str(tmp_path / 'run.mp4'), ffmpeg='no_such_ffmpeg')
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the integrators of com3001.sir.
+"""
+
+import numpy as np
+import pytest
+
+from com3001.sir import (EXPLICIT_RK, Event, MetapopulationSIR, Mobility, Numerical_methods, f, outbreak_statistics,
+                         stochastic_SIR, sweep)
+from com3001.simcache import Cache, fingerprint
+
+
+def inplace_only(x, t, out):
+    """
+    The SIR right hand side written only in the in-place form (no default for out)
+    """
+    return f(x, t, out=out)
+
+
+def test_inplace_only_rhs():
+    """
+    A right hand side which can only be called as f(x,t,out) works with the fixed-step and the
+    adaptive methods, and gives the same results as the usual f
+    """
+    x_start = np.array([1, 1.27e-6*1000, 0])
+    runs = [lambda nm: nm.RungeKutta2(0.2, 251),
+            lambda nm: nm.RungeKutta4(0.2, 251),
+            lambda nm: nm.DormandPrince(50.)]
+    for run in runs:
+        results = []
+        for rhs in [f, inplace_only]:
+            nm = Numerical_methods(rhs)
+            nm.Initialise(x_start, 0)
+            X, T = run(nm)
+            results.append(X)
+        np.testing.assert_allclose(results[0], results[1], rtol=1e-12, atol=1e-15)
+
+
+def peak_and_half_recovered():
+    """
+    The peak of I (dI/dt = 0, at S = k/b) and, terminal, R reaching 1/2
+    """
+    return [Event(lambda x, t: f(x, t)[1], direction=-1),
+            Event(lambda x, t: x[2]-0.5, terminal=True, direction=1)]
+
+
+def test_events_located():
+    """
+    The events are located to the accuracy of the method, whatever the step, and the run ends
+    at the terminal one. Each member of an ensemble stops at its own terminal event.
+    """
+    x_start = np.array([1, 1.27e-6*1000, 0])
+    runs = {'RungeKutta4': lambda nm, events: nm.RungeKutta4(0.2, 1001, events=events),
+            'ExplicitRK': lambda nm, events: nm.ExplicitRK(0.2, 1001, 'RK5', events=events),
+            'DormandPrince': lambda nm, events: nm.DormandPrince(200., events=events)}
+    times = []
+    for method, run in runs.items():
+        nm = Numerical_methods(f)
+        nm.Initialise(x_start, 0)
+        X, T = run(nm, peak_and_half_recovered())
+        assert [len(t) for t in nm.t_events] == [1, 1]
+        np.testing.assert_allclose(nm.x_events[0][0, 0], 0.33/0.5, rtol=1e-6)
+        np.testing.assert_allclose(nm.x_events[1][0, 2], 0.5, rtol=1e-9)
+        assert nm.t == nm.t_events[1][0] and np.array_equal(nm.x, nm.x_events[1][0])
+        assert T[-1] == nm.t and np.array_equal(X[:, -1], nm.x)
+        times.append([nm.t_events[0][0], nm.t_events[1][0]])
+    np.testing.assert_allclose(times[0], times[2], rtol=1e-5)
+    np.testing.assert_allclose(times[1], times[2], rtol=1e-5)
+
+    ensemble = np.array([[1, 1], [1.27e-3, 1e-2], [0, 0]])
+    for method in ['RungeKutta4', 'ExplicitRK']:
+        nm = Numerical_methods(f)
+        nm.Initialise(ensemble, 0)
+        runs[method](nm, peak_and_half_recovered())
+        for m in range(2):
+            single = Numerical_methods(f)
+            single.Initialise(ensemble[:, m], 0)
+            runs[method](single, peak_and_half_recovered())
+            stop = nm.t_events[1][nm.member_events[1] == m]
+            np.testing.assert_allclose(stop, single.t_events[1], rtol=1e-9)
+            np.testing.assert_allclose(nm.x[:, m], single.x, rtol=1e-9)
+
+
+def test_dormand_prince_blow_up():
+    """
+    A solution which blows up (x' = x**3 from x = 1, at t = 0.5) raises instead of returning
+    NaN, and so does running out of steps
+    """
+    for kwargs in [{}, {'max_steps': 50}]:
+        nm = Numerical_methods(lambda x, t: x**3)
+        nm.Initialise(np.array([1.]), 0)
+        with np.errstate(all='ignore'), pytest.raises(RuntimeError):
+            nm.DormandPrince(2., **kwargs)
+        assert nm.t < 0.501 and np.all(np.isfinite(nm.x))
+
+
+def test_implicit_methods_on_stiff_system():
+    """
+    On x' = J x with J = [[-1,2],[0,-3000]] and dt = 0.01, where the explicit methods are
+    unstable, BackwardEuler and BDF2 follow the exact solution expm(J t) x0 (BDF2 to the 1.5e-5
+    its second order gives at t = 1), with or without the Jacobian given. An ensemble gives the
+    same as its members run one by one.
+    """
+    J = np.array([[-1., 2], [0, -3000]])
+    x_start = np.array([1., 1])
+    values, vectors = np.linalg.eig(J)
+
+    def exact(t):
+        return (vectors*np.exp(values*t))@np.linalg.solve(vectors, x_start)
+
+    for method, tolerance in [('BackwardEuler', 2e-3), ('BDF2', 2e-5)]:
+        for jac in [lambda x, t: J, None]:
+            nm = Numerical_methods(lambda x, t: J@x, jac=jac)
+            nm.Initialise(x_start, 0)
+            X, T = getattr(nm, method)(0.01, 101)
+            assert T[-1] == pytest.approx(1)
+            np.testing.assert_allclose(X[:, -1], exact(1), atol=tolerance)
+            assert np.max(np.abs(X[:, 10:]-np.array([exact(t) for t in T[10:]]).T)) < 5*tolerance
+    nm = Numerical_methods(lambda x, t: J@x)
+    nm.Initialise(x_start, 0)
+    with np.errstate(all='ignore'):
+        X, T = nm.RungeKutta2(0.01, 101)
+    assert not np.all(np.abs(X[:, -1]) < 1e3)
+
+    ensemble = np.array([[1, 0.2, 0.5], [0.03, 0.01, 0.02], [0, 0, 0]])
+    params = {'b': np.array([0.5, 2, 1]), 'k': np.array([400, 450, 500])}
+    nm = Numerical_methods(f)
+    nm.Initialise(ensemble, 0, params)
+    X, T = nm.BDF2(0.05, 41)
+    for m in range(3):
+        single = Numerical_methods(f)
+        single.Initialise(ensemble[:, m], 0, {name: value[m] for name, value in params.items()})
+        np.testing.assert_allclose(X[:, m], single.BDF2(0.05, 41)[0], rtol=1e-8, atol=1e-12)
+
+
+def dense_metapopulation(x, M, b, k):
+    """
+    The metapopulation right hand side written as a loop over a dense matrix of rates
+    """
+    z = np.zeros_like(x)
+    for i in range(x.shape[1]):
+        z[:, i] = f(x[:, i], 0, b=b[i], k=k[i])
+        for j in range(x.shape[1]):
+            if i != j:
+                z[:, i] += M[j, i]*x[:, j]-M[i, j]*x[:, i]
+    return z
+
+
+def random_metapopulation(rng, N_regions):
+    """
+    A sparse random matrix of mobility rates, states and parameters for N_regions regions
+    """
+    M = rng.random((N_regions, N_regions))*(rng.random((N_regions, N_regions)) < 0.3)
+    x = rng.random((3, N_regions))
+    b, k = rng.uniform(0.2, 1, N_regions), rng.uniform(0.1, 0.5, N_regions)
+    return M, x, b, k
+
+
+def test_metapopulation_matches_dense_loop():
+    """
+    MetapopulationSIR agrees with a loop over the dense matrix, also after its mobility is
+    replaced by one with another number of regions, and conserves the total population
+    """
+    rng = np.random.default_rng(0)
+    M, x, b, k = random_metapopulation(rng, 12)
+    model = MetapopulationSIR(Mobility.from_dense(M))
+    out = np.empty_like(x)
+    np.testing.assert_allclose(model(x, 0, b=b, k=k, out=out), dense_metapopulation(x, M, b, k), atol=1e-14)
+    assert abs(out.sum()) < 1e-13
+
+    M, x, b, k = random_metapopulation(rng, 7)
+    model.mobility = Mobility.from_dense(M)
+    np.testing.assert_allclose(model(x, 0, b=b, k=k), dense_metapopulation(x, M, b, k), atol=1e-14)
+    M = random_metapopulation(rng, 7)[0]       #same number of regions, other links
+    model.mobility = Mobility.from_dense(M)
+    np.testing.assert_allclose(model(x, 0, b=b, k=k), dense_metapopulation(x, M, b, k), atol=1e-14)
+
+    nm = Numerical_methods(model)
+    nm.Initialise(x, 0, {'b': b, 'k': k})
+    X, T = nm.RungeKutta4(0.1, 201)
+    np.testing.assert_allclose(X.sum(axis=(0, 1)), x.sum(), rtol=1e-12)
+
+
+def test_stochastic_early_extinction():
+    """
+    From one infected person the infection dies out early with probability k/b (the branching
+    process approximation), and seeded runs are reproducible
+    """
+    population = 2000
+    x_start = [1-1/population, 1/population, 0]
+    results, X = stochastic_SIR(x_start, 200, N_replicates=3000, population=population, b=0.5, k=0.33, seed=1)
+    assert X is None
+    summary = outbreak_statistics(results)
+    assert abs(summary['p_early_extinction']-0.33/0.5) < 4*summary['stderr']
+    assert summary['N_major'] == np.sum(results['final_size'] >= 0.01) > 0
+    again, X = stochastic_SIR(x_start, 200, N_replicates=3000, population=population, b=0.5, k=0.33, seed=1)
+    np.testing.assert_array_equal(results, again)
+
+
+def test_stochastic_exact_and_tau_leaping_agree():
+    """
+    The exact SSA alone and with tau-leaping give the same mean final size of a major outbreak,
+    within the sampling error and a small bias of the leaps
+    """
+    means, errors = [], []
+    for leap_threshold in [np.inf, 1]:
+        results, X = stochastic_SIR([0.98, 0.02, 0], 200, N_replicates=400, population=2000, seed=2,
+                                    leap_threshold=leap_threshold, t_eval=[0, 10, 200])
+        assert np.all(np.isfinite(results['t_extinct']))
+        np.testing.assert_allclose(X.sum(axis=0), 1)
+        np.testing.assert_allclose(X[2, :, -1]+X[1, :, -1], results['final_size']+0.02, atol=1e-12)
+        means.append(results['final_size'].mean())
+        errors.append(results['final_size'].std()/np.sqrt(len(results)))
+    assert abs(means[0]-means[1]) < 4*np.hypot(*errors)+0.005
+
+
+@pytest.mark.parametrize('name', sorted(EXPLICIT_RK))
+def test_explicit_rk_order(name):
+    """
+    Halving the step divides the error of each tableau by 2**order, on the non-autonomous
+    x0' = cos(t) x0, x1' = -cos(t) x1**2, with exact solution exp(sin t), 1/(2+sin t)
+    """
+    def rhs(x, t):
+        return np.array([np.cos(t)*x[0], -np.cos(t)*x[1]**2])
+
+    errors = []
+    for N in [32, 64]:
+        nm = Numerical_methods(rhs)
+        nm.Initialise(np.array([1., 0.5]), 0)
+        X, T = nm.ExplicitRK(2/N, N+1, name)
+        errors.append(np.max(np.abs(X-[np.exp(np.sin(T)), 1/(2+np.sin(T))])))
+    assert np.log2(errors[0]/errors[1]) == pytest.approx(EXPLICIT_RK[name][3], abs=0.2)
+
+
+def test_sweep_does_not_depend_on_processes():
+    """
+    A sweep without a pool and over two processes (several batches each) gives the same table,
+    and each row is the run of its own parameters
+    """
+    grid = {'b': np.linspace(0.3, 1, 6), 'k': [0.2, 0.33]}
+    x_start = [[1, 1.27e-3, 0], [0.9, 1e-2, 0.1]]
+    one = sweep(grid, x_start, N_iter=300, processes=1, batch_size=5)
+    two = sweep(grid, x_start, N_iter=300, processes=2, batch_size=5)
+    assert len(one) == 24
+    for name in one.dtype.names:
+        np.testing.assert_array_equal(one[name], two[name])
+    row = one[(one['b'] == 1) & (one['k'] == 0.2) & (one['ic'] == 1)][0]
+    nm = Numerical_methods(f)
+    nm.Initialise(x_start[1], 0, {'b': 1, 'k': 0.2})
+    X, T = nm.RungeKutta2(0.2, 300)
+    np.testing.assert_allclose([row['peak_I'], row['t_peak'], row['final_size']],
+                               [X[1].max(), T[np.argmax(X[1])], X[0, 0]-X[0, -1]], rtol=1e-12)
+
+
+def test_dormand_prince_dense_output():
+    """
+    The dense output at times between the steps follows the exact solution to about the
+    tolerance, for a single state and an ensemble, and times outside [t_start, t_end] are refused
+    """
+    def rhs(x, t):
+        return np.array([np.cos(t)*x[0], -np.cos(t)*x[1]**2])
+
+    def exact(t, x1):
+        return np.array([np.exp(np.sin(t)), 1/(1/x1+np.sin(t))])
+
+    t_eval = np.sort(np.random.default_rng(0).uniform(0, 6, 200))
+    nm = Numerical_methods(rhs)
+    nm.Initialise(np.array([1., 0.5]), 0)
+    X, T = nm.DormandPrince(6., rtol=1e-8, atol=1e-10)
+    assert len(T) < 100 and not np.any(np.isin(t_eval, T))   #the times are between the steps
+    for x_start in [np.array([1., 0.5]), np.array([[1., 1, 1], [0.5, 0.4, 0.7]])]:
+        nm = Numerical_methods(rhs)
+        nm.Initialise(x_start, 0)
+        X, T = nm.DormandPrince(6., rtol=1e-8, atol=1e-10, t_eval=t_eval)
+        np.testing.assert_array_equal(T, t_eval)
+        expected = exact(t_eval, 0.5) if x_start.ndim == 1 else np.stack([exact(t_eval, x1) for x1 in x_start[1]], axis=1)
+        np.testing.assert_allclose(X, expected, rtol=1e-6)
+
+    for t_eval in [[-0.1, 1], [1, 6.5]]:
+        nm = Numerical_methods(rhs)
+        nm.Initialise(np.array([1., 0.5]), 0)
+        with pytest.raises(ValueError):
+            nm.DormandPrince(6., t_eval=t_eval)
+
+
+def test_benchmark_does_not_keep_trajectory():
+    """
+    The integrator benchmarks time the stepping: their peak memory does not grow with the
+    number of steps, and they reach the same final state as the full trajectory
+    """
+    from com3001.benchmarks import IntegratorCase, peak_memory
+    peaks = []
+    for N_iter in [100, 2000]:
+        case = IntegratorCase('SIR', 'RungeKutta2', 1000, N_iter=N_iter)
+        peaks.append(peak_memory(case))
+    assert peaks[1] < 1.5*peaks[0]
+    full = Numerical_methods(f)
+    case.setup()
+    x_start = case.nm.x.copy()
+    case()
+    full.Initialise(x_start, 0)
+    X, T = full.RungeKutta2(case.dt, case.N_iter)
+    np.testing.assert_array_equal(case.nm.x, X[..., -1])
+
+
+def test_stream_file_and_decimate_match_full_trajectory(tmp_path):
+    """
+    Stream, ToFile and decimate give the steps of the full RungeKutta2 trajectory at the same
+    times (for a single state and an ensemble, with chunks not dividing the number of steps),
+    and events are found at the same times when the output is decimated
+    """
+    for x_start in [np.array([1, 1.27e-3, 0]), np.array([[1, 1], [1.27e-3, 1e-2], [0, 0]])]:
+        nm = Numerical_methods(f)
+        nm.Initialise(x_start, 0)
+        X, T = nm.RungeKutta2(0.2, 251)
+        for decimate in [1, 7]:
+            nm.Initialise(x_start, 0)
+            X_d, T_d = nm.RungeKutta2(0.2, 251, decimate=decimate)
+            np.testing.assert_array_equal(X_d, X[..., ::decimate])
+            np.testing.assert_array_equal(T_d, T[::decimate])
+
+            nm.Initialise(x_start, 0)
+            chunks = list(nm.Stream('RungeKutta2', 0.2, 251, chunk_size=16, decimate=decimate))
+            assert all(len(T_chunk) <= 16 for X_chunk, T_chunk in chunks)
+            np.testing.assert_array_equal(np.concatenate([X_chunk for X_chunk, T_chunk in chunks], axis=-1),
+                                          X[..., ::decimate])
+            np.testing.assert_array_equal(np.concatenate([T_chunk for X_chunk, T_chunk in chunks]), T[::decimate])
+
+            nm.Initialise(x_start, 0)
+            path = str(tmp_path/('trajectory_%d_%d.npy' % (np.ndim(x_start), decimate)))
+            X_f, T_f = nm.ToFile(path, 'RungeKutta2', 0.2, 251, chunk_size=16, decimate=decimate)
+            np.testing.assert_array_equal(X_f, X[..., ::decimate])
+            np.testing.assert_array_equal(T_f, T[::decimate])
+            np.testing.assert_array_equal(np.load(path), X[..., ::decimate])
+
+    x_start = np.array([1, 1.27e-6*1000, 0])
+    runs = []
+    for decimate in [1, 7]:
+        nm = Numerical_methods(f)
+        nm.Initialise(x_start, 0)
+        X, T = nm.RungeKutta2(0.2, 1001, decimate=decimate, events=peak_and_half_recovered())
+        assert [len(t) for t in nm.t_events] == [1, 1]
+        assert T[-1] == nm.t == nm.t_events[1][0] and np.array_equal(X[:, -1], nm.x)
+        runs.append((X, T, nm.t_events))
+    (X, T, t_events), (X_d, T_d, t_events_d) = runs
+    np.testing.assert_array_equal(np.concatenate(t_events_d), np.concatenate(t_events))
+    np.testing.assert_array_equal(X_d[:, :-1], X[:, :-1:7])
+    np.testing.assert_array_equal(T_d[:-1], T[:-1:7])
+
+
+def test_cache_keys_ignore_run_state(tmp_path):
+    """
+    The fingerprint of a Numerical_methods (or a MetapopulationSIR) is its configuration and
+    starting state, not the counters, events and workspaces of earlier runs, so the same setup
+    is found in the cache after it was used; a stale entry (its classes gone) is a miss
+    """
+    x_start = np.array([[1, 1], [1.27e-3, 1e-2], [0, 0]])
+    mobility = Mobility.from_dense(np.array([[0, 0.1], [0.2, 0]]))
+    for rhs in [f, MetapopulationSIR(mobility)]:
+        nm = Numerical_methods(rhs)
+        nm.Initialise(x_start, 0)
+        fresh = fingerprint(nm)
+        nm.RungeKutta2(0.2, 101, events=[Event(lambda x, t: x[2]-0.5, direction=1)])
+        nm.Initialise(x_start, 0)
+        assert fingerprint(nm) == fresh
+        nm.Initialise(x_start, 0.5)
+        assert fingerprint(nm) != fresh
+
+    cache = Cache(str(tmp_path / 'cache'))
+    nm = Numerical_methods(f)
+    results = []
+    for run in range(2):
+        nm.Initialise(x_start, 0)
+        results.append(cache.call(nm.RungeKutta2, 0.2, 101, events=peak_and_half_recovered()))
+        results.append(nm.t_events)
+    assert cache.misses == 1 and cache.hits == 1
+    np.testing.assert_array_equal(results[0][0], results[2][0])
+    np.testing.assert_array_equal(np.concatenate(results[1]), np.concatenate(results[3]))
+
+    for stale in [b'ccom3001.sir\nNoSuchClass\n.', b'cno_such_module\nThing\n.']:
+        with open(cache._path('stale'), 'wb') as file:
+            file.write(stale)
+        assert cache.get('stale', 'missing') == 'missing'